@@ -0,0 +1,54 @@
+import time
+import pickle
+import numpy as np
+from dataclasses import dataclass
+from pika_topic.codec import PickleCodec, Pickle5Codec
+from pika_topic.msgtype import message_type, Array
+
+
+@message_type
+@dataclass
+class JointState:
+    stamp: float
+    position: Array(np.float64, 7)
+    velocity: Array(np.float64, 7)
+
+
+def timeit(func, repeat):
+    func()  # warm up
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - t0) / repeat
+
+
+def bench(codec, obj, repeat):
+    body = codec.encode(obj)
+    t_enc = timeit(lambda: codec.encode(obj), repeat)
+    t_dec = timeit(lambda: codec.decode(body), repeat)
+    return t_enc, t_dec, len(body)
+
+
+sizes = [1 << 10, 64 << 10, 1 << 20, 10 << 20, 50 << 20]
+codecs = [
+    ("pickle", PickleCodec(pickle.DEFAULT_PROTOCOL)),
+    ("pickle5", Pickle5Codec()),
+]
+
+print("{:>10s} {:>8s} {:>12s} {:>12s} {:>12s}".format("size", "codec", "encode(ms)", "decode(ms)", "MB/s(e+d)"))
+for size in sizes:
+    frame = {"stamp": time.time(), "image": np.random.randint(0, 255, size, dtype=np.uint8)}
+    repeat = max(3, min(1000, (100 << 20) // size))
+    for name, codec in codecs:
+        t_enc, t_dec, nbytes = bench(codec, frame, repeat)
+        print("{:>10d} {:>8s} {:>12.4f} {:>12.4f} {:>12.1f}".format(
+            size, name, t_enc*1e3, t_dec*1e3, nbytes / (t_enc + t_dec) / 1e6))
+
+# small high-rate messages
+state = JointState(time.time(), np.zeros(7), np.zeros(7))
+print("{:>10s} {:>8s} {:>12s} {:>12s} {:>12s}".format("message", "codec", "encode(us)", "decode(us)", "bytes"))
+for name, codec in codecs + [("struct", JointState.codec)]:
+    t_enc, t_dec, nbytes = bench(codec, state, 10000)
+    print("{:>10s} {:>8s} {:>12.2f} {:>12.2f} {:>12d}".format("joints", name, t_enc*1e6, t_dec*1e6, nbytes))
+
+# run this with: python -m examples.benchmark_codec
@@ -0,0 +1,36 @@
+import asyncio
+import numpy as np
+from pika_topic import AsyncPublisher, AsyncSubscriber
+from pika_topic.aio import connect
+
+
+async def publish(publisher: AsyncPublisher, hz: float):
+    frame_id = 0
+    while True:
+        await publisher.publish([f"frame {frame_id} of {publisher.topic}:", np.random.rand(3)])
+        frame_id += 1
+        await asyncio.sleep(1.0 / hz)
+
+
+async def listen(subscriber: AsyncSubscriber, topic: str):
+    async for msg in subscriber.messages(topic):
+        print(topic, "receives:", msg)
+
+
+async def main():
+    conn = await connect()  # one connection shared by all the topics
+    topics = ["demo_async_topic_{}".format(i) for i in range(3)]
+    publishers = [AsyncPublisher(t, conn) for t in topics]
+    subscriber = AsyncSubscriber(conn)
+    for t in topics:
+        await subscriber.subscribe(t, queue_size=1)
+    
+    await asyncio.gather(
+        *[publish(p, 10) for p in publishers],
+        *[listen(subscriber, t) for t in topics]
+    )
+
+
+asyncio.run(main())
+
+# run this with: python -m examples.demo_asyncio
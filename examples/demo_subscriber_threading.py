@@ -1,12 +1,10 @@
 import time
-from pprint import pprint
 from pika_topic import ThreadedDataGetter
 
 
 data_getter = ThreadedDataGetter()
-q0 = data_getter.subscribe("demo_topic_0")
-q1 = data_getter.subscribe("demo_topic_0")
-q2 = data_getter.subscribe("demo_topic_1")
+data_getter.subscribe("demo_topic_0")
+data_getter.subscribe("demo_topic_1")
 data_getter.start()
 
 t0 = time.time()
@@ -14,14 +12,18 @@ while True:
     t1 = time.time()
     dt = t1 - t0
     
-    # Don't support runtime unsubscribe !!!!
-    # if dt > 5 and q0 is not None:
-    #     data_getter.unsubscribe_queue(q0)
-    #     q0 = None
+    if dt > 5 and "demo_topic_1" in data_getter.data():
+        # runtime unsubscribe is executed on the background thread
+        print("[INFO] Unsubscribe topic: demo_topic_1")
+        data_getter.unsubscribe_topic("demo_topic_1")
     
     if dt > 10:
         break
     
-    data = data_getter.data()
-    pprint(data)
+    # block until a new message of demo_topic_0 arrives
+    sample = data_getter.wait_for_new("demo_topic_0", timeout=1.0)
+    if sample is not None:
+        print("[INFO] seq: {}, stamp: {:.3f}, data: {}".format(*sample))
+    print("[INFO] latest:", data_getter.data())
 
+data_getter.stop()
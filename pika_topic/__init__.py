@@ -1,3 +1,8 @@
 from .pub import Publisher
-from .sub import Subscriber, SingleSubscriber, ThreadedDataGetter
+from .sub import Subscriber, SingleSubscriber, ThreadedDataGetter, ClusterSubscriber
 from .rate import Rate
+from .timer import TimerExecutor
+from .aio import AsyncPublisher, AsyncSubscriber
+from .manager import ConnectionManager
+from .cluster import BrokerCluster
+from .msgtype import message_type, Array
@@ -1,27 +1,89 @@
 import re
 import json
+import time
+import itertools
 import requests
+from typing import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from .namespace import NAMESPACE_EXCHANGE
 
 
-def fetch_all_exchanges(host_port: str, username: str, passwd: str):
+_POLL_INTERVAL = 0.001
+
+
+def iter_exchange_pages(host_port: str, username: str, passwd: str, name_pattern: str = None,
+                        page_size: int = 500, session: requests.Session = None):
+    """Yield the exchanges of the management API page by page.
+
+    Exchanges are sorted by name and, if name_pattern is given, filtered by the
+    server (regular expression), so only one page is held in memory at a time.
+    Servers without pagination return everything as one page.
+    """
     url = f"http://{host_port}/api/exchanges"
-    response = requests.get(url, auth=(username, passwd))
-    if response.text:
+    session = requests.Session() if session is None else session
+    params = {
+        "page_size": page_size,
+        "sort": "name",
+        "columns": "name,vhost,type,durable,auto_delete,internal,user_who_performed_action",
+    }
+    if name_pattern:
+        params["name"] = name_pattern
+        params["use_regex"] = "true"
+    for page in itertools.count(1):
+        params["page"] = page
+        response = session.get(url, params=params, auth=(username, passwd))
+        if not response.text:
+            return
         ret = json.loads(response.text)
-        if not isinstance(ret, list):
+        if isinstance(ret, list):
+            # no pagination support
+            yield ret
+            return
+        if "items" not in ret:
             print(ret)
             print("Error when fetching exchanges.")
-    else:
-        ret = []
-    return ret
+            return
+        yield ret["items"]
+        if page >= ret.get("page_count", 0):
+            return
+
+
+def fetch_all_exchanges(host_port: str, username: str, passwd: str, name_pattern: str = None,
+                        page_size: int = 500):
+    return [e for page in iter_exchange_pages(host_port, username, passwd, name_pattern, page_size)
+            for e in page]
+
 
+def fetch_cluster_exchanges(host_ports: dict, username: str, passwd: str, name_pattern: str = None,
+                            page_size: int = 500) -> list:
+    """fetch_all_exchanges of several brokers concurrently.
 
-def find_matches(filters: list, candidates: list):
+    Args:
+        host_ports (dict): {broker name: "host:port" of its management API}, see cluster.BrokerCluster
+
+    Returns:
+        exchanges (list): exchanges of all the brokers, with the broker name under "node"
+    """
+    def fetch(item):
+        node, host_port = item
+        exchanges = fetch_all_exchanges(host_port, username, passwd, name_pattern, page_size)
+        for exchange in exchanges:
+            exchange["node"] = node
+        return exchanges
+
+    with ThreadPoolExecutor(max(len(host_ports), 1)) as pool:
+        return [e for exchanges in pool.map(fetch, host_ports.items()) for e in exchanges]
+
+
+def find_matches(filters: list, candidates: list, skip_namespace: bool = True):
     matches = []
     for exchange in candidates:
         if exchange["user_who_performed_action"] == "rmq-internal":
             # skip internal exchanges owned by rabbitmq
             continue
+        if skip_namespace and exchange["name"] == NAMESPACE_EXCHANGE:
+            # shared by all the hierarchical topics, it is not a topic itself
+            continue
         
         for f in filters:
             if not f(exchange):
@@ -32,6 +94,87 @@ def find_matches(filters: list, candidates: list):
     return matches
 
 
+def iter_matches(filters: list, pages: Iterable[list], skip_namespace: bool = True):
+    """Streaming find_matches over the pages of iter_exchange_pages."""
+    for page in pages:
+        yield from find_matches(filters, page, skip_namespace)
+
+
+def delete_exchanges(connection, names: Iterable[str], batch_size: int = 100, n_channels: int = 4,
+                     progress: Callable = None) -> int:
+    """Delete exchanges in pipelined batches over several channels.
+
+    In each batch, all but the last Exchange.Delete are sent without waiting for
+    the reply (nowait), the last one waits, which confirms the whole batch since
+    a channel handles its commands in order. Every channel keeps one batch in
+    flight, so deleting N exchanges costs about N / (batch_size * n_channels)
+    round trips instead of N.
+
+    Args:
+        connection (pika.BlockingConnection): connection to the vhost of the exchanges
+        names (Iterable[str]): exchange names, consumed lazily
+        batch_size (int, optional): exchanges per batch
+        n_channels (int, optional): number of channels deleting in parallel
+        progress (Callable, optional): called as progress(n_deleted) after each batch
+
+    Returns:
+        n_deleted (int): number of deleted exchanges
+    """
+    names = iter(names)
+    channels = [connection.channel() for _ in range(n_channels)]
+    in_flight = dict()  # channel index -> batch size
+    deleted = [0]
+
+    def send(index: int):
+        batch = list(itertools.islice(names, batch_size))
+        if not batch:
+            return
+        impl = channels[index]._impl
+        for name in batch[:-1]:
+            # without callback pika sends Exchange.Delete with nowait
+            impl.exchange_delete(name)
+        impl.exchange_delete(batch[-1], callback=lambda frame: on_batch_done(index))
+        in_flight[index] = len(batch)
+
+    def on_batch_done(index: int):
+        deleted[0] += in_flight.pop(index)
+        if progress is not None:
+            progress(deleted[0])
+        send(index)
+
+    for i in range(n_channels):
+        send(i)
+    while in_flight:
+        # the replies go to callbacks of the channel implementations, which do not
+        # end process_data_events early, poll in short slices
+        connection.process_data_events(time_limit=_POLL_INTERVAL)
+        for i in list(in_flight):
+            if not channels[i].is_open:
+                print("[WARN] Channel closed by the broker, {} exchanges may not be deleted."
+                      .format(in_flight.pop(i)))
+    for channel in channels:
+        if channel.is_open:
+            channel.close()
+    return deleted[0]
+
+
+class Progress(object):
+    """Print "[INFO] Deleted n/total" at most every `interval` seconds."""
+    def __init__(self, total: int = None, interval: float = 1.0):
+        self.total = total
+        self.interval = interval
+        self.t0 = time.perf_counter()
+        self.last = None
+
+    def __call__(self, n: int, force: bool = False):
+        now = time.perf_counter()
+        if not force and self.last is not None and now - self.last < self.interval:
+            return
+        self.last = now
+        total = "" if self.total is None else "/{}".format(self.total)
+        print("[INFO] Deleted {}{} exchanges ({:.1f}/s)".format(n, total, n / max(now - self.t0, 1e-9)))
+
+
 def parse_flag(flag: str = None):
     if isinstance(flag, int):
         return flag
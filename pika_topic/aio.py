@@ -0,0 +1,397 @@
+import time
+import pika
+import asyncio
+from collections import deque
+from pika.adapters.asyncio_connection import AsyncioConnection
+from .codec import Codec
+from .message import MessageEncoder, MessageDecoder
+
+
+def _callback_future(loop: asyncio.AbstractEventLoop):
+    """Create a future and a pika style callback which resolves it with its first argument."""
+    future = loop.create_future()
+
+    def callback(*args):
+        if not future.done():
+            future.set_result(args[0] if args else None)
+    return future, callback
+
+
+async def connect(parameters: pika.ConnectionParameters = None) -> AsyncioConnection:
+    """Open an AsyncioConnection on the running event loop.
+
+    One connection can be shared by many AsyncPublisher and AsyncSubscriber,
+    each of them opens its own channel on it.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def on_open(connection):
+        if not future.done():
+            future.set_result(connection)
+
+    def on_error(connection, error):
+        if not future.done():
+            future.set_exception(error if isinstance(error, BaseException)
+                                 else pika.exceptions.AMQPConnectionError(error))
+
+    AsyncioConnection(
+        parameters,
+        on_open_callback=on_open,
+        on_open_error_callback=on_error,
+        custom_ioloop=loop
+    )
+    return await future
+
+
+async def _open_channel(connection: AsyncioConnection):
+    future, callback = _callback_future(asyncio.get_running_loop())
+    connection.channel(on_open_callback=callback)
+    return await future
+
+
+class AsyncPublisher(object):
+    def __init__(
+        self,
+        topic: str,
+        conn: AsyncioConnection = None,
+        codec: Codec = None,
+        max_inflight: int = 256,
+        **encoder_kwargs
+    ):
+        """Publish messages to a topic from asyncio code.
+
+        The channel runs in confirm mode, at most `max_inflight` messages can be
+        unconfirmed by the broker, further publish() calls wait for confirms.
+        publish() also waits while the broker blocks the connection (resource alarms).
+
+        Args:
+            topic (str): topic name
+            conn (AsyncioConnection, optional): connection opened by `connect()`,
+                a new local connection is opened if None
+            codec (Codec, optional): see Publisher
+            max_inflight (int, optional): max number of unconfirmed messages
+            encoder_kwargs: shm_slots, shm_slot_size, shm_threshold, compression, 
+                compress_threshold, compress_min_ratio, chunk_size, see Publisher
+        """
+        self.topic = topic
+        self.connection = conn
+        self.channel = None
+        self.encoder = MessageEncoder(codec, **encoder_kwargs)
+        self.max_inflight = max_inflight
+        self.nacked = 0
+        self.error = None  # why the channel closed, raised by publish() and flush()
+
+        self._open_lock = None
+        self._inflight = None
+        self._unconfirmed = deque()
+        self._delivery_tag = 0
+        self._unblocked = None
+        self._drained = None
+
+    async def open(self):
+        """Open channel and declare the exchange, called by publish() if needed."""
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self.channel is not None:
+                return
+            loop = asyncio.get_running_loop()
+            if self.connection is None:
+                self.connection = await connect()
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+            self._unblocked = asyncio.Event()
+            self._unblocked.set()
+            self._drained = asyncio.Event()
+            self._drained.set()
+            self.connection.add_on_connection_blocked_callback(lambda *_: self._unblocked.clear())
+            self.connection.add_on_connection_unblocked_callback(lambda *_: self._unblocked.set())
+
+            channel = await _open_channel(self.connection)
+            future, callback = _callback_future(loop)
+            channel.exchange_declare(self.topic, exchange_type="fanout", auto_delete=False,
+                                     callback=callback)
+            await future
+            future, callback = _callback_future(loop)
+            channel.confirm_delivery(ack_nack_callback=self._on_confirm, callback=callback)
+            await future
+            channel.add_on_close_callback(self._on_channel_closed)
+            self.channel = channel
+
+    def _on_confirm(self, method_frame):
+        method = method_frame.method
+        tag = method.delivery_tag
+        settled = 0
+        if method.multiple:
+            while self._unconfirmed and self._unconfirmed[0] <= tag:
+                self._unconfirmed.popleft()
+                settled += 1
+        elif tag in self._unconfirmed:
+            self._unconfirmed.remove(tag)
+            settled = 1
+        if isinstance(method, pika.spec.Basic.Nack):
+            self.nacked += settled
+        for _ in range(settled):
+            self._inflight.release()
+        if not self._unconfirmed:
+            self._drained.set()
+
+    def _on_channel_closed(self, channel, reason):
+        """Also called when the connection closes, wakes up every waiting publish() and flush()."""
+        if self.error is None:
+            self.error = reason if isinstance(reason, BaseException) else pika.exceptions.ChannelClosed(0, str(reason))
+        self._unblocked.set()
+        self._drained.set()
+        for _ in range(self.max_inflight):
+            self._inflight.release()
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+    async def publish(self, obj):
+        """Publish obj, waits for room in the confirm window.
+
+        With chunk_size, every chunk of a large message takes a place in the window.
+
+        Raises:
+            pika.exceptions.ChannelClosed or ConnectionClosed: the channel closed, 
+                also while waiting (see .error)
+        """
+        if self.channel is None:
+            await self.open()
+        self._check()
+        bdata, properties = self.encoder.encode(obj)
+        for chunk, chunk_properties in self.encoder.split(bdata, properties):
+            await self._publish_one(*self.encoder.compress(chunk, chunk_properties))
+
+    async def _publish_one(self, bdata: bytes, properties: pika.BasicProperties):
+        await self._unblocked.wait()
+        await self._inflight.acquire()
+        self._check()
+        self.channel.basic_publish(
+            exchange=self.topic,
+            routing_key="",
+            body=bdata,
+            properties=properties
+        )
+        self._delivery_tag += 1
+        self._unconfirmed.append(self._delivery_tag)
+        self._drained.clear()
+
+    async def flush(self):
+        """Wait until all published messages are confirmed by the broker.
+
+        Raises:
+            pika.exceptions.ChannelClosed or ConnectionClosed: 
+                the channel closed before all the messages were confirmed
+        """
+        if self._drained is not None:
+            await self._drained.wait()
+            if self._unconfirmed:
+                self._check()
+
+    async def close(self):
+        if self.channel is not None:
+            if self.error is None:
+                await self.flush()
+                self.channel.close()
+            self.channel = None
+        self.encoder.close()
+
+
+class _Inbox(object):
+    """Local buffer of one queue, keeps at most `maxlen` messages like the broker queue."""
+    def __init__(self, maxlen: int = None):
+        self.messages = deque(maxlen=maxlen)
+        self.event = asyncio.Event()
+        self.closed = False
+
+    def put(self, data):
+        self.messages.append(data)
+        self.event.set()
+
+    def close(self):
+        """Wake up the waiting get() calls, which raise EOFError."""
+        self.closed = True
+        self.event.set()
+
+    async def get(self):
+        while not self.messages:
+            if self.closed:
+                raise EOFError("unsubscribed")
+            self.event.clear()
+            await self.event.wait()
+        return self.messages.popleft()
+
+
+class AsyncSubscriber(object):
+    def __init__(self, conn: AsyncioConnection = None):
+        """Subscribe to topics from asyncio code.
+
+        Every topic is consumed with one exclusive queue on a single channel,
+        messages are pushed by the broker into local buffers, so hundreds of topics
+        can be served by one event loop.
+
+        Example:
+            sub = AsyncSubscriber(await connect())
+            async for msg in sub.messages("demo_topic_0"):
+                print(msg)
+
+        Args:
+            conn (AsyncioConnection, optional): connection opened by `connect()`,
+                a new local connection is opened if None
+        """
+        self.connection = conn
+        self.channel = None
+        self.decoder = MessageDecoder()
+        self._expiry_timer = None  # drops the timed out chunked messages while some are incomplete
+        self.queue_names = dict()  # topic -> queue_name
+        self._inboxes = dict()  # queue_name -> _Inbox
+        self._consumer_tags = dict()  # queue_name -> consumer tag
+        self._subscribing = dict()  # topic -> future of the queue name, while subscribe() runs
+        self._open_lock = None
+
+    async def open(self):
+        if self._open_lock is None:
+            self._open_lock = asyncio.Lock()
+        async with self._open_lock:
+            if self.channel is not None:
+                return
+            if self.connection is None:
+                self.connection = await connect()
+            self.channel = await _open_channel(self.connection)
+
+    def _on_message(self, queue_name: str, channel, method, properties, body):
+        inbox = self._inboxes.get(queue_name)
+        if inbox is None:
+            return
+        for data in self.decoder.decode(queue_name, properties, body):
+            inbox.put(data)
+        if self._expiry_timer is None and self.decoder.chunks.partials:
+            self._expiry_timer = asyncio.get_running_loop().call_later(
+                self.decoder.chunks.timeout, self._expire_chunks)
+
+    def _expire_chunks(self):
+        deadline = self.decoder.chunks.expire()
+        if deadline == float("inf"):
+            self._expiry_timer = None
+        else:
+            self._expiry_timer = asyncio.get_running_loop().call_later(
+                max(deadline - time.monotonic(), 0.0), self._expire_chunks)
+
+    async def subscribe(self, topic: str, queue_size: int = -1, shm: bool = False) -> str:
+        """Subscribe to topic, subscribing the same topic again returns the existing queue.
+
+        Args:
+            topic (str): topic name
+            queue_size (int, optional):
+                queue size, set to -1 to use the default,
+                set to 1 to keep only the latest message
+            shm (bool, optional): accept messages sent through shared memory
+
+        Returns:
+            queue_name (str): the auto generated queue name
+        """
+        if topic in self.queue_names:
+            return self.queue_names[topic]
+        pending = self._subscribing.get(topic)
+        if pending is not None:
+            # concurrent calls share the queue of the first one
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._subscribing[topic] = future
+        try:
+            queue_name = await self._subscribe(topic, queue_size, shm)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # retrieved, even if no other call waits for it
+            future.exception()
+            raise
+        else:
+            future.set_result(queue_name)
+            return queue_name
+        finally:
+            del self._subscribing[topic]
+
+    async def _subscribe(self, topic: str, queue_size: int, shm: bool) -> str:
+        if self.channel is None:
+            await self.open()
+
+        loop = asyncio.get_running_loop()
+        if queue_size is not None and queue_size > 0:
+            arguments = {"x-max-length": queue_size}
+            maxlen = queue_size
+        else:
+            arguments = None
+            maxlen = None
+
+        future, callback = _callback_future(loop)
+        self.channel.exchange_declare(topic, exchange_type="fanout", auto_delete=False,
+                                      callback=callback)
+        await future
+        future, callback = _callback_future(loop)
+        self.channel.queue_declare(queue="", exclusive=True, auto_delete=True,
+                                   arguments=arguments, callback=callback)
+        queue_name = (await future).method.queue
+        future, callback = _callback_future(loop)
+        self.channel.queue_bind(queue=queue_name, exchange=topic, callback=callback)
+        await future
+
+        if shm:
+            self.decoder.shm_queues.add(queue_name)
+        self._inboxes[queue_name] = _Inbox(maxlen)
+        self._consumer_tags[queue_name] = self.channel.basic_consume(
+            queue=queue_name,
+            on_message_callback=lambda *args: self._on_message(queue_name, *args),
+            auto_ack=True
+        )
+        self.queue_names[topic] = queue_name
+        return queue_name
+
+    async def unsubscribe(self, topic: str):
+        queue_name = self.queue_names.pop(topic, None)
+        if queue_name is None:
+            return False
+        self.channel.basic_cancel(self._consumer_tags.pop(queue_name))
+        self._inboxes.pop(queue_name).close()
+        self.decoder.forget(queue_name)
+        return True
+
+    async def get(self, topic: str, timeout: float = None):
+        """Wait for the next message of topic, subscribes the topic if needed.
+
+        Raises:
+            asyncio.TimeoutError: no message arrives within timeout
+            EOFError: the topic was unsubscribed (or the subscriber closed) while waiting
+        """
+        queue_name = await self.subscribe(topic)
+        return await asyncio.wait_for(self._inboxes[queue_name].get(), timeout)
+
+    async def messages(self, topic: str):
+        """Async iterator over messages of topic, subscribes the topic if needed.
+
+        Ends when the topic is unsubscribed.
+        """
+        queue_name = await self.subscribe(topic)
+        inbox = self._inboxes[queue_name]
+        while True:
+            try:
+                yield await inbox.get()
+            except EOFError:
+                return
+
+    async def close(self):
+        if self._expiry_timer is not None:
+            self._expiry_timer.cancel()
+            self._expiry_timer = None
+        for inbox in self._inboxes.values():
+            inbox.close()
+        self._inboxes.clear()
+        self.queue_names.clear()
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
@@ -0,0 +1,265 @@
+import os
+import json
+import base64
+import decimal
+import datetime
+import mmap
+import struct
+import numpy as np
+import pika
+from typing import List
+
+
+MAGIC = b"PKTBAG01"
+# per record: topic id, receive time, properties length, body length
+_RECORD = struct.Struct("<HdII")
+INDEX_DTYPE = np.dtype([("topic", "<u2"), ("stamp", "<f8"), ("offset", "<u8")])
+META_FILE = "meta.json"
+
+
+def _segment_name(index: int) -> str:
+    return "seg-{:05d}.dat".format(index)
+
+
+def _encode_value(value):
+    # header values of AMQP field types without a JSON type, tagged
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {"$bytes": base64.b64encode(bytes(value)).decode()}
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {"$decimal": str(value)}
+    raise TypeError("Header value of type {} can not be recorded".format(type(value).__name__))
+
+
+def _decode_value(obj: dict):
+    if len(obj) == 1:
+        if "$bytes" in obj:
+            return base64.b64decode(obj["$bytes"])
+        if "$datetime" in obj:
+            return datetime.datetime.fromisoformat(obj["$datetime"])
+        if "$decimal" in obj:
+            return decimal.Decimal(obj["$decimal"])
+    return obj
+
+
+def properties_to_bytes(properties: pika.BasicProperties) -> bytes:
+    """The properties needed to decode the body again, as JSON.
+
+    Header values that JSON has no type for (bytes, datetime, Decimal) are
+    written as {"$bytes": base64}, {"$datetime": iso} and {"$decimal": str}.
+    """
+    props = {}
+    if properties.content_type is not None:
+        props["content_type"] = properties.content_type
+    if properties.content_encoding is not None:
+        props["content_encoding"] = properties.content_encoding
+    if properties.headers:
+        props["headers"] = properties.headers
+    return json.dumps(props, separators=(",", ":"), default=_encode_value).encode() if props else b""
+
+
+def properties_from_bytes(data) -> pika.BasicProperties:
+    if not len(data):
+        return pika.BasicProperties()
+    return pika.BasicProperties(**json.loads(bytes(data), object_hook=_decode_value))
+
+
+class BagWriter(object):
+    def __init__(self, path: str, topics: List[str], segment_size: int = 1 << 30, buffer_size: int = 8 << 20):
+        """Append raw messages to a bag directory, see pika_topic.record.
+
+        A bag is a directory of append-only segment files of records
+        [header][properties][body], a time index per segment (numpy structured
+        array saved when the segment is closed) and meta.json with the topic names.
+        Segments without index (e.g. after a crash) are indexed by BagReader.
+        Topics can be added while recording with add_topic.
+
+        Not thread-safe, use it from one writer thread.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.topics = list(topics)
+        self._topic_ids = {t: i for i, t in enumerate(self.topics)}
+        self.segment_size = segment_size
+        self.buffer_size = buffer_size
+        self.segments = []
+        self.counts = [0] * len(self.topics)
+        self.hierarchical = []  # topics of the shared namespace, see Publisher
+        self.bytes = 0
+        self.start = None
+        self.end = None
+        self._file = None
+        self._offset = 0
+        self._index = []  # (topic, stamp, offset) of the current segment
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {
+            "version": 1,
+            "topics": self.topics,
+            "hierarchical": self.hierarchical,
+            "counts": self.counts,
+            "segments": self.segments,
+            "start": self.start,
+            "end": self.end,
+        }
+        tmp = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f, indent=1)
+        os.replace(tmp, os.path.join(self.path, META_FILE))
+
+    def add_topic(self, topic: str, hierarchical: bool = False) -> int:
+        """Add a topic discovered while recording, returns its id."""
+        self._topic_ids[topic] = len(self.topics)
+        self.topics.append(topic)
+        self.counts.append(0)
+        if hierarchical:
+            self.hierarchical.append(topic)
+        self._write_meta()
+        return self._topic_ids[topic]
+
+    def _open_segment(self):
+        name = _segment_name(len(self.segments))
+        self._file = open(os.path.join(self.path, name), "wb", buffering=self.buffer_size)
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+        self._index = []
+        self.segments.append(name)
+        self._write_meta()
+
+    def _close_segment(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        index = np.array(self._index, dtype=INDEX_DTYPE)
+        np.save(os.path.join(self.path, self.segments[-1][:-4] + ".idx.npy"), index)
+        self._write_meta()
+
+    def write(self, topic: str, stamp: float, properties: pika.BasicProperties, body):
+        if self._file is None or self._offset >= self.segment_size:
+            self._close_segment()
+            self._open_segment()
+        topic_id = self._topic_ids[topic]
+        props = properties_to_bytes(properties)
+        f = self._file
+        f.write(_RECORD.pack(topic_id, stamp, len(props), len(body)))
+        f.write(props)
+        f.write(body)
+        self._index.append((topic_id, stamp, self._offset))
+        self._offset += _RECORD.size + len(props) + len(body)
+        self.counts[topic_id] += 1
+        self.bytes += len(body)
+        if self.start is None:
+            self.start = stamp
+        self.end = stamp
+
+    def close(self):
+        self._close_segment()
+        self._write_meta()
+
+
+class BagReader(object):
+    def __init__(self, path: str):
+        """Memory-map the segments of a bag written by BagWriter and index them by time.
+
+        Example:
+            bag = BagReader("bag-20240101-120000")
+            for topic, stamp, properties, body in bag.messages(start=bag.start + 10):
+                ...
+        """
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        self.topics = meta["topics"]
+        self.hierarchical = set(meta.get("hierarchical", []))
+        self._files = []
+        self._maps = []
+        index = []
+        for segment, name in enumerate(meta["segments"]):
+            seg_path = os.path.join(path, name)
+            if os.path.getsize(seg_path) <= len(MAGIC):
+                continue
+            f = open(seg_path, "rb")
+            m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._files.append(f)
+            self._maps.append(m)
+            idx_path = os.path.join(path, name[:-4] + ".idx.npy")
+            if os.path.exists(idx_path):
+                seg_index = np.load(idx_path)
+            else:
+                seg_index = self._scan(m)
+            entries = np.empty(len(seg_index), dtype=INDEX_DTYPE.descr + [("segment", "<u4")])
+            for field in INDEX_DTYPE.names:
+                entries[field] = seg_index[field]
+            entries["segment"] = len(self._maps) - 1
+            index.append(entries)
+        if index:
+            index = np.concatenate(index)
+            # stable, so messages of one topic keep their arrival order
+            index = index[np.argsort(index["stamp"], kind="stable")]
+        else:
+            index = np.empty(0, dtype=INDEX_DTYPE.descr + [("segment", "<u4")])
+        # per topic time index, seek with np.searchsorted
+        self.index = index
+        self.topic_index = {t: index[index["topic"] == i] for i, t in enumerate(self.topics)}
+        self.start = float(index["stamp"][0]) if len(index) else None
+        self.end = float(index["stamp"][-1]) if len(index) else None
+
+    @staticmethod
+    def _scan(m: mmap.mmap) -> np.ndarray:
+        """Index a segment without index file, a truncated last record is ignored."""
+        entries = []
+        offset = len(MAGIC)
+        size = len(m)
+        while offset + _RECORD.size <= size:
+            topic, stamp, props_len, body_len = _RECORD.unpack_from(m, offset)
+            end = offset + _RECORD.size + props_len + body_len
+            if end > size:
+                break
+            entries.append((topic, stamp, offset))
+            offset = end
+        return np.array(entries, dtype=INDEX_DTYPE)
+
+    def count(self, topic: str = None) -> int:
+        return len(self.index) if topic is None else len(self.topic_index[topic])
+
+    def read(self, segment: int, offset: int):
+        """(properties, body) of the record at offset, body is a memoryview into the mapped file."""
+        m = self._maps[segment]
+        _, _, props_len, body_len = _RECORD.unpack_from(m, offset)
+        start = offset + _RECORD.size
+        view = memoryview(m)
+        properties = properties_from_bytes(view[start:start + props_len])
+        return properties, view[start + props_len:start + props_len + body_len]
+
+    def seek(self, stamp: float, topic: str = None) -> int:
+        """Position of the first message at or after stamp, in the global or topic index."""
+        index = self.index if topic is None else self.topic_index[topic]
+        return int(np.searchsorted(index["stamp"], stamp, side="left"))
+
+    def messages(self, topics: List[str] = None, start: float = None, end: float = None):
+        """Yield (topic, stamp, properties, body) in time order, between start and end (receive times)."""
+        index = self.index
+        lo = 0 if start is None else self.seek(start)
+        hi = len(index) if end is None else int(np.searchsorted(index["stamp"], end, side="right"))
+        index = index[lo:hi]
+        if topics is not None:
+            ids = [self.topics.index(t) for t in topics]
+            index = index[np.isin(index["topic"], ids)]
+        for entry in index:
+            properties, body = self.read(int(entry["segment"]), int(entry["offset"]))
+            yield self.topics[entry["topic"]], float(entry["stamp"]), properties, body
+
+    def close(self):
+        for m in self._maps:
+            try:
+                m.close()
+            except BufferError:
+                # a body view is still referenced, released with the map
+                pass
+        for f in self._files:
+            f.close()
+        self._maps = []
+        self._files = []
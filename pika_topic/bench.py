@@ -0,0 +1,325 @@
+import sys
+import json
+import time
+import uuid
+import pika
+import argparse
+import platform
+import itertools
+import threading
+import subprocess
+import numpy as np
+from .rate import Rate
+from .pub import Publisher
+from .sub import Subscriber, SingleSubscriber
+from .stats import LatencyHistogram
+from .testing import LocalBroker
+
+
+MODES = ("spin", "get", "push_get", "single")
+PAYLOADS = ("bytes", "dict", "numpy")
+
+
+def parse_size(text: str) -> int:
+    """"100", "64k", "1M" -> number of bytes."""
+    text = text.strip()
+    units = {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30}
+    if text[-1].lower() in units:
+        return int(float(text[:-1]) * units[text[-1].lower()])
+    return int(text)
+
+
+def parse_list(text: str, convert=str) -> list:
+    return [convert(t) for t in text.split(",") if t.strip()]
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description="Throughput and latency benchmark of pika_topic.")
+    default_param = pika.ConnectionParameters
+    parser.add_argument("-b", "--broker", type=str, default="local", choices=["local", "rabbitmq"],
+                        help="local runs an in-process stand-in broker (no server needed), "
+                            "rabbitmq connects to a RabbitMQ server, default is local")
+    parser.add_argument("-ip", "--ip", type=str, default=default_param.DEFAULT_HOST,
+                        help=f"address of rabbitmq-server, default is {default_param.DEFAULT_HOST}")
+    parser.add_argument("-pp", "--pika_port", type=int, default=default_param.DEFAULT_PORT,
+                        help=f"port of rabbitmq-server, default is {default_param.DEFAULT_PORT}")
+    default_auth = "@".join([default_param.DEFAULT_USERNAME, default_param.DEFAULT_PASSWORD])
+    parser.add_argument("-a", "--auth", type=str, default=default_auth,
+                        help=f"auth to establish connection to host, format is username@passwd, default is {default_auth}")
+    parser.add_argument("--sizes", type=str, default="100,10k,1M",
+                        help="comma separated payload sizes, e.g. 100,64k,1M,50M, default is 100,10k,1M")
+    parser.add_argument("--payloads", type=str, default=",".join(PAYLOADS),
+                        help="comma separated payload types among {}".format(",".join(PAYLOADS)))
+    parser.add_argument("--publishers", type=str, default="1", help="comma separated publisher counts")
+    parser.add_argument("--subscribers", type=str, default="1,4", help="comma separated subscriber counts")
+    parser.add_argument("--queue_sizes", type=str, default="-1", help="comma separated queue_size values")
+    parser.add_argument("--modes", type=str, default=",".join(MODES),
+                        help="comma separated consume modes among {}".format(",".join(MODES)))
+    parser.add_argument("--count", type=int, default=0,
+                        help="messages per publisher, default (0) derives it from --budget_mb")
+    parser.add_argument("--budget_mb", type=float, default=256,
+                        help="payload MB per publisher when --count is 0, default is 256")
+    parser.add_argument("--max_count", type=int, default=10000,
+                        help="max messages per publisher when --count is 0, default is 10000")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="messages/s of each publisher, 0 publishes as fast as possible")
+    parser.add_argument("--poll_interval", type=float, default=1e-4,
+                        help="sleep in seconds of get() modes when no message is ready, default is 1e-4")
+    parser.add_argument("--idle_timeout", type=float, default=2.0,
+                        help="end a case when no message arrived for this many seconds, default is 2")
+    parser.add_argument("-o", "--output", type=str, default="",
+                        help="write the results as JSON to this file")
+    opt = parser.parse_args()
+    return opt
+
+
+def make_payload(kind: str, size: int):
+    """Payload of roughly `size` bytes once serialized."""
+    if kind == "bytes":
+        return bytes(size)
+    elif kind == "dict":
+        # a pickled float costs 9 bytes
+        return {"stamp": time.time(), "id": 0, "values": [0.5] * max(size // 9, 1)}
+    elif kind == "numpy":
+        return np.random.randint(0, 255, size, dtype=np.uint8)
+    raise ValueError("Unknown payload: {}".format(kind))
+
+
+class _Consumer(threading.Thread):
+    def __init__(self, connect, mode: str, topic: str, queue_size: int, expected: int, poll_interval: float):
+        super().__init__(daemon=True)
+        self.connect = connect
+        self.mode = mode
+        self.topic = topic
+        self.queue_size = queue_size
+        self.expected = expected
+        self.poll_interval = poll_interval
+        self.ready = threading.Event()
+        self.stopping = False
+        self.count = 0
+        self.last_t = None
+        self.stats = None
+        self.error = None
+        self.connection = None
+        self.subscriber = None
+
+    def _on_data(self, data):
+        self.count += 1
+        self.last_t = time.perf_counter()
+        if self.count >= self.expected and self.subscriber is not None:
+            self.subscriber.channel.stop_consuming()
+
+    def stop(self):
+        self.stopping = True
+        if self.mode == "spin" and self.connection is not None and self.connection.is_open:
+            self.connection.add_callback_threadsafe(self.subscriber.channel.stop_consuming)
+
+    def run(self):
+        try:
+            self.connection = self.connect()
+            if self.mode == "spin":
+                self._run_spin()
+            elif self.mode == "single":
+                self._run_single()
+            else:
+                self._run_get()
+        except Exception as e:
+            self.error = e
+            self.ready.set()
+        finally:
+            if self.connection is not None and self.connection.is_open:
+                self.connection.close()
+
+    def _run_spin(self):
+        self.subscriber = Subscriber(self.connection, stats=True)
+        queue_name = self.subscriber.subscribe(self.topic, self.queue_size, self._on_data)
+        self.stats = self.subscriber.stats.queues[queue_name]
+        self.ready.set()
+        if not self.stopping:
+            self.subscriber.spin()
+
+    def _poll(self, get):
+        while not self.stopping and self.count < self.expected:
+            ok, _ = get()
+            if ok:
+                self.count += 1
+                self.last_t = time.perf_counter()
+            else:
+                time.sleep(self.poll_interval)
+
+    def _run_get(self):
+        subscriber = Subscriber(self.connection, push_get=self.mode == "push_get", stats=True)
+        queue_name = subscriber.subscribe(self.topic, self.queue_size)
+        self.stats = subscriber.stats.queues[queue_name]
+        self.ready.set()
+
+        def get():
+            ret = subscriber.get(queue_name)
+            return (True, ret[queue_name]) if ret else (False, None)
+        self._poll(get)
+
+    def _run_single(self):
+        subscriber = SingleSubscriber(self.topic, self.queue_size, conn=self.connection, stats=True)
+        self.stats = subscriber.stats
+        self.ready.set()
+        self._poll(subscriber.get)
+
+
+def _publish(connect, topic: str, payload, count: int, rate: float, result: dict):
+    connection = connect()
+    try:
+        publisher = Publisher(topic, connection, instrument=True)
+        r = Rate(rate) if rate > 0 else None
+        t0 = time.perf_counter()
+        for _ in range(count):
+            publisher.publish(payload)
+            if r is not None:
+                r.sleep()
+        result["elapsed"] = time.perf_counter() - t0
+        publisher.close()
+    except Exception as e:
+        result["error"] = e
+    finally:
+        if connection.is_open:
+            connection.close()
+
+
+def run_case(connect, case: dict, opt) -> dict:
+    topic = "pika_topic.bench.{}".format(uuid.uuid4().hex[:8])
+    payload = make_payload(case["payload"], case["size"])
+    count = case["count"]
+    expected = count * case["publishers"]
+
+    consumers = [_Consumer(connect, case["mode"], topic, case["queue_size"], expected, opt.poll_interval)
+                 for _ in range(case["subscribers"])]
+    for c in consumers:
+        c.start()
+    for c in consumers:
+        c.ready.wait()
+        if c.error is not None:
+            raise c.error
+
+    results = [dict() for _ in range(case["publishers"])]
+    publishers = [threading.Thread(target=_publish, args=(connect, topic, payload, count, opt.rate, r), daemon=True)
+                  for r in results]
+    t_start = time.perf_counter()
+    for p in publishers:
+        p.start()
+    for p in publishers:
+        p.join()
+    for r in results:
+        if "error" in r:
+            raise r["error"]
+
+    # wait for the consumers to get everything, or to stop receiving (bounded queues drop)
+    while True:
+        received = sum(c.count for c in consumers)
+        if received >= expected * len(consumers):
+            break
+        time.sleep(0.01)
+        last_t = max([c.last_t or t_start for c in consumers])
+        if time.perf_counter() - last_t > opt.idle_timeout:
+            break
+    for c in consumers:
+        c.stop()
+    for c in consumers:
+        c.join(opt.idle_timeout)
+
+    received = sum(c.count for c in consumers)
+    t_end = max([c.last_t or t_start for c in consumers])
+    elapsed = max(t_end - t_start, 1e-9)
+    latency = LatencyHistogram()
+    nbytes = 0
+    dropped = 0
+    for c in consumers:
+        if c.stats is not None:
+            latency.merge(c.stats.latency)
+            nbytes += c.stats.bytes
+            dropped += c.stats.dropped
+    publish_elapsed = max(r["elapsed"] for r in results)
+
+    result = dict(case)
+    result.update({
+        "messages_sent": expected,
+        "messages_received": received,
+        "messages_dropped": dropped,
+        "elapsed": elapsed,
+        "publish_msgs_per_s": expected / max(publish_elapsed, 1e-9),
+        "msgs_per_s": received / elapsed,
+        "mb_per_s": nbytes / elapsed / 1e6,
+        "latency_mean": latency.sum / latency.total if latency.total else None,
+        "latency_p50": latency.quantile(0.5),
+        "latency_p90": latency.quantile(0.9),
+        "latency_p99": latency.quantile(0.99),
+    })
+    return result
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=__file__.rsplit("/", 2)[0]).decode().strip()
+    except Exception:
+        return None
+
+
+def _fmt_ms(seconds):
+    return "{:>9.3f}".format(seconds * 1e3) if seconds is not None else "{:>9s}".format("-")
+
+
+def main():
+    opt = parse_opt()
+    if opt.broker == "local":
+        broker = LocalBroker()
+        connect = broker.connection
+    else:
+        username, password = opt.auth.strip().split("@")
+        params = pika.ConnectionParameters(host=opt.ip, port=opt.pika_port,
+                                           credentials=pika.PlainCredentials(username, password))
+        connect = lambda: pika.BlockingConnection(params)
+
+    sizes = parse_list(opt.sizes, parse_size)
+    payloads = parse_list(opt.payloads)
+    modes = parse_list(opt.modes)
+    for m in modes:
+        assert m in MODES, "unknown mode: {}".format(m)
+
+    header = "{:>7s} {:>9s} {:>4s} {:>4s} {:>6s} {:>8s} {:>9s} {:>11s} {:>9s} {:>9s} {:>9s} {:>9s}".format(
+        "payload", "size", "pub", "sub", "queue", "mode", "recv", "msgs/s", "MB/s", "p50(ms)", "p99(ms)", "dropped")
+    print(header)
+    results = []
+    for kind, size, n_pub, n_sub, queue_size, mode in itertools.product(
+            payloads, sizes, parse_list(opt.publishers, int), parse_list(opt.subscribers, int),
+            parse_list(opt.queue_sizes, int), modes):
+        count = opt.count or max(5, min(opt.max_count, int(opt.budget_mb * (1 << 20)) // size))
+        case = {"payload": kind, "size": size, "publishers": n_pub, "subscribers": n_sub,
+                "queue_size": queue_size, "mode": mode, "count": count}
+        result = run_case(connect, case, opt)
+        results.append(result)
+        print("{:>7s} {:>9d} {:>4d} {:>4d} {:>6d} {:>8s} {:>9d} {:>11.1f} {:>9.2f} {} {} {:>9d}".format(
+            kind, size, n_pub, n_sub, queue_size, mode, result["messages_received"],
+            result["msgs_per_s"], result["mb_per_s"], _fmt_ms(result["latency_p50"]),
+            _fmt_ms(result["latency_p99"]), result["messages_dropped"]))
+        sys.stdout.flush()
+
+    if opt.output:
+        report = {
+            "meta": {
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "commit": _git_commit(),
+                "python": sys.version,
+                "platform": platform.platform(),
+                "pika": pika.__version__,
+                "numpy": np.__version__,
+                # without the credentials of --auth
+                "options": {k: v for k, v in vars(opt).items() if k != "auth"},
+            },
+            "results": results,
+        }
+        with open(opt.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print("[INFO] Results written to {}".format(opt.output))
+
+
+if __name__ == "__main__":
+    main()
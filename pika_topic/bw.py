@@ -0,0 +1,5 @@
+from .echo import main
+
+
+if __name__ == "__main__":
+    main("bw")
@@ -0,0 +1,153 @@
+import copy
+import time
+import uuid
+import itertools
+import pika
+from .compress import get_compression
+
+
+CHUNK_ID_HEADER = "x-chunk-id"
+CHUNK_INDEX_HEADER = "x-chunk-index"
+# length in bytes of the whole body, as split
+CHUNK_TOTAL_HEADER = "x-chunk-total"
+# length of every chunk but the last one, chunk i starts at i * size
+CHUNK_SIZE_HEADER = "x-chunk-size"
+# content encoding of a body compressed as a whole before being split (e.g. publish_raw)
+CHUNK_ENCODING_HEADER = "x-chunk-encoding"
+
+_CHUNK_HEADERS = (CHUNK_ID_HEADER, CHUNK_INDEX_HEADER, CHUNK_TOTAL_HEADER, CHUNK_SIZE_HEADER,
+                  CHUNK_ENCODING_HEADER)
+
+
+class ChunkSplitter(object):
+    def __init__(self, chunk_size: int):
+        """Split large bodies into chunks (publisher side), see ChunkAssembler.
+
+        Chunks are memoryviews over the body, nothing is copied. Every chunk
+        carries the properties of the message plus the message id, its index,
+        the total length and the chunk size in headers.
+        """
+        assert chunk_size > 0, "chunk_size should be > 0"
+        self.chunk_size = chunk_size
+        self._prefix = uuid.uuid4().hex[:16]
+        self._counter = itertools.count()
+
+    def split(self, body, properties: pika.BasicProperties):
+        """Yields (chunk, properties) of each chunk of body."""
+        view = memoryview(body).cast("B")
+        total = len(view)
+        size = self.chunk_size
+        headers = dict(properties.headers or {})
+        headers[CHUNK_ID_HEADER] = "{}-{}".format(self._prefix, next(self._counter))
+        headers[CHUNK_TOTAL_HEADER] = total
+        headers[CHUNK_SIZE_HEADER] = size
+        if properties.content_encoding:
+            # chunks are decompressed one by one, this one is decompressed once reassembled
+            headers[CHUNK_ENCODING_HEADER] = properties.content_encoding
+            properties = copy.copy(properties)
+            properties.content_encoding = None
+        for index, offset in enumerate(range(0, total, size)):
+            chunk_properties = copy.copy(properties)
+            chunk_properties.headers = dict(headers, **{CHUNK_INDEX_HEADER: index})
+            yield view[offset:offset+size], chunk_properties
+
+
+class _Partial(object):
+    __slots__ = ("buffer", "received", "remaining", "deadline")
+
+    def __init__(self, total: int, n_chunks: int, deadline: float):
+        # the only full-size allocation, chunks are copied in place
+        self.buffer = bytearray(total)
+        self.received = bytearray(n_chunks)
+        self.remaining = n_chunks
+        self.deadline = deadline
+
+
+class ChunkAssembler(object):
+    def __init__(self, timeout: float = 30.0):
+        """Reassemble chunked messages (subscriber side).
+
+        Each message gets one buffer of its total length when its first chunk
+        arrives (in any order), every chunk is decompressed (if needed) and copied
+        at its offset, so the peak memory of a message is about its size plus one
+        chunk. Chunks of different messages may interleave with each other and
+        with whole messages. Messages with no new chunk for `timeout` seconds are
+        dropped and freed by expire(), to be called when the deadline it returns
+        is due, also once no chunk arrives any more.
+        """
+        self.timeout = timeout
+        self.partials = dict()  # (queue_name, message id) -> _Partial
+        self.timeouts = 0
+        self._next_expiry = float("inf")
+
+    def add(self, queue_name: str, properties: pika.BasicProperties, body):
+        """Add a chunk, returns (properties, body) of the whole message once complete, None otherwise."""
+        headers = properties.headers
+        key = (queue_name, headers[CHUNK_ID_HEADER])
+        total = headers[CHUNK_TOTAL_HEADER]
+        size = headers[CHUNK_SIZE_HEADER]
+        index = headers[CHUNK_INDEX_HEADER]
+        n_chunks = max(-(-total // size), 1) if size > 0 else 0
+        partial = self.partials.get(key)
+        if not 0 <= index < n_chunks or total < 0 or (
+                partial is not None and (len(partial.buffer) != total or len(partial.received) != n_chunks)):
+            print("[WARN] Drop chunk {} of chunked message {} of queue {}, invalid index, total {} or size {}."
+                  .format(index, key[1], queue_name, total, size))
+            return None
+        now = time.monotonic()
+        if partial is None:
+            partial = _Partial(total, n_chunks, now + self.timeout)
+            self.partials[key] = partial
+        else:
+            partial.deadline = now + self.timeout
+        self._next_expiry = min(self._next_expiry, partial.deadline)
+        if partial.received[index]:
+            # redelivered
+            return None
+
+        if properties.content_encoding:
+            body = get_compression(properties.content_encoding).decompress(body)
+        offset = index * size
+        end = min(offset + size, total)
+        if len(body) != end - offset:
+            print("[WARN] Drop chunked message {} of queue {}, chunk {} has {} bytes instead of {}."
+                  .format(key[1], queue_name, index, len(body), end - offset))
+            del self.partials[key]
+            return None
+        partial.buffer[offset:end] = body
+        partial.received[index] = 1
+        partial.remaining -= 1
+        if partial.remaining:
+            return None
+
+        del self.partials[key]
+        properties = copy.copy(properties)
+        properties.content_encoding = headers.get(CHUNK_ENCODING_HEADER)
+        properties.headers = {k: v for k, v in headers.items() if k not in _CHUNK_HEADERS}
+        return properties, partial.buffer
+
+    def expire(self) -> float:
+        """Drop the incomplete messages which timed out.
+
+        Returns:
+            deadline (float): time.monotonic() of the next expiry, inf if no message is incomplete
+        """
+        now = time.monotonic()
+        if now < self._next_expiry:
+            return self._next_expiry
+        # may run in the threads of a dispatcher while chunks arrive
+        expired = [k for k, p in list(self.partials.items()) if p.deadline <= now]
+        for key in expired:
+            partial = self.partials.pop(key, None)
+            if partial is None:
+                continue
+            self.timeouts += 1
+            print("[WARN] Drop chunked message {} of queue {}, {} of {} chunks received before timeout."
+                  .format(key[1], key[0], len(partial.received) - partial.remaining, len(partial.received)))
+        self._next_expiry = min((p.deadline for p in list(self.partials.values())), default=float("inf"))
+        return self._next_expiry
+
+    def forget(self, queue_name: str):
+        """Drop the incomplete messages of an unsubscribed queue."""
+        for key in [k for k in self.partials if k[0] == queue_name]:
+            del self.partials[key]
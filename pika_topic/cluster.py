@@ -0,0 +1,201 @@
+import bisect
+import hashlib
+import threading
+import pika
+from typing import Callable, Union
+from .manager import ConnectionManager
+
+
+DEFAULT_MANAGE_PORT = 15672
+
+
+def parse_endpoint(endpoint: str) -> tuple:
+    """"host[:port[:manage_port]]" -> (host, port, manage_port), with the default ports of RabbitMQ.
+
+    IPv6 addresses are written in brackets, e.g. "[::1]:5672".
+    """
+    rest = endpoint.strip()
+    host = None
+    if rest.startswith("["):
+        host, _, rest = rest[1:].partition("]")
+    parts = rest.split(":")
+    if host is not None:
+        parts[0] = host
+    assert 1 <= len(parts) <= 3 and parts[0], "endpoint should be host[:port[:manage_port]], got {}".format(endpoint)
+    host = parts[0]
+    port = int(parts[1]) if len(parts) > 1 and parts[1] else pika.ConnectionParameters.DEFAULT_PORT
+    manage_port = int(parts[2]) if len(parts) > 2 and parts[2] else DEFAULT_MANAGE_PORT
+    return host, port, manage_port
+
+
+def host_port(host: str, port: int) -> str:
+    """"host:port", with the IPv6 addresses in brackets."""
+    return "[{}]:{}".format(host, port) if ":" in host else "{}:{}".format(host, port)
+
+
+def _hash(key: str) -> int:
+    # md5 spreads similar topic names evenly, its strength does not matter here
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing(object):
+    def __init__(self, nodes: list = (), replicas: int = 128):
+        """Consistent hashing of keys (topics) to nodes.
+
+        Every node owns `replicas` points of a ring of 64 bit hashes, a key goes
+        to the node of the first point after its hash. Adding a node to N nodes
+        moves about 1/(N+1) of the keys, all to the new node, removing one only
+        moves its own keys.
+        """
+        self.replicas = replicas
+        self._points = []  # sorted hashes
+        self._nodes = []  # node of each point
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            point = _hash("{}#{}".format(node, i))
+            index = bisect.bisect(self._points, point)
+            self._points.insert(index, point)
+            self._nodes.insert(index, node)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        kept = [(p, n) for p, n in zip(self._points, self._nodes) if n != node]
+        self._points = [p for p, _ in kept]
+        self._nodes = [n for _, n in kept]
+
+    def get(self, key: str) -> str:
+        assert self._points, "the ring has no node"
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._nodes[index]
+
+
+class BrokerCluster(object):
+    def __init__(
+        self,
+        endpoints: list,
+        overrides: dict = None,
+        credentials: pika.credentials.PlainCredentials = None,
+        replicas: int = 128,
+        connect: Callable = None
+    ):
+        """Shard topics over several independent brokers.
+
+        Every topic is owned by one broker, chosen by consistent hashing of its
+        name (see HashRing) unless pinned by `overrides`. Publisher and
+        SingleSubscriber accept the cluster in place of conn and connect to the
+        broker of their topic only, ClusterSubscriber subscribes to topics of
+        several brokers. Connections are opened on first use, through one
+        ConnectionManager per broker (so one connection per broker and thread).
+
+        Example:
+            cluster = BrokerCluster(["10.0.0.1", "10.0.0.2:5673", "10.0.0.3:5672:15673"],
+                                    overrides={"camera": "10.0.0.3:5672"})
+            publisher = Publisher("joint_states", cluster)
+
+        Hierarchical topics are sharded like plain ones, a wildcard pattern is
+        subscribed on every broker.
+
+        Args:
+            endpoints (list):
+                brokers as "host[:port[:manage_port]]" (default ports 5672 and 15672, IPv6
+                hosts in brackets) or pika.ConnectionParameters. A broker is named "host:port"
+            overrides (dict, optional): {topic: broker} pinned topics, broker as an endpoint or its name
+            credentials (pika.credentials.PlainCredentials, optional): credentials of the endpoints given as strings
+            replicas (int, optional): points of each broker on the hash ring
+            connect (Callable, optional):
+                connect(parameters) -> connection, default is pika.BlockingConnection,
+                e.g. testing.LocalCluster.connect
+        """
+        self.credentials = credentials
+        self.connect = connect
+        self.parameters = dict()  # broker name -> pika.ConnectionParameters
+        self.manage_host_ports = dict()  # broker name -> "host:manage_port" of its management API
+        self.ring = HashRing(replicas=replicas)
+        self.overrides = dict()
+        self._managers = dict()  # broker name -> ConnectionManager
+        self._lock = threading.Lock()
+        for endpoint in endpoints:
+            self.add_node(endpoint)
+        for topic, endpoint in (overrides or {}).items():
+            self.override(topic, endpoint)
+
+    def _parse(self, endpoint: Union[str, pika.ConnectionParameters]) -> tuple:
+        if isinstance(endpoint, pika.ConnectionParameters):
+            host, port, manage_port = endpoint.host, endpoint.port, DEFAULT_MANAGE_PORT
+            parameters = endpoint
+        else:
+            host, port, manage_port = parse_endpoint(endpoint)
+            kwargs = {} if self.credentials is None else {"credentials": self.credentials}
+            parameters = pika.ConnectionParameters(host=host, port=port, **kwargs)
+        return host_port(host, port), parameters, host_port(host, manage_port)
+
+    def add_node(self, endpoint: Union[str, pika.ConnectionParameters]) -> str:
+        """Add a broker, about 1/N of the topics move to it. Returns its name.
+
+        Existing publishers and subscribers keep their connections, create them
+        again to follow the moved topics.
+        """
+        name, parameters, manage_host_port = self._parse(endpoint)
+        self.parameters[name] = parameters
+        self.manage_host_ports[name] = manage_host_port
+        self.ring.add(name)
+        return name
+
+    def remove_node(self, name: str):
+        """Remove a broker, its topics move to the others (pinned ones too, to their hashed broker)."""
+        self.ring.remove(name)
+        self.parameters.pop(name, None)
+        self.manage_host_ports.pop(name, None)
+        self.overrides = {t: n for t, n in self.overrides.items() if n != name}
+        manager = self._managers.pop(name, None)
+        if manager is not None:
+            manager.close()
+
+    def override(self, topic: str, endpoint: str):
+        """Pin topic to a broker, given as an endpoint or a broker name."""
+        name = endpoint if endpoint in self.parameters else self._parse(endpoint)[0]
+        assert name in self.parameters, "unknown broker {}".format(endpoint)
+        self.overrides[topic] = name
+
+    @property
+    def nodes(self) -> list:
+        return list(self.parameters)
+
+    def node_for(self, topic: str) -> str:
+        """Name of the broker owning topic."""
+        name = self.overrides.get(topic)
+        return self.ring.get(topic) if name is None else name
+
+    def manager(self, node: str) -> ConnectionManager:
+        """ConnectionManager of a broker, created on first use."""
+        with self._lock:
+            manager = self._managers.get(node)
+            if manager is None:
+                manager = ConnectionManager(self.parameters[node], self.connect)
+                self._managers[node] = manager
+        return manager
+
+    def manager_for(self, topic: str) -> ConnectionManager:
+        """ConnectionManager of the broker owning topic."""
+        return self.manager(self.node_for(topic))
+
+    def connected_nodes(self) -> list:
+        """Brokers with a ConnectionManager, i.e. used by a publisher or subscriber."""
+        return list(self._managers)
+
+    def close(self):
+        """Close the connections to all brokers, see ConnectionManager.close."""
+        with self._lock:
+            managers = list(self._managers.values())
+            self._managers.clear()
+        for manager in managers:
+            manager.close()
@@ -0,0 +1,123 @@
+import struct
+import pickle
+from typing import Union
+
+
+class Codec(object):
+    """Base class of message codecs.
+
+    A codec turns a python object into the body of an AMQP message and back.
+    The codec is identified by `content_type`, which the publisher writes into
+    the AMQP `content_type` property so subscribers can pick the right decoder.
+    """
+    content_type: str = None
+
+    def encode(self, obj) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, body: Union[bytes, memoryview]):
+        raise NotImplementedError
+
+
+class PickleCodec(Codec):
+    """Plain pickle, the format used before codecs existed.
+
+    Messages without `content_type` are also decoded with this codec.
+    """
+    content_type = "application/x-python-pickle"
+
+    def __init__(self, protocol: int = pickle.DEFAULT_PROTOCOL):
+        self.protocol = protocol
+
+    def encode(self, obj) -> bytes:
+        return pickle.dumps(obj, protocol=self.protocol)
+
+    def decode(self, body):
+        return pickle.loads(body)
+
+
+class Pickle5Codec(Codec):
+    """Pickle protocol 5 with out-of-band buffers.
+
+    Large contiguous buffers (e.g. numpy arrays) are not copied into the pickle
+    stream, they are appended after it. On decoding, the buffers are handed to
+    pickle as memoryviews over the received body, so arrays are rebuilt as
+    (read-only) views without another copy.
+
+    Body layout (little endian):
+        [u32 n_buffers][u64 pickle_len][u64 buffer_len] * n_buffers
+        [pickle stream][pad][buffer 0][pad][buffer 1]...
+    Each buffer starts at an offset aligned to `ALIGN` bytes.
+    """
+    content_type = "application/x-pika-topic-pickle5"
+    ALIGN = 8
+
+    def encode(self, obj) -> bytes:
+        buffers = []
+        stream = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        raws = [b.raw() for b in buffers]
+        lengths = [r.nbytes for r in raws]
+
+        head = struct.pack("<IQ{}Q".format(len(raws)), len(raws), len(stream), *lengths)
+        if not raws:
+            return head + stream
+
+        parts = [head, stream]
+        offset = len(head) + len(stream)
+        for r in raws:
+            pad = -offset % self.ALIGN
+            if pad:
+                parts.append(b"\x00" * pad)
+            parts.append(r)
+            offset += pad + r.nbytes
+        return b"".join(parts)
+
+    def decode(self, body):
+        view = memoryview(body)
+        n, = struct.unpack_from("<I", view, 0)
+        head_fmt = "<IQ{}Q".format(n)
+        head = struct.unpack_from(head_fmt, view, 0)
+        stream_len, lengths = head[1], head[2:]
+
+        offset = struct.calcsize(head_fmt)
+        stream = view[offset:offset+stream_len]
+        offset += stream_len
+        buffers = []
+        for length in lengths:
+            offset += -offset % self.ALIGN
+            buffers.append(view[offset:offset+length])
+            offset += length
+        return pickle.loads(stream, buffers=buffers)
+
+
+_CODECS = dict()
+
+
+def register_codec(codec: Codec):
+    """Register a codec instance so subscribers can decode its messages."""
+    assert codec.content_type, "codec should have a content_type"
+    _CODECS[codec.content_type] = codec
+    return codec
+
+
+def get_codec(content_type: str = None) -> Codec:
+    """Find the codec for a `content_type`, None means legacy plain pickle."""
+    if content_type is None:
+        return _LEGACY_CODEC
+    try:
+        return _CODECS[content_type]
+    except KeyError:
+        raise ValueError("Unknown content type: {}".format(content_type))
+
+
+_LEGACY_CODEC = register_codec(PickleCodec())
+register_codec(Pickle5Codec())
+# plain pickle keeps the wire format of publishers older than codecs, which
+# subscribers of any version decode; Pickle5Codec is opt-in
+DEFAULT_CODEC = _LEGACY_CODEC
+
+
+def decode_message(properties, body):
+    """Decode an AMQP message with the codec named in its properties."""
+    content_type = None if properties is None else properties.content_type
+    return get_codec(content_type).decode(body)
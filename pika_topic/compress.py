@@ -0,0 +1,68 @@
+import zlib
+import lzma
+from typing import Union
+
+
+class Compression(object):
+    """Base class of body compressions.
+
+    A compression is identified by `encoding`, which the publisher writes into the
+    AMQP `content_encoding` property so subscribers can decompress transparently.
+    """
+    encoding: str = None
+
+    def compress(self, data) -> bytes:
+        raise NotImplementedError
+
+    def decompress(self, data) -> bytes:
+        raise NotImplementedError
+
+
+class ZlibCompression(Compression):
+    encoding = "zlib"
+
+    def __init__(self, level: int = 1):
+        self.level = level
+
+    def compress(self, data) -> bytes:
+        return zlib.compress(data, self.level)
+
+    def decompress(self, data) -> bytes:
+        return zlib.decompress(data)
+
+
+class LzmaCompression(Compression):
+    encoding = "xz"
+
+    def __init__(self, preset: int = 0):
+        self.preset = preset
+
+    def compress(self, data) -> bytes:
+        return lzma.compress(data, preset=self.preset)
+
+    def decompress(self, data) -> bytes:
+        return lzma.decompress(data)
+
+
+_COMPRESSIONS = dict()
+
+
+def register_compression(compression: Compression):
+    """Register a compression instance so subscribers can decompress its messages."""
+    assert compression.encoding, "compression should have an encoding"
+    _COMPRESSIONS[compression.encoding] = compression
+    return compression
+
+
+def get_compression(encoding: Union[str, Compression]) -> Compression:
+    """Find the compression registered for `encoding`, instances are returned as is."""
+    if isinstance(encoding, Compression):
+        return encoding
+    try:
+        return _COMPRESSIONS[encoding]
+    except KeyError:
+        raise ValueError("Unknown content encoding: {}".format(encoding))
+
+
+register_compression(ZlibCompression())
+register_compression(LzmaCompression())
@@ -1,6 +1,10 @@
+import copy
 import pika
 import argparse
+from collections import defaultdict
 from ._utils import *
+from .namespace import NAMESPACE_EXCHANGE
+from .cluster import BrokerCluster
 
 
 def parse_opt():
@@ -10,6 +14,17 @@ def parse_opt():
     parser.add_argument("-u", "--user", type=str, default="", help="re pattern to filter user of queried exchanges")
     parser.add_argument("-v", "--vhost", type=str, default="", help="re pattern to filter vhost of queried exchanges")
     parser.add_argument("-y", "--yes", action="store_true", default=False, help="set true to skip the deletion confirm")
+    parser.add_argument("-d", "--dry_run", action="store_true", default=False,
+                        help="only list the matched exchanges, delete nothing")
+    parser.add_argument("-b", "--batch_size", type=int, default=100,
+                        help="exchanges deleted per pipelined batch, default is 100")
+    parser.add_argument("-c", "--channels", type=int, default=4,
+                        help="number of channels deleting in parallel, default is 4")
+    parser.add_argument("--page_size", type=int, default=500,
+                        help="exchanges per page of the management API, default is 500")
+    parser.add_argument("--namespace", action="store_true", default=False,
+                        help=f"also match {NAMESPACE_EXCHANGE}, the exchange shared by all the hierarchical "
+                            "topics, deleting it unbinds every hierarchical subscriber")
     parser.add_argument("-ip", "--ip", type=str, default="localhost", 
                         help="address of server hosting rabbitmq-server and rabbitmq_management")
     parser.add_argument("-mp", "--manage_port", type=int, default=15672, 
@@ -19,6 +34,9 @@ def parse_opt():
     default_auth = "@".join([default_param.DEFAULT_USERNAME, default_param.DEFAULT_PASSWORD])
     parser.add_argument("-a", "--auth", type=str, default=default_auth, 
                         help=f"auth to establish connection to host, format is username@passwd, default is {default_auth}")
+    parser.add_argument("--cluster", type=str, default="",
+                        help="comma separated brokers of a sharded cluster as host[:port[:manage_port]], "
+                            "queried concurrently instead of --ip")
     opt = parser.parse_args()
     return opt
 
@@ -36,34 +54,57 @@ def main():
     ip = opt.ip
     rabbitmq_port = opt.manage_port
     username, password = opt.auth.strip().split("@")
-    ret = fetch_all_exchanges(":".join([ip, str(rabbitmq_port)]), username, password)
-    matches = find_matches(filters, ret)
+    cred = pika.PlainCredentials(username, password)
+    # the name pattern is filtered by the server too, pages are filtered one by one 
+    # and only the names of the matches are kept
+    if opt.cluster:
+        cluster = BrokerCluster(opt.cluster.split(","), credentials=cred)
+        pages = [fetch_cluster_exchanges(cluster.manage_host_ports, username, password, 
+                                         opt.name, opt.page_size)]
+    else:
+        pages = iter_exchange_pages(":".join([ip, str(rabbitmq_port)]), username, password, 
+                                    opt.name, opt.page_size)
+    matches = defaultdict(list)  # (broker, vhost) -> names
+    n_matches = 0
+    if opt.dry_run or not opt.yes:
+        print("[INFO] Find matches:")
+    for m in iter_matches(filters, pages, skip_namespace=not opt.namespace):
+        if opt.dry_run or not opt.yes:
+            print("[{:>4d}]: {}".format(n_matches+1, m))
+        matches[m.get("node"), m["vhost"]].append(m["name"])
+        n_matches += 1
     
-    if len(matches) == 0:
+    if n_matches == 0:
         print("[INFO] No matches found.")
         return
+    if opt.dry_run:
+        print("[INFO] Dry run, would delete total {} exchanges.".format(n_matches))
+        return
     
     if not opt.yes:
-        print("[INFO] Find matches:")
-        for i, m in enumerate(matches):
-            print("[{:>4d}]: {}".format(i+1, m))
         key = input("[INFO] Will delete totoal {} exchanges, continue? (Y/n): "
-                    .format(len(matches)))
+                    .format(n_matches))
         key = key.strip().lower()
         if len(key) > 0 and (key != "y"):
             print("[INFO] Abortion.")
             return
 
-    # delete matches
-    pika_port = opt.pika_port
-    cred = pika.PlainCredentials(username, password)
-    connection = pika.BlockingConnection(pika.ConnectionParameters(
-        host=ip, port=pika_port, credentials=cred))
-    channel = connection.channel()
-    
-    for m in matches:
-        print("[INFO] Delete {}".format(m))
-        channel.exchange_delete(m["name"])
+    # delete matches, one connection per broker and vhost
+    progress = Progress(n_matches)
+    deleted = 0
+    for (node, vhost), names in matches.items():
+        if node is None:
+            parameters = pika.ConnectionParameters(host=ip, port=opt.pika_port, credentials=cred)
+        else:
+            # node is the name of a broker of the cluster
+            parameters = copy.copy(cluster.parameters[node])
+        parameters.virtual_host = vhost
+        connection = pika.BlockingConnection(parameters)
+        offset = deleted
+        deleted += delete_exchanges(connection, names, opt.batch_size, opt.channels, 
+                                    lambda n: progress(offset + n))
+        connection.close()
+    progress(deleted, force=True)
 
 
 if __name__ == "__main__":
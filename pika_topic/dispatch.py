@@ -0,0 +1,134 @@
+import time
+import threading
+import traceback
+from collections import deque
+from typing import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor
+from .message import MessageDecoder
+
+
+def _run_in_thread(decoder: MessageDecoder, queue_name: str, callback: Callable, properties, body,
+                   newest: bool = False):
+    t0 = time.perf_counter()
+    if newest:
+        # conflating queue, only the last message of a batch is decoded
+        codec, bodies = decoder.unwrap(queue_name, properties, body)
+        messages = [codec.decode(b) for b in bodies[-1:]]
+    else:
+        messages = decoder.decode(queue_name, properties, body)
+    for data in messages:
+        callback(data)
+    return time.perf_counter() - t0
+
+
+_process_decoder = None
+
+
+def _run_in_process(queue_name: str, shm: bool, callback: Callable, properties, body, newest: bool = False):
+    # every worker process keeps its own decoder (e.g. attached shared memory segments)
+    global _process_decoder
+    if _process_decoder is None:
+        _process_decoder = MessageDecoder()
+    if shm:
+        _process_decoder.shm_queues.add(queue_name)
+    return _run_in_thread(_process_decoder, queue_name, callback, properties, body, newest)
+
+
+class CallbackDispatcher(object):
+    def __init__(self, executor: Executor, connection, channel, decoder: MessageDecoder):
+        """Run subscriber callbacks in an executor, used by Subscriber(executor=...).
+
+        Messages of one queue are handled one at a time in arrival order, different
+        queues run in parallel. Messages are acked (on the connection thread) after
+        their callback returns, so together with basic_qos(prefetch_count) the broker
+        stops delivering when workers fall behind.
+
+        With a ProcessPoolExecutor, callbacks must be picklable (e.g. module level
+        functions), the raw body is sent to the worker and deserialized there.
+        """
+        self.executor = executor
+        self.connection = connection
+        self.channel = channel
+        self.decoder = decoder
+        self.use_process = isinstance(executor, ProcessPoolExecutor)
+        self.max_workers = getattr(executor, "_max_workers", 1)
+
+        self._waiting = dict()  # queue_name -> deque of (delivery_tag, callback, properties, body)
+        self._busy = set()  # queue_names with a callback running
+        self.requeue_queues = set()  # worker group queues, messages whose callback raised are requeued
+        self.conflating = dict()  # queue_name -> message.Conflation, only the newest waiting message runs
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+        self.busy_seconds = 0.0
+        self.completed = 0
+        self.errors = 0
+
+    def on_message(self, queue_name: str, callback: Callable, channel, method, properties, body):
+        """Called on the connection thread with whole messages, chunks are reassembled by the subscriber."""
+        waiting = self._waiting.setdefault(queue_name, deque())
+        conflation = self.conflating.get(queue_name)
+        if conflation is not None:
+            # older waiting messages are acked without being decoded
+            while waiting:
+                self.channel.basic_ack(waiting.popleft()[0])
+                conflation.skip()
+        waiting.append((method.delivery_tag, callback, properties, body))
+        if queue_name not in self._busy:
+            self._submit_next(queue_name)
+
+    def _submit_next(self, queue_name: str):
+        waiting = self._waiting.get(queue_name)
+        if not waiting:
+            self._busy.discard(queue_name)
+            return
+        tag, callback, properties, body = waiting.popleft()
+        self._busy.add(queue_name)
+        conflation = self.conflating.get(queue_name)
+        if conflation is not None:
+            conflation.count()
+        newest = conflation is not None
+        if self.use_process:
+            shm = queue_name in self.decoder.shm_queues
+            future = self.executor.submit(_run_in_process, queue_name, shm, callback, properties, body, newest)
+        else:
+            future = self.executor.submit(_run_in_thread, self.decoder, queue_name, callback, properties, body,
+                                          newest)
+        future.add_done_callback(
+            lambda f: self.connection.add_callback_threadsafe(
+                lambda: self._on_done(queue_name, tag, f)))
+
+    def _on_done(self, queue_name: str, delivery_tag: int, future):
+        """Called on the connection thread when a callback finished."""
+        error = future.exception()
+        with self._lock:
+            self.completed += 1
+            if error is None:
+                self.busy_seconds += future.result()
+            else:
+                self.errors += 1
+        if error is not None:
+            traceback.print_exception(type(error), error, error.__traceback__)
+        if self.channel.is_open:
+            if error is not None and queue_name in self.requeue_queues:
+                self.channel.basic_nack(delivery_tag, requeue=True)
+            else:
+                self.channel.basic_ack(delivery_tag)
+        self._submit_next(queue_name)
+
+    def forget(self, queue_name: str):
+        """Drop waiting messages of an unsubscribed queue."""
+        self._waiting.pop(queue_name, None)
+        self.requeue_queues.discard(queue_name)
+        self.conflating.pop(queue_name, None)
+
+    def metrics(self) -> dict:
+        """Queue depth (waiting + running) of each queue and worker utilisation."""
+        elapsed = time.perf_counter() - self._start
+        depth = {q: len(w) + (q in self._busy) for q, w in list(self._waiting.items())}
+        return {
+            "queue_depth": depth,
+            "completed": self.completed,
+            "errors": self.errors,
+            "busy_seconds": self.busy_seconds,
+            "utilisation": self.busy_seconds / max(elapsed * self.max_workers, 1e-9),
+        }
@@ -1,13 +1,23 @@
+import math
 import pika
 import time
 import argparse
+import threading
 import numpy as np
 from ._utils import *
+from collections import deque
+from functools import partial
 from pprint import pprint
-from .sub import Subscriber
+from .sub import Subscriber, ClusterSubscriber
+from .cluster import BrokerCluster
+from .stats import TopicStats, SEND_WALL_HEADER
+from .message import STAMP_HEADER
 
 
-def parse_opt():
+MODES = ("echo", "hz", "bw")
+
+
+def parse_opt(mode: str = None):
     parser = argparse.ArgumentParser()
     default_param = pika.ConnectionParameters
     parser.add_argument("-n", "--name", type=str, default="", help="re pattern to filter name of queried exchanges")
@@ -15,51 +25,298 @@ def parse_opt():
     parser.add_argument("-v", "--vhost", type=str, default="", help="re pattern to filter vhost of queried exchanges")
     parser.add_argument("-p", "--precision", type=int, default=3, help="displayed precision of numpy arrays in message, "
                         "default is 3")
-    parser.add_argument("-ip", "--ip", type=str, default=default_param.DEFAULT_HOST, 
+    parser.add_argument("-ip", "--ip", type=str, default=default_param.DEFAULT_HOST,
                         help="address of server hosting rabbitmq-server and rabbitmq_management, "
                             f"default is {default_param.DEFAULT_HOST}")
-    parser.add_argument("-mp", "--manage_port", type=int, default=15672, 
+    parser.add_argument("-mp", "--manage_port", type=int, default=15672,
                         help="port of rabbitmq_management, default is 15672")
-    parser.add_argument("-pp", "--pika_port", type=int, default=default_param.DEFAULT_PORT, 
+    parser.add_argument("-pp", "--pika_port", type=int, default=default_param.DEFAULT_PORT,
                         help=f"address of rabbitmq-server, default is {default_param.DEFAULT_PORT}")
     default_auth = "@".join([default_param.DEFAULT_USERNAME, default_param.DEFAULT_PASSWORD])
-    parser.add_argument("-a", "--auth", type=str, default=default_auth, 
+    parser.add_argument("-a", "--auth", type=str, default=default_auth,
                         help=f"auth to establish connection to host, format is username@passwd, default is {default_auth}")
+    if mode is None:
+        parser.add_argument("-m", "--mode", type=str, default="echo", choices=MODES,
+                            help="echo prints messages, hz prints rate and jitter, bw prints bandwidth, "
+                                "default is echo")
+    parser.add_argument("-A", "--all", action="store_true",
+                        help="watch all the matched exchanges instead of selecting some")
+    parser.add_argument("-N", "--namespace", type=str, default="",
+                        help="watch the hierarchical topics matching this pattern with one queue, "
+                            "e.g. robot.*.pose or # for all, the exchanges are not queried")
+    parser.add_argument("-r", "--display_hz", type=float, default=None,
+                        help="max display rate in Hz, default is 10 for echo and 1 for hz/bw")
+    parser.add_argument("-w", "--window", type=int, default=1000,
+                        help="number of messages in the hz/bw sliding window, default is 1000")
+    parser.add_argument("-q", "--queue_size", type=int, default=None,
+                        help="queue size of each subscription, default is 2 for echo and unbounded for hz/bw "
+                            "and --namespace")
+    parser.add_argument("--cluster", type=str, default="",
+                        help="comma separated brokers of a sharded cluster as host[:port[:manage_port]], "
+                            "queried concurrently instead of --ip, topics are watched on their broker")
+    parser.add_argument("--max_elements", type=int, default=100,
+                        help="arrays, bytes and lists with more elements are summarized in echo mode, "
+                            "default is 100")
     opt = parser.parse_args()
+    if mode is not None:
+        opt.mode = mode
+    if opt.display_hz is None:
+        opt.display_hz = 10.0 if opt.mode == "echo" else 1.0
+    if opt.queue_size is None:
+        opt.queue_size = 2 if opt.mode == "echo" and not opt.namespace else -1
     return opt
 
 
-class DataCallback(object):
-    def __init__(self, win_size=100):
-        self.dts = []
+def summarize(obj, max_elements: int = 100):
+    """Replace large arrays, bytes and sequences by a one line summary, recursively."""
+    if isinstance(obj, np.ndarray):
+        if obj.size <= max_elements:
+            return obj
+        text = "<ndarray shape={} dtype={}".format(obj.shape, obj.dtype)
+        if obj.dtype.kind in "biuf":
+            text += " min={:g} max={:g} mean={:g}".format(obj.min(), obj.max(), obj.mean())
+        return text + ">"
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        if len(obj) <= max_elements:
+            return obj
+        return "<{} len={}>".format(type(obj).__name__, len(obj))
+    if isinstance(obj, dict):
+        return {k: summarize(v, max_elements) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        if len(obj) > max_elements:
+            return "<{} len={} first={!r}>".format(type(obj).__name__, len(obj),
+                                                   summarize(obj[0], max_elements))
+        items = [summarize(v, max_elements) for v in obj]
+        return items if isinstance(obj, list) else tuple(items)
+    return obj
+
+
+class TopicMonitor(object):
+    def __init__(self, topic: str, win_size: int = 1000):
+        """Rate, jitter and bandwidth of one topic over a sliding window, O(1) per message.
+
+        Intervals are taken from the publisher timestamps in the headers if any
+        ("x-send-wall" of instrumented publishers, else "x-stamp"), so they are not
+        distorted by the network, otherwise from the receive time. Sizes are body
+        lengths, messages are not deserialized.
+        """
+        self.topic = topic
         self.win_size = win_size
+        self.stats = TopicStats(topic)  # latency and drops of instrumented publishers
+        self.dts = deque()
+        self.dt_sum = 0.0
+        self.dt_sq_sum = 0.0
+        self.sizes = deque()
+        self.size_sum = 0
         self.prev_t = None
         self.counts = 0
-    
-    def update(self, data):
-        curr_t = time.perf_counter()
-        if self.prev_t is None:
-            self.prev_t = curr_t
-            return
-        else:
-            dt_new = curr_t - self.prev_t
-            self.prev_t = curr_t
-            self.dts.append(dt_new)
-            if len(self.dts) > self.win_size:
-                self.dts.pop(0)
-        
-        self.fps = 1.0 / np.mean(self.dts)
+        # min/max since the last display
+        self.dt_min = math.inf
+        self.dt_max = 0.0
+        self.size_min = math.inf
+        self.size_max = 0
+        # latest undecoded message, displayed by the echo mode
+        self.latest = None
+        self.displayed = 0
+
+    def update(self, properties, body):
+        headers = properties.headers or {}
+        t = headers.get(SEND_WALL_HEADER, headers.get(STAMP_HEADER))
+        if t is None:
+            t = time.time()
+        size = len(body)
         self.counts += 1
-        
-        print("-"*61)
-        print("[INFO] Counts: {}".format(self.counts))
-        print("[INFO] FPS: {}".format(self.fps))
-        print("[INFO] Data: ")
-        pprint(data, sort_dicts=False)
+        self.latest = (self.counts, properties, body)
+        self.stats.record(headers, size)
+        self.sizes.append(size)
+        self.size_sum += size
+        self.size_min = min(self.size_min, size)
+        self.size_max = max(self.size_max, size)
+        # one size more than intervals, see bandwidth
+        if len(self.sizes) > self.win_size + 1:
+            self.size_sum -= self.sizes.popleft()
+        if self.prev_t is not None:
+            dt = t - self.prev_t
+            self.dts.append(dt)
+            self.dt_sum += dt
+            self.dt_sq_sum += dt * dt
+            self.dt_min = min(self.dt_min, dt)
+            self.dt_max = max(self.dt_max, dt)
+            if len(self.dts) > self.win_size:
+                old = self.dts.popleft()
+                self.dt_sum -= old
+                self.dt_sq_sum -= old * old
+        self.prev_t = t
+
+    @property
+    def rate(self) -> float:
+        return len(self.dts) / self.dt_sum if self.dt_sum > 0 else 0.0
+
+    @property
+    def jitter(self) -> float:
+        """Standard deviation of the intervals in seconds."""
+        n = len(self.dts)
+        if n < 2:
+            return 0.0
+        mean = self.dt_sum / n
+        return math.sqrt(max(self.dt_sq_sum / n - mean * mean, 0.0))
+
+    @property
+    def bandwidth(self) -> float:
+        """Bytes per second."""
+        if self.dt_sum <= 0:
+            return 0.0
+        # bytes received after the first message of the window
+        return (self.size_sum - self.sizes[0]) / self.dt_sum
+
+    def reset_extrema(self):
+        self.dt_min = math.inf
+        self.dt_max = 0.0
+        self.size_min = math.inf
+        self.size_max = 0
+
+
+def _fmt_bytes(n: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1000 or unit == "GB":
+            return "{:.2f}{}".format(n, unit)
+        n /= 1000.0
+
+
+def _fmt_seconds(t: float) -> str:
+    return "-" if t in (math.inf, 0.0) else "{:.6f}s".format(t)
+
+
+class Monitor(object):
+    def __init__(self, subscriber: Subscriber, topics: list, opt, patterns: list = ()):
+        """Watch several topics on one connection, display at most opt.display_hz times per second.
 
+        Hierarchical topics matching `patterns` share one queue per pattern, their
+        monitors are added when their first message arrives.
 
-def main():
-    opt = parse_opt()
+        With a ClusterSubscriber every broker is consumed in its own thread: the
+        monitors are updated and displayed under a lock, and every connection
+        runs the display timer, so the display goes on while any broker is up.
+        """
+        self.subscriber = subscriber
+        self.opt = opt
+        self.monitors = []
+        self.queue_names = []
+        self._namespace_monitors = dict()  # hierarchical topic -> TopicMonitor
+        self._lock = threading.Lock()
+        for topic in topics:
+            monitor = TopicMonitor(topic, opt.window)
+            queue_name = subscriber.subscribe(topic, opt.queue_size, partial(self._update, monitor), raw=True)
+            self.monitors.append(monitor)
+            self.queue_names.append(queue_name)
+        for pattern in patterns:
+            self._watch_pattern(pattern)
+        self.period = 1.0 / opt.display_hz
+        self._next_display = time.monotonic() + self.period
+        if isinstance(subscriber, ClusterSubscriber):
+            subscribers = list(subscriber.subscribers.values())
+        else:
+            subscribers = [subscriber]
+        for s in subscribers:
+            s.connection.call_later(self.period, partial(self._on_timer, s))
+
+    def _update(self, monitor: TopicMonitor, properties, body):
+        with self._lock:
+            monitor.update(properties, body)
+
+    def _watch_pattern(self, pattern: str):
+        queue_name = []
+        def callback(properties, body, topic):
+            with self._lock:
+                monitor = self._namespace_monitors.get(topic)
+                if monitor is None:
+                    monitor = TopicMonitor(topic, self.opt.window)
+                    self._namespace_monitors[topic] = monitor
+                    self.monitors.append(monitor)
+                    self.queue_names.append(queue_name[0])
+                monitor.update(properties, body)
+        queue_names = self.subscriber.subscribe(pattern, self.opt.queue_size, callback, raw=True, hierarchical=True)
+        # a queue per broker with a ClusterSubscriber, any of them decodes
+        queue_name.append(queue_names if isinstance(queue_names, str) else queue_names[0])
+
+    def _on_timer(self, subscriber: Subscriber):
+        try:
+            with self._lock:
+                now = time.monotonic()
+                # the timers of the other connections may have displayed already
+                if now < self._next_display:
+                    return
+                self._next_display = now + self.period
+                if self.opt.mode == "echo":
+                    self.display_echo()
+                elif self.opt.mode == "hz":
+                    self.display_hz()
+                else:
+                    self.display_bw()
+        finally:
+            subscriber.connection.call_later(self.period, partial(self._on_timer, subscriber))
+
+    def display_echo(self):
+        for monitor, queue_name in zip(self.monitors, self.queue_names):
+            if monitor.latest is None or monitor.latest[0] == monitor.displayed:
+                continue
+            count, properties, body = monitor.latest
+            skipped = count - monitor.displayed - 1
+            monitor.displayed = count
+            messages = self.subscriber.decode(queue_name, properties, body)
+            if not messages:
+                continue
+            print("-"*61)
+            print("[INFO] Topic: {}, Counts: {} ({} not displayed)".format(monitor.topic, count, skipped))
+            print("[INFO] FPS: {:.3f}, Size: {}".format(monitor.rate, _fmt_bytes(len(body))))
+            lat = monitor.stats.latency
+            if lat.total:
+                print("[INFO] Latency p50: {:.6f}s p99: {:.6f}s, dropped: {}".format(
+                    lat.quantile(0.5), lat.quantile(0.99), monitor.stats.dropped))
+            print("[INFO] Data: ")
+            pprint(summarize(messages[-1], self.opt.max_elements), sort_dicts=False)
+
+    def display_hz(self):
+        print("{:<32s} {:>10s} {:>10s} {:>10s} {:>11s} {:>11s} {:>7s} {:>8s}".format(
+            "topic", "rate", "min", "max", "std dev", "p99 lat", "window", "dropped"))
+        for m in self.monitors:
+            p99 = m.stats.latency.quantile(0.99)
+            print("{:<32s} {:>10.3f} {:>10s} {:>10s} {:>11s} {:>11s} {:>7d} {:>8d}".format(
+                m.topic[:32], m.rate, _fmt_seconds(m.dt_min), _fmt_seconds(m.dt_max),
+                "{:.6f}s".format(m.jitter), "-" if p99 is None else "{:.6f}s".format(p99),
+                len(m.dts), m.stats.dropped))
+            m.reset_extrema()
+
+    def display_bw(self):
+        print("{:<32s} {:>12s} {:>10s} {:>10s} {:>10s} {:>7s}".format(
+            "topic", "bandwidth", "mean", "min", "max", "window"))
+        for m in self.monitors:
+            mean = m.size_sum / len(m.sizes) if m.sizes else 0
+            print("{:<32s} {:>12s} {:>10s} {:>10s} {:>10s} {:>7d}".format(
+                m.topic[:32], _fmt_bytes(m.bandwidth) + "/s", _fmt_bytes(mean),
+                "-" if m.size_min == math.inf else _fmt_bytes(m.size_min),
+                "-" if m.size_min == math.inf else _fmt_bytes(m.size_max), len(m.dts)))
+            m.reset_extrema()
+
+
+def select_matches(matches: list, select_all: bool = False) -> list:
+    if len(matches) <= 1 or select_all:
+        return matches
+    print("*"*61)
+    print("[INFO] Find multiple matches:")
+    for i, m in enumerate(matches):
+        print("[{:>4d}]: {}".format(i, m))
+    print("*"*61)
+    inp = ""
+    while len(inp) == 0:
+        inp = input("[INFO] Input indices to select (comma separated, 'a' for all): ").strip()
+    if inp.lower() == "a":
+        return matches
+    return [matches[int(i)] for i in inp.split(",") if i.strip()]
+
+
+def main(mode: str = None):
+    opt = parse_opt(mode)
     filters = []
     if opt.name:
         filters.append(gen_name_filter(opt.name))
@@ -67,7 +324,7 @@ def main():
         filters.append(gen_user_filter(opt.user))
     if opt.vhost:
         filters.append(gen_vhost_filter(opt.vhost))
-    
+
     precision = opt.precision
     if precision > 0:
         np.set_printoptions(precision, suppress=True)
@@ -75,38 +332,29 @@ def main():
     ip = opt.ip
     rabbitmq_port = opt.manage_port
     username, password = opt.auth.strip().split("@")
-    ret = fetch_all_exchanges(":".join([ip, str(rabbitmq_port)]), username, password)
-    matches = find_matches(filters, ret)
-    
-    if len(matches) > 1:
-        print("*"*61)
-        print("[INFO] Find multiple matches:")
-        for i, m in enumerate(matches):
-            print("[{:>4d}]: {}".format(i, m))
-        print("*"*61)
-        inp = ""
-        while len(inp) == 0:
-            inp = input("[INFO] Input index to select: ").strip()
-        index = int(inp)
-        match = matches[index]
-    elif len(matches) == 0:
-        print("[INFO] No match found.")
-        return
-    else:
-        match = matches[0]
-    
-    data_callback = DataCallback()
-    
-    pika_port = opt.pika_port
     cred = pika.PlainCredentials(username, password)
-    connection = pika.BlockingConnection(pika.ConnectionParameters(
-        host=ip, port=pika_port, credentials=cred))
-    subscriber = Subscriber(connection)
-    subscriber.subscribe(
-        topic=match["name"],
-        queue_size=2,
-        callback=data_callback.update
-    )
+    cluster = BrokerCluster(opt.cluster.split(","), credentials=cred) if opt.cluster else None
+    if opt.namespace:
+        # hierarchical topics have no exchange of their own, they are found by subscribing
+        matches = []
+    else:
+        if cluster is not None:
+            ret = fetch_cluster_exchanges(cluster.manage_host_ports, username, password, opt.name)
+        else:
+            ret = fetch_all_exchanges(":".join([ip, str(rabbitmq_port)]), username, password, opt.name)
+        matches = find_matches(filters, ret)
+        if len(matches) == 0:
+            print("[INFO] No match found.")
+            return
+        matches = select_matches(matches, opt.all)
+
+    if cluster is not None:
+        subscriber = ClusterSubscriber(cluster)
+    else:
+        connection = pika.BlockingConnection(pika.ConnectionParameters(
+            host=ip, port=opt.pika_port, credentials=cred))
+        subscriber = Subscriber(connection)
+    Monitor(subscriber, [m["name"] for m in matches], opt, [opt.namespace] if opt.namespace else [])
     try:
         print("[INFO] Waiting for messages...")
         subscriber.spin()
@@ -116,4 +364,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
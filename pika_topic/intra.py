@@ -0,0 +1,113 @@
+import copy
+import uuid
+import weakref
+import threading
+from collections import deque
+from typing import Callable
+
+
+ORIGIN_HEADER = "x-origin"
+# identifies messages published by this process, whose broker copies local subscribers skip
+PROCESS_TOKEN = uuid.uuid4().hex
+
+MODES = ("shared", "readonly", "copy")
+
+
+def readonly(obj):
+    """NumPy arrays become read-only views, also inside dicts, lists and tuples
+    (rebuilt shallowly), other objects are returned as is."""
+    if hasattr(obj, "__array_interface__") and hasattr(obj, "view"):
+        view = obj.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(obj, dict):
+        return {k: readonly(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [readonly(v) for v in obj]
+    if isinstance(obj, tuple):
+        items = [readonly(v) for v in obj]
+        # namedtuples take their fields as positional arguments
+        return type(obj)(*items) if hasattr(obj, "_fields") else tuple(items)
+    return obj
+
+
+class _Endpoint(object):
+    def __init__(self, subscriber, queue_name: str, mode: str, callback: Callable = None, queue_size: int = -1):
+        """Local delivery into one queue of a Subscriber.
+
+        Without callback, objects go into the subscriber's pending buffer read by get().
+        With callback, they go into an inbox drained on the subscriber's connection
+        thread, so callbacks run where they would run for broker messages.
+        """
+        self._subscriber = weakref.ref(subscriber)
+        self.queue_name = queue_name
+        self.mode = mode
+        self.callback = callback
+        self._inbox = deque(maxlen=queue_size if queue_size and queue_size > 0 else None)
+        self._scheduled = False
+
+    @property
+    def alive(self) -> bool:
+        return self._subscriber() is not None
+
+    def _convert(self, obj):
+        if self.mode == "readonly":
+            return readonly(obj)
+        elif self.mode == "copy":
+            return copy.deepcopy(obj)
+        return obj
+
+    def deliver(self, obj):
+        subscriber = self._subscriber()
+        if subscriber is None:
+            return
+        obj = self._convert(obj)
+        if self.callback is None:
+            pending = subscriber._pending.get(self.queue_name)
+            if pending is not None:
+                pending.append(obj)
+            return
+        self._inbox.append(obj)
+        if not self._scheduled:
+            self._scheduled = True
+            subscriber.connection.add_callback_threadsafe(self._drain)
+
+    def _drain(self):
+        # cleared first, objects appended while draining schedule another drain
+        self._scheduled = False
+        inbox = self._inbox
+        while inbox:
+            self.callback(inbox.popleft())
+
+
+class IntraProcessRegistry(object):
+    """Topic -> local subscriber endpoints of this process."""
+    def __init__(self):
+        self._endpoints = dict()  # topic -> tuple of _Endpoint, replaced on change
+        self._lock = threading.Lock()
+
+    def register(self, topic: str, endpoint: _Endpoint):
+        with self._lock:
+            endpoints = tuple(e for e in self._endpoints.get(topic, ()) if e.alive)
+            self._endpoints[topic] = endpoints + (endpoint,)
+
+    def unregister(self, topic: str, endpoint: _Endpoint):
+        with self._lock:
+            endpoints = tuple(e for e in self._endpoints.get(topic, ()) if e is not endpoint and e.alive)
+            if endpoints:
+                self._endpoints[topic] = endpoints
+            else:
+                self._endpoints.pop(topic, None)
+
+    def has_subscribers(self, topic: str) -> bool:
+        return topic in self._endpoints
+
+    def deliver(self, topic: str, obj) -> int:
+        """Hand obj to the local subscribers of topic, returns their number."""
+        endpoints = self._endpoints.get(topic, ())
+        for endpoint in endpoints:
+            endpoint.deliver(obj)
+        return len(endpoints)
+
+
+registry = IntraProcessRegistry()
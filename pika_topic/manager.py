@@ -0,0 +1,112 @@
+import pika
+import weakref
+import threading
+from typing import Callable
+
+
+class _ThreadConnection(object):
+    """Connection of one thread with its shared channel and declared exchanges."""
+    def __init__(self, parameters: pika.ConnectionParameters, connect: Callable = None):
+        self.connection = (pika.BlockingConnection if connect is None else connect)(parameters)
+        self.channel = None
+        self.declared = set()
+        self.dependents = weakref.WeakSet()
+
+
+class ConnectionManager(object):
+    def __init__(self, parameters: pika.ConnectionParameters = None, connect: Callable = None):
+        """Share connections and channels between many Publisher/Subscriber.
+
+        pika connections are not thread-safe, so the manager keeps one connection per
+        thread. Publishers created in the same thread share one channel, and every
+        exchange is declared once per connection, so starting N publishers costs one connection handshake per thread
+        instead of N.
+
+        Publisher, Subscriber and SingleSubscriber accept the manager in place of conn:
+            manager = ConnectionManager()
+            publishers = [Publisher("topic_{}".format(i), manager) for i in range(50)]
+
+        Args:
+            parameters (pika.ConnectionParameters, optional): connection parameters,
+                default connects to localhost
+            connect (Callable, optional): connect(parameters) -> connection, 
+                default is pika.BlockingConnection
+        """
+        self.parameters = parameters
+        self.connect = connect
+        self._threads = dict()  # thread ident -> _ThreadConnection
+        self._lock = threading.Lock()
+
+    def _state(self) -> _ThreadConnection:
+        ident = threading.get_ident()
+        state = self._threads.get(ident)
+        if state is None:
+            state = _ThreadConnection(self.parameters, self.connect)
+            with self._lock:
+                self._threads[ident] = state
+        return state
+
+    def connection(self) -> pika.BlockingConnection:
+        """Connection of the calling thread."""
+        return self._state().connection
+
+    def channel(self, dedicated: bool = False):
+        """Channel on the connection of the calling thread.
+
+        Args:
+            dedicated (bool, optional):
+                open a new channel instead of the shared one, needed by users
+                that change the channel state (consumers, qos, publisher confirms)
+        """
+        state = self._state()
+        if dedicated:
+            return state.connection.channel()
+        if state.channel is None or not state.channel.is_open:
+            state.channel = state.connection.channel()
+        return state.channel
+
+    def declare_exchange(self, exchange: str, exchange_type: str = "fanout"):
+        """Declare exchange once per connection.
+
+        Waits for the broker reply: publishers on dedicated channels may publish
+        to the exchange as soon as this returns, and a failed declaration raises
+        here (the broker closes the shared channel, it is reopened on next use).
+        """
+        state = self._state()
+        if exchange in state.declared:
+            return
+        self.channel().exchange_declare(exchange, exchange_type=exchange_type, auto_delete=False)
+        state.declared.add(exchange)
+
+    def register(self, dependent):
+        """Register a Publisher/Subscriber to be reconnected by reconnect().
+
+        The dependent should implement `_on_reconnect()`, which fetches its
+        connection and channels from the manager again.
+        """
+        self._state().dependents.add(dependent)
+
+    def reconnect(self):
+        """Open a new connection for the calling thread and reconnect all its dependents."""
+        old = self._state()
+        if old.connection.is_open:
+            try:
+                old.connection.close()
+            except Exception:
+                pass
+        state = _ThreadConnection(self.parameters, self.connect)
+        state.dependents = old.dependents
+        with self._lock:
+            self._threads[threading.get_ident()] = state
+        for dependent in list(state.dependents):
+            dependent._on_reconnect()
+
+    def close(self):
+        """Close the connections of all threads. Call from the threads owning them,
+        or after those threads stopped."""
+        with self._lock:
+            states = list(self._threads.values())
+            self._threads.clear()
+        for state in states:
+            if state.connection.is_open:
+                state.connection.close()
@@ -0,0 +1,364 @@
+import copy
+import time
+import pika
+import struct
+from typing import Union
+from .codec import Codec, DEFAULT_CODEC, get_codec
+from .compress import Compression, get_compression
+from .shm import ShmRing, ShmReader, StaleSlotError, SHM_CONTENT_TYPE, INNER_CONTENT_TYPE_HEADER
+from .intra import ORIGIN_HEADER, PROCESS_TOKEN
+from .chunk import ChunkSplitter, ChunkAssembler, CHUNK_ID_HEADER
+
+
+BATCH_CONTENT_TYPE = "application/x-pika-topic-batch"
+BATCH_INNER_CONTENT_TYPE_HEADER = "x-batch-content-type"
+# number of messages of a batch, readable without unpacking (or decompressing) it
+BATCH_COUNT_HEADER = "x-batch-count"
+
+STAMP_HEADER = "x-stamp"
+
+_U32 = struct.Struct("<I")
+
+
+def with_headers(properties: pika.BasicProperties, headers: dict) -> pika.BasicProperties:
+    """Copy of properties with extra headers."""
+    properties = copy.copy(properties)
+    if properties.headers:
+        merged = dict(properties.headers)
+        merged.update(headers)
+        properties.headers = merged
+    else:
+        properties.headers = headers
+    return properties
+
+
+def pack_batch(bodies: list) -> bytes:
+    """Pack several message bodies into one envelope: [u32 n]([u32 len][body]) * n"""
+    parts = [_U32.pack(len(bodies))]
+    for b in bodies:
+        parts.append(_U32.pack(len(b)))
+        parts.append(b)
+    return b"".join(parts)
+
+
+def unpack_batch(envelope) -> list:
+    """Split an envelope into memoryviews of the packed bodies.
+
+    Raises:
+        ValueError: the envelope is truncated or has trailing bytes
+    """
+    view = memoryview(envelope)
+    size = len(view)
+    if size < _U32.size:
+        raise ValueError("batch envelope of {} bytes has no message count".format(size))
+    n, = _U32.unpack_from(view, 0)
+    offset = _U32.size
+    bodies = []
+    for i in range(n):
+        if offset + _U32.size > size:
+            raise ValueError("batch envelope truncated at the length of message {}/{}".format(i, n))
+        length, = _U32.unpack_from(view, offset)
+        offset += _U32.size
+        if offset + length > size:
+            raise ValueError("batch envelope truncated in message {}/{}".format(i, n))
+        bodies.append(view[offset:offset+length])
+        offset += length
+    if offset != size:
+        raise ValueError("batch envelope has {} trailing bytes".format(size - offset))
+    return bodies
+
+
+class MessageEncoder(object):
+    def __init__(
+        self,
+        codec: Codec = None,
+        shm_slots: int = 0,
+        shm_slot_size: int = 16 << 20,
+        shm_threshold: int = 64 << 10,
+        compression: Union[str, Compression] = None,
+        compress_threshold: int = 4 << 10,
+        compress_min_ratio: float = 0.9,
+        chunk_size: int = 0
+    ):
+        """Turn python objects into (body, properties) of AMQP messages.
+
+        See Publisher for the meaning of the arguments.
+        """
+        self.codec = DEFAULT_CODEC if codec is None else codec
+        self.properties = pika.BasicProperties(content_type=self.codec.content_type)
+
+        self.shm_ring = None
+        self.shm_threshold = shm_threshold
+        if shm_slots > 0:
+            self.shm_ring = ShmRing(shm_slots, shm_slot_size)
+            self.shm_properties = pika.BasicProperties(
+                content_type=SHM_CONTENT_TYPE,
+                headers={INNER_CONTENT_TYPE_HEADER: self.codec.content_type}
+            )
+        self.batch_properties = pika.BasicProperties(
+            content_type=BATCH_CONTENT_TYPE,
+            headers={BATCH_INNER_CONTENT_TYPE_HEADER: self.codec.content_type}
+        )
+        
+        self.compression = None if compression is None else get_compression(compression)
+        self.compress_threshold = compress_threshold
+        self.compress_min_ratio = compress_min_ratio
+        # after a poorly compressed message, skip compression for the next `_backoff` 
+        # messages, doubled on every further poor result
+        self._backoff = 0
+        self._skip = 0
+        self.compression_stats = {
+            "compressed": 0,
+            "skipped_small": 0,
+            "skipped_ratio": 0,
+            "skipped_backoff": 0,
+            "bytes_in": 0,
+            "bytes_out": 0,
+            "cpu_seconds": 0.0,
+        }
+        self.splitter = ChunkSplitter(chunk_size) if chunk_size > 0 else None
+
+    def add_headers(self, headers: dict):
+        """Add headers to every message, the properties objects are kept."""
+        properties = [self.properties, self.batch_properties]
+        if self.shm_ring is not None:
+            properties.append(self.shm_properties)
+        for p in properties:
+            p.headers = dict(p.headers or {}, **headers)
+
+    def encode(self, obj):
+        """Returns (body, properties), the body may be a shared memory descriptor."""
+        bdata = self.codec.encode(obj)
+        ring = self.shm_ring
+        if ring is not None and self.shm_threshold <= len(bdata) <= ring.slot_size:
+            return ring.write(bdata), self.shm_properties
+        else:
+            return bdata, self.properties
+
+    def compress(self, body: bytes, properties: pika.BasicProperties):
+        """Compress an inline body if enabled and worth it, returns (body, properties)."""
+        if self.compression is None or properties.content_type == SHM_CONTENT_TYPE \
+                or properties.content_encoding:
+            # nothing to do, shared memory descriptor or already compressed
+            return body, properties
+        stats = self.compression_stats
+        if len(body) < self.compress_threshold:
+            stats["skipped_small"] += 1
+            return body, properties
+        if self._skip > 0:
+            self._skip -= 1
+            stats["skipped_backoff"] += 1
+            return body, properties
+        
+        t0 = time.process_time()
+        compressed = self.compression.compress(body)
+        stats["cpu_seconds"] += time.process_time() - t0
+        stats["bytes_in"] += len(body)
+        if len(compressed) > self.compress_min_ratio * len(body):
+            stats["bytes_out"] += len(body)
+            stats["skipped_ratio"] += 1
+            self._backoff = min(max(2 * self._backoff, 1), 256)
+            self._skip = self._backoff
+            return body, properties
+        
+        self._backoff = 0
+        stats["compressed"] += 1
+        stats["bytes_out"] += len(compressed)
+        properties = copy.copy(properties)
+        properties.content_encoding = self.compression.encoding
+        return compressed, properties
+    
+    def split(self, body, properties: pika.BasicProperties) -> list:
+        """[(body, properties)] of the AMQP messages to send, chunks of body if it is too large."""
+        splitter = self.splitter
+        if splitter is None or len(body) <= splitter.chunk_size:
+            return [(body, properties)]
+        return list(splitter.split(body, properties))
+
+    def compression_ratio(self) -> float:
+        """Sent / original size of the bodies that went through the compressor."""
+        stats = self.compression_stats
+        return stats["bytes_out"] / stats["bytes_in"] if stats["bytes_in"] else 1.0
+
+    def close(self):
+        if self.shm_ring is not None:
+            self.shm_ring.close()
+            self.shm_ring = None
+
+
+class LazyMessage(object):
+    """A received message, decoded on the first access of `data`.
+
+    Its headers (e.g. the "x-stamp" stamp) and size are available without
+    decoding it, see Subscriber.subscribe(lazy=True).
+    """
+    __slots__ = ("topic", "properties", "body", "codec", "_data")
+    _NOT_DECODED = object()
+
+    def __init__(self, codec: Codec, body, properties: pika.BasicProperties, topic: str = None):
+        self.topic = topic
+        self.properties = properties
+        self.body = body  # encoded, after decompression
+        self.codec = codec
+        self._data = self._NOT_DECODED
+
+    @property
+    def headers(self) -> dict:
+        return self.properties.headers or {}
+
+    @property
+    def stamp(self) -> float:
+        return self.headers.get(STAMP_HEADER)
+
+    @property
+    def size(self) -> int:
+        return len(self.body)
+
+    @property
+    def decoded(self) -> bool:
+        return self._data is not self._NOT_DECODED
+
+    @property
+    def data(self):
+        if self._data is self._NOT_DECODED:
+            self._data = self.codec.decode(self.body)
+        return self._data
+
+    def __repr__(self):
+        return "LazyMessage(topic={!r}, size={}, decoded={})".format(self.topic, self.size, self.decoded)
+
+
+class Conflation(object):
+    """Newest undelivered message of a conflating queue (of each topic of a
+    hierarchical queue), and its counters.
+
+    delivered: messages handed out
+    skipped: older messages dropped without being decoded (a skipped batch counts once)
+    conflated: delivered messages which superseded at least one skipped message
+    """
+    def __init__(self, by_topic: bool = False):
+        self.by_topic = by_topic
+        self.latest = dict()  # routing key (None unless by_topic) -> (properties, body, routing_key)
+        self.deliver = None  # called with each item of latest when flushed, None for get()
+        self.delivered = 0
+        self.skipped = 0
+        self.conflated = 0
+        self._stale = False
+
+    def put(self, item):
+        key = item[2] if self.by_topic else None
+        # popped first, so the items stay in arrival order
+        if self.latest.pop(key, None) is not None:
+            self.skip()
+        self.latest[key] = item
+
+    def take(self):
+        """Oldest item of latest, None if empty."""
+        if not self.latest:
+            return None
+        return self.latest.pop(next(iter(self.latest)))
+
+    def skip(self, n: int = 1):
+        self.skipped += n
+        self._stale = True
+
+    def count(self, skipped: int = 0):
+        """Count a delivered message, which superseded `skipped` messages of its batch."""
+        if skipped:
+            self.skip(skipped)
+        self.delivered += 1
+        if self._stale:
+            self.conflated += 1
+            self._stale = False
+
+    def counters(self) -> dict:
+        return {"delivered": self.delivered, "skipped": self.skipped, "conflated": self.conflated}
+
+
+class MessageDecoder(object):
+    """Turn received AMQP messages back into python objects."""
+    def __init__(self, chunk_timeout: float = 30.0):
+        self.shm_queues = set()
+        self.shm_reader = None
+        self.shm_stale_drops = 0
+        # queues fed by the intra-process registry, broker copies of messages 
+        # published by this process are dropped
+        self.local_queues = set()
+        self.chunks = ChunkAssembler(chunk_timeout)
+
+    def forget(self, queue_name: str):
+        """Drop the per-queue settings of an unsubscribed queue."""
+        self.shm_queues.discard(queue_name)
+        self.local_queues.discard(queue_name)
+        self.chunks.forget(queue_name)
+
+    def assemble(self, queue_name: str, properties, body):
+        """Reassemble chunked messages, see chunk.ChunkAssembler.
+
+        Returns:
+            message (tuple or None): 
+                (properties, body) of a whole message, None if the delivery is a 
+                chunk of a message which is not complete yet
+        """
+        chunks = self.chunks
+        if chunks.partials:
+            chunks.expire()
+        headers = properties.headers
+        if not headers or CHUNK_ID_HEADER not in headers:
+            return properties, body
+        return chunks.add(queue_name, properties, body)
+
+    def decode(self, queue_name: str, properties, body) -> list:
+        """Decode a delivery into a list of messages (empty if it should be dropped)."""
+        codec, bodies = self.unwrap(queue_name, properties, body)
+        return [codec.decode(b) for b in bodies]
+
+    def unwrap(self, queue_name: str, properties, body):
+        """Undo chunking, compression, shared memory and batching of a delivery without decoding it.
+
+        Returns:
+            codec (Codec): codec of the messages
+            bodies (list): encoded messages (empty if the delivery should be dropped)
+        """
+        if queue_name in self.local_queues and properties.headers \
+                and properties.headers.get(ORIGIN_HEADER) == PROCESS_TOKEN:
+            return None, []
+        message = self.assemble(queue_name, properties, body)
+        if message is None:
+            return None, []
+        properties, body = message
+        if properties.content_encoding:
+            try:
+                compression = get_compression(properties.content_encoding)
+            except ValueError as e:
+                print("[WARN] Drop message on queue {}: {}.".format(queue_name, e))
+                return None, []
+            body = compression.decompress(body)
+        content_type = properties.content_type
+        if content_type == SHM_CONTENT_TYPE:
+            if queue_name not in self.shm_queues:
+                print("[WARN] Drop shared memory message on queue {}, "
+                      "subscribe with shm=True to receive it.".format(queue_name))
+                return None, []
+            if self.shm_reader is None:
+                self.shm_reader = ShmReader()
+            try:
+                body = self.shm_reader.read(body)
+            except StaleSlotError:
+                self.shm_stale_drops += 1
+                return None, []
+            content_type = properties.headers[INNER_CONTENT_TYPE_HEADER]
+        if content_type == BATCH_CONTENT_TYPE:
+            codec = get_codec(properties.headers[BATCH_INNER_CONTENT_TYPE_HEADER])
+            try:
+                bodies = unpack_batch(body)
+            except ValueError as e:
+                print("[WARN] Drop malformed batch on queue {}: {}.".format(queue_name, e))
+                return None, []
+            count = properties.headers.get(BATCH_COUNT_HEADER, len(bodies))
+            if count != len(bodies):
+                print("[WARN] Drop malformed batch on queue {}: {} messages, {} expected."
+                      .format(queue_name, len(bodies), count))
+                return None, []
+            return codec, bodies
+        return get_codec(content_type), [body]
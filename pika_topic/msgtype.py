@@ -0,0 +1,151 @@
+import zlib
+import struct
+import typing
+import operator
+import dataclasses
+import numpy as np
+from .codec import Codec, register_codec, get_codec
+
+
+STRUCT_CONTENT_TYPE = "application/x-pika-topic-struct"
+
+_SCALARS = {
+    float: np.dtype("<f8"),
+    int: np.dtype("<i8"),
+    bool: np.dtype("?"),
+}
+# (kind, itemsize) -> struct format with standard sizes
+_STRUCT_CHARS = {
+    ("f", 2): "e", ("f", 4): "f", ("f", 8): "d",
+    ("i", 1): "b", ("i", 2): "h", ("i", 4): "i", ("i", 8): "q",
+    ("u", 1): "B", ("u", 2): "H", ("u", 4): "I", ("u", 8): "Q",
+    ("b", 1): "?",
+}
+
+
+class Array(object):
+    def __init__(self, dtype, shape):
+        """Annotation of a fixed-shape array field of a message type.
+
+        Example:
+            @message_type
+            @dataclass
+            class JointState:
+                stamp: float
+                position: Array(np.float64, (7,))
+        """
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.shape = (shape,) if isinstance(shape, int) else tuple(shape)
+
+    def __repr__(self):
+        return "Array({}, {})".format(self.dtype, self.shape)
+
+
+def _field_dtype(annotation):
+    if isinstance(annotation, Array):
+        return annotation.dtype, annotation.shape
+    if annotation in _SCALARS:
+        return _SCALARS[annotation], ()
+    if isinstance(annotation, type) and issubclass(annotation, np.generic) \
+            and (np.dtype(annotation).kind, np.dtype(annotation).itemsize) in _STRUCT_CHARS:
+        return np.dtype(annotation).newbyteorder("<"), ()
+    raise TypeError("unsupported field type: {!r}, use float, int, bool, "
+                    "a numpy scalar type or Array(dtype, shape)".format(annotation))
+
+
+class StructCodec(Codec):
+    """Fixed layout codec of a dataclass message type, see message_type.
+
+    The fields are packed back to back in little endian, in declaration
+    order, with a precompiled struct.Struct: scalars as themselves, arrays as
+    their raw bytes. The layout is the one of `dtype` (a packed numpy
+    structured dtype), so a run of bodies is also a structured array, see
+    decode_array. The type id is part of the content type, e.g.
+    "application/x-pika-topic-struct;id=1a2b3c4d".
+    """
+    def __init__(self, cls, type_id: int = None):
+        assert dataclasses.is_dataclass(cls), "message types should be dataclasses"
+        hints = typing.get_type_hints(cls)
+        names = [f.name for f in dataclasses.fields(cls)]
+        descr = []
+        fmt = ["<"]
+        arrays = []  # (position, dtype, shape) of the array fields
+        for i, name in enumerate(names):
+            dtype, shape = _field_dtype(hints[name])
+            descr.append((name, dtype, shape) if shape else (name, dtype))
+            if shape:
+                arrays.append((i, dtype, shape))
+                fmt.append("{}s".format(dtype.itemsize * int(np.prod(shape))))
+            else:
+                fmt.append(_STRUCT_CHARS[dtype.kind, dtype.itemsize])
+        if type_id is None:
+            type_id = zlib.crc32("{}.{}".format(cls.__module__, cls.__qualname__).encode())
+        self.cls = cls
+        self.type_id = type_id
+        self.content_type = "{};id={:08x}".format(STRUCT_CONTENT_TYPE, type_id)
+        self.names = names
+        self.dtype = np.dtype(descr)
+        self.arrays = arrays
+        self._struct = struct.Struct("".join(fmt))
+        assert self._struct.size == self.dtype.itemsize
+        self.size = self._struct.size
+        getter = operator.attrgetter(*names)
+        self._values = getter if len(names) > 1 else lambda obj: (getter(obj),)
+
+    def encode(self, obj) -> bytes:
+        values = self._values(obj)
+        if self.arrays:
+            values = list(values)
+            for i, dtype, shape in self.arrays:
+                array = np.asarray(values[i], dtype=dtype)
+                assert array.shape == shape, "field {} should have shape {}, got {}".format(
+                    self.names[i], shape, array.shape)
+                values[i] = array.tobytes()
+        return self._struct.pack(*values)
+
+    def decode(self, body):
+        values = self._struct.unpack(body)
+        if self.arrays:
+            values = list(values)
+            for i, dtype, shape in self.arrays:
+                values[i] = np.frombuffer(values[i], dtype=dtype).reshape(shape)
+        return self.cls(*values)
+
+    def decode_array(self, bodies) -> np.ndarray:
+        """Decode several bodies at once into one structured array of dtype `self.dtype`."""
+        return np.frombuffer(b"".join(bodies), dtype=self.dtype)
+
+    def to_record(self, obj) -> bytes:
+        """Body of obj, also accepts a record of a structured array."""
+        if isinstance(obj, np.void) and obj.dtype == self.dtype:
+            return obj.tobytes()
+        return self.encode(obj)
+
+
+def message_type(cls=None, type_id: int = None):
+    """Class decorator registering a dataclass as a struct message type.
+
+    The codec is stored as `cls.codec`, publish with it and any process which
+    imported the class decodes the messages back to instances:
+
+        publisher = Publisher("joint_states", codec=JointState.codec)
+        publisher.publish(JointState(time.time(), np.zeros(7)))
+
+    Args:
+        type_id (int, optional):
+            32 bit id of the type, default is the crc32 of its qualified name.
+            Set it if publishers and subscribers import the class from different modules
+    """
+    def wrap(cls):
+        codec = StructCodec(cls, type_id)
+        try:
+            registered = get_codec(codec.content_type)
+        except ValueError:
+            registered = None
+        if registered is not None and registered.cls is not cls \
+                and registered.cls.__qualname__ != cls.__qualname__:
+            raise ValueError("type id {:08x} of {} is used by {}".format(
+                codec.type_id, cls.__qualname__, registered.cls.__qualname__))
+        cls.codec = register_codec(codec)
+        return cls
+    return wrap if cls is None else wrap(cls)
@@ -0,0 +1,37 @@
+from collections import namedtuple
+
+
+# shared topic exchange of the hierarchical topics, the topic is the routing key
+NAMESPACE_EXCHANGE = "pika_topic.namespace"
+
+# message of a hierarchical subscription, with the topic it was published to
+TopicMessage = namedtuple("TopicMessage", ["topic", "data"])
+
+
+def is_pattern(topic: str) -> bool:
+    """Whether a hierarchical topic contains the "*" or "#" wildcards."""
+    return any(word in ("*", "#") for word in topic.split("."))
+
+
+def check_topic(topic: str):
+    """Raise ValueError if topic is not a valid hierarchical topic to publish to."""
+    if not topic or len(topic.encode()) > 255:
+        raise ValueError("hierarchical topics should have 1 to 255 bytes: {!r}".format(topic))
+    if is_pattern(topic):
+        raise ValueError("cannot publish to a pattern: {!r}".format(topic))
+
+
+def topic_match(pattern: str, key: str) -> bool:
+    """AMQP topic matching, "*" matches one word and "#" zero or more words."""
+    p = pattern.split(".")
+    k = key.split(".")
+    def match(i, j):
+        if i == len(p):
+            return j == len(k)
+        if p[i] == "#":
+            return any(match(i + 1, jj) for jj in range(j, len(k) + 1))
+        if j == len(k):
+            return False
+        return (p[i] == "*" or p[i] == k[j]) and match(i + 1, j + 1)
+    return match(0, 0)
+
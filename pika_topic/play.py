@@ -0,0 +1,129 @@
+import time
+import pika
+import argparse
+from .bag import BagReader
+from .pub import Publisher
+from .rate import Rate
+from .timer import TimerExecutor
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description="Replay a bag directory recorded by pika_topic.record.")
+    default_param = pika.ConnectionParameters
+    parser.add_argument("bag", type=str, help="bag directory")
+    parser.add_argument("-i", "--info", action="store_true", help="print the content of the bag and exit")
+    parser.add_argument("-t", "--topics", type=str, default="",
+                        help="comma separated topics to replay, default is all the recorded topics")
+    parser.add_argument("-s", "--start", type=float, default=0,
+                        help="skip the first seconds of the bag, default is 0")
+    parser.add_argument("-d", "--duration", type=float, default=0,
+                        help="replay at most this many seconds of the bag, default (0) replays to the end")
+    parser.add_argument("-r", "--scale", type=float, default=1.0,
+                        help="replay speed factor, 2 replays twice as fast, default is 1 (real time)")
+    parser.add_argument("-f", "--fast", action="store_true",
+                        help="publish as fast as possible, ignoring the recorded timing")
+    parser.add_argument("--hz", type=float, default=0,
+                        help="publish at a fixed rate in Hz instead of the recorded timing")
+    parser.add_argument("-l", "--loop", action="store_true", help="replay in a loop until Ctrl+C")
+    parser.add_argument("--sleep_mode", type=str, default="hybrid", choices=["sleep", "hybrid", "spin"],
+                        help="how to wait between messages, see TimerExecutor, default is hybrid")
+    parser.add_argument("-ip", "--ip", type=str, default=default_param.DEFAULT_HOST,
+                        help=f"address of rabbitmq-server, default is {default_param.DEFAULT_HOST}")
+    parser.add_argument("-pp", "--pika_port", type=int, default=default_param.DEFAULT_PORT,
+                        help=f"port of rabbitmq-server, default is {default_param.DEFAULT_PORT}")
+    default_auth = "@".join([default_param.DEFAULT_USERNAME, default_param.DEFAULT_PASSWORD])
+    parser.add_argument("-a", "--auth", type=str, default=default_auth,
+                        help=f"auth to establish connection to host, format is username@passwd, default is {default_auth}")
+    opt = parser.parse_args()
+    return opt
+
+
+class Player(object):
+    def __init__(self, bag: BagReader, connection, topics: list = None, sleep_mode: str = "hybrid"):
+        """Republish the messages of a bag with one Publisher per topic on one connection.
+
+        Bodies are published as recorded (publish_raw), without decoding them.
+        """
+        self.bag = bag
+        self.connection = connection
+        self.topics = bag.topics if topics is None else topics
+        self.publishers = {t: Publisher(t, connection, hierarchical=t in bag.hierarchical) for t in self.topics}
+        self.executor = TimerExecutor(connection, sleep_mode)
+        self.sleep_mode = sleep_mode
+        self.count = 0
+
+    def play(self, start: float = None, end: float = None, scale: float = 1.0, fast: bool = False,
+             hz: float = 0):
+        """Replay the messages received between start and end (bag time).
+
+        Args:
+            start (float, optional): bag time to start from, default is the beginning
+            end (float, optional): bag time to stop at, default is the end
+            scale (float, optional): speed factor of the recorded timing
+            fast (bool, optional): ignore the timing, publish as fast as possible
+            hz (float, optional): ignore the timing, publish at this fixed rate
+        """
+        messages = self.bag.messages(self.topics, start, end)
+        publishers = self.publishers
+        if fast:
+            for topic, _, properties, body in messages:
+                publishers[topic].publish_raw(body, properties)
+                self.count += 1
+            return
+        if hz > 0:
+            rate = Rate(hz, self.sleep_mode, self.connection)
+            for topic, _, properties, body in messages:
+                rate.sleep()
+                publishers[topic].publish_raw(body, properties)
+                self.count += 1
+            return
+        t0 = None
+        for topic, stamp, properties, body in messages:
+            if t0 is None:
+                # deadlines are relative to the first message, so they do not drift
+                t0 = time.perf_counter()
+                first = stamp
+            else:
+                self.executor.wait_until(t0 + (stamp - first) / scale)
+            publishers[topic].publish_raw(body, properties)
+            self.count += 1
+
+    def close(self):
+        for publisher in self.publishers.values():
+            publisher.close()
+
+
+def main():
+    opt = parse_opt()
+    bag = BagReader(opt.bag)
+    if opt.info or bag.start is None:
+        print("[INFO] Bag: {}, {} messages, {:.3f}s".format(
+            opt.bag, bag.count(), 0 if bag.start is None else bag.end - bag.start))
+        for topic in bag.topics:
+            print("    {}: {}".format(topic, bag.count(topic)))
+        return
+
+    topics = [t.strip() for t in opt.topics.split(",") if t.strip()] or None
+    start = bag.start + opt.start
+    end = start + opt.duration if opt.duration > 0 else None
+    username, password = opt.auth.strip().split("@")
+    cred = pika.PlainCredentials(username, password)
+    connection = pika.BlockingConnection(pika.ConnectionParameters(
+        host=opt.ip, port=opt.pika_port, credentials=cred))
+    player = Player(bag, connection, topics, opt.sleep_mode)
+    try:
+        while True:
+            print("[INFO] Playing {}...".format(opt.bag))
+            player.play(start, end, opt.scale, opt.fast, opt.hz)
+            if not opt.loop:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("[INFO] Published {} messages.".format(player.count))
+        player.close()
+        bag.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,486 @@
+import time
 import pika
-import pickle
 import traceback
 import pika.exceptions
+from typing import Union
+from collections import deque
+from .codec import Codec
+from .compress import Compression
+from .manager import ConnectionManager
+from .cluster import BrokerCluster
+from .message import MessageEncoder, pack_batch, with_headers, STAMP_HEADER, BATCH_COUNT_HEADER
+from .stats import Instrumenter
+from .intra import registry as intra_registry, ORIGIN_HEADER, PROCESS_TOKEN
+from .namespace import NAMESPACE_EXCHANGE, check_topic
+
+
+_CONNECTION_ERRORS = (
+    pika.exceptions.AMQPConnectionError,
+    pika.exceptions.ChannelWrongStateError,
+    pika.exceptions.ConnectionWrongStateError,
+)
+# confirms go to callbacks of the underlying channel, which do not make 
+# BlockingConnection.process_data_events return, events are processed in 
+# slices of this many seconds while waiting for them
+_CONFIRM_POLL_INTERVAL = 0.001
+
+
+class PublishBufferFull(Exception):
+    """Raised in reliable mode when the unconfirmed buffer is full and policy is "raise"."""
+    pass
 
 
 class Publisher(object):
-    def __init__(self, topic: str, conn: pika.BlockingConnection = None):
+    def __init__(
+        self, 
+        topic: str, 
+        conn: Union[pika.BlockingConnection, ConnectionManager, BrokerCluster] = None, 
+        codec: Codec = None,
+        shm_slots: int = 0,
+        shm_slot_size: int = 16 << 20,
+        shm_threshold: int = 64 << 10,
+        linger_ms: float = 0,
+        max_batch_bytes: int = 1 << 20,
+        reliable: bool = False,
+        max_unconfirmed: int = 1024,
+        buffer_policy: str = "block",
+        compression: Union[str, Compression] = None,
+        compress_threshold: int = 4 << 10,
+        compress_min_ratio: float = 0.9,
+        stamp: bool = False,
+        instrument: bool = False,
+        intra_process: bool = False,
+        remote: bool = True,
+        hierarchical: bool = False,
+        chunk_size: int = 0
+    ):
+        """Publish messages to a topic.
+
+        Args:
+            topic (str): topic name
+            conn (pika.BlockingConnection, ConnectionManager or BrokerCluster, optional): 
+                connection to use, a new local connection is created if None. 
+                With a ConnectionManager, the connection of the calling thread and 
+                its shared channel are used (a dedicated channel in reliable mode). 
+                With a BrokerCluster, the ConnectionManager of the broker owning the topic
+            codec (Codec, optional): 
+                codec to serialize messages, default is codec.PickleCodec(), plain 
+                pickle readable by subscribers that do not know about codecs. 
+                codec.Pickle5Codec() avoids copying large arrays, but only 
+                subscribers with codecs can decode it
+            shm_slots (int, optional): 
+                set > 0 to enable the same-host shared memory transport with 
+                a ring of `shm_slots` slots. Only subscribers on the same host 
+                subscribed with shm=True can read such messages
+            shm_slot_size (int, optional): max size in bytes of one slot, 
+                larger messages are sent inline
+            shm_threshold (int, optional): 
+                messages smaller than this are sent inline
+            linger_ms (float, optional): 
+                set > 0 to enable batching, messages are packed into one AMQP 
+                message until the oldest one has waited `linger_ms`, or the batch 
+                exceeds `max_batch_bytes`. The linger timer only fires when the 
+                connection processes events, publish() and flush() also check it
+            max_batch_bytes (int, optional): flush the batch above this size
+            reliable (bool, optional): 
+                enable publisher confirms. Confirms are tracked asynchronously, 
+                unconfirmed messages are kept and replayed in order after reconnecting, 
+                or after the broker nacked some of them
+            max_unconfirmed (int, optional): max number of kept unconfirmed messages
+            buffer_policy (str, optional): 
+                what to do when the unconfirmed buffer is full: "block" waits for 
+                confirms, "drop_oldest" forgets the oldest message (it will not be 
+                replayed), "raise" raises PublishBufferFull
+            compression (str or Compression, optional): 
+                compress bodies sent through the broker, "zlib", "xz" or any 
+                registered compress.Compression. The encoding is carried in the 
+                content_encoding property, subscribers decompress transparently
+            compress_threshold (int, optional): bodies smaller than this are not compressed
+            compress_min_ratio (float, optional): 
+                if compressed / original size is above this, the body is sent 
+                uncompressed and compression is skipped for the next few messages
+            stamp (bool, optional): 
+                stamp every message with time.time() in the "x-stamp" header 
+                unless publish() is given a stamp, see sync.ApproximateTimeSynchronizer
+            instrument (bool, optional): 
+                add sequence number, publisher id and send times to the headers of 
+                every AMQP message, so subscribers with stats=True can measure 
+                rate, latency and lost messages, see stats.TopicStats
+            intra_process (bool, optional): 
+                hand messages as objects to the subscribers of this process that 
+                subscribed with intra_process, without serialization nor broker. 
+                They skip the broker copy, other subscribers still get it
+            remote (bool, optional): 
+                with intra_process, set False to not publish through the broker at 
+                all when every subscriber lives in this process
+            hierarchical (bool, optional): 
+                publish to the dotted topic (e.g. "robot.7.pose") through the shared 
+                topic exchange namespace.NAMESPACE_EXCHANGE instead of a fanout 
+                exchange of its own, subscribers can then use wildcard patterns
+            chunk_size (int, optional): 
+                set > 0 to split bodies larger than this into chunks of `chunk_size` 
+                bytes, each chunk is a message of its own (compressed on its own) 
+                that subscribers reassemble transparently. For messages above the 
+                broker's max message size, or which would block the channel. Subscribers 
+                with a small queue_size may lose chunks, worker groups reject them
+        """
+        assert buffer_policy in ("block", "drop_oldest", "raise"), \
+            "unknown buffer_policy: {}".format(buffer_policy)
+        if hierarchical:
+            check_topic(topic)
+            assert not intra_process, "intra_process is not available with hierarchical topics"
         self.topic = topic
-        self.connection = pika.BlockingConnection() if conn is None else conn
-        self.channel = self.connection.channel()
-        self.channel.exchange_declare(topic, exchange_type="fanout", auto_delete=False)
+        self.hierarchical = hierarchical
+        # a fanout exchange per topic, or the shared namespace routed by topic
+        self.exchange = NAMESPACE_EXCHANGE if hierarchical else topic
+        self.routing_key = topic if hierarchical else ""
+        self.exchange_type = "topic" if hierarchical else "fanout"
+        self.stamp = stamp
+        self.instrumenter = Instrumenter() if instrument else None
+        self.intra_process = intra_process
+        self.remote = remote or not intra_process
+        self.encoder = MessageEncoder(codec, shm_slots, shm_slot_size, shm_threshold,
+                                      compression, compress_threshold, compress_min_ratio, chunk_size)
+        if intra_process:
+            self.encoder.add_headers({ORIGIN_HEADER: PROCESS_TOKEN})
+        
+        self.linger = linger_ms / 1000.0
+        self.max_batch_bytes = max_batch_bytes
+        self._batch = []
+        self._batch_bytes = 0
+        self._batch_start = None
+        self._linger_timer = None
+        self.batch_counters = {
+            "batches": 0,
+            "messages": 0,
+            "max_batch_size": 0,
+            "flush_size": 0,
+            "flush_linger": 0,
+            "flush_manual": 0,
+            "flush_close": 0,
+            "flush_bypass": 0,
+        }
+        
+        self.reliable = reliable
+        self.max_unconfirmed = max_unconfirmed
+        self.buffer_policy = buffer_policy
+        self._unconfirmed = deque()  # (delivery_tag, body, properties)
+        self._nacked = set()  # delivery tags nacked by the broker, still in _unconfirmed
+        self._delivery_tag = 0
+        self.confirm_counters = {
+            "acked": 0,
+            "nacked": 0,
+            "dropped": 0,
+            "replayed": 0,
+            "reconnects": 0,
+        }
+        
+        self.manager = None
+        if isinstance(conn, BrokerCluster):
+            conn = conn.manager_for(topic)
+        if isinstance(conn, ConnectionManager):
+            self.manager = conn
+            self.manager.register(self)
+            self.connection = self.manager.connection()
+        else:
+            self.connection = pika.BlockingConnection() if conn is None else conn
+        self._open_channel()
+    
+    def _open_channel(self):
+        if self.manager is not None:
+            self.channel = self.manager.channel(dedicated=self.reliable)
+            self.manager.declare_exchange(self.exchange, self.exchange_type)
+        else:
+            self.channel = self.connection.channel()
+            self.channel.exchange_declare(self.exchange, exchange_type=self.exchange_type, auto_delete=False)
+        # tags restart on the new channel, the whole buffer is replayed anyway
+        self._delivery_tag = 0
+        self._nacked.clear()
+        if self.reliable:
+            selected = []
+            # enable confirms on the underlying channel, so basic_publish does not 
+            # wait for each confirm like BlockingChannel.confirm_delivery does
+            self.channel._impl.confirm_delivery(
+                ack_nack_callback=self._on_confirm,
+                callback=selected.append
+            )
+            self._process_until(lambda: selected)
+
+    def _process_until(self, done, timeout: float = None) -> bool:
+        """Process events until done() is true, returns False on timeout."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while not done():
+            time_limit = _CONFIRM_POLL_INTERVAL
+            if deadline is not None:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return False
+                time_limit = min(time_limit, remaining)
+            self.connection.process_data_events(time_limit=time_limit)
+            self._resend_nacked()
+        return True
 
     def reconnect(self):
-        self.channel.close()
-        self.channel = self.connection.channel()
-        self.channel.exchange_declare(self.topic, exchange_type="fanout", auto_delete=False)
+        """Reopen the channel, or the whole connection if it is lost. 
+        
+        In reliable mode, unconfirmed messages are published again in order.
+        """
+        if self.manager is not None:
+            # reconnects all the publishers and subscribers sharing the connection
+            self.manager.reconnect()
+            return
+        
+        self.confirm_counters["reconnects"] += 1
+        self._linger_timer = None
+        if self.connection.is_open:
+            if self.channel.is_open:
+                self.channel.close()
+        else:
+            params = self.connection._impl.params
+            self.connection = pika.BlockingConnection(params)
+        self._open_channel()
+        self._replay_unconfirmed()
+    
+    def _on_reconnect(self):
+        """Called by the ConnectionManager after it opened a new connection."""
+        self.confirm_counters["reconnects"] += 1
+        self._linger_timer = None
+        self.connection = self.manager.connection()
+        self._open_channel()
+        self._replay_unconfirmed()
+    
+    def _replay_unconfirmed(self):
+        # renumber first, if the replay fails midway everything is replayed again
+        self._nacked.clear()
+        unconfirmed = self._unconfirmed
+        self._unconfirmed = deque()
+        for _, body, properties in unconfirmed:
+            self._track(body, properties)
+        for _, body, properties in list(self._unconfirmed):
+            self._basic_publish(body, properties)
+        self.confirm_counters["replayed"] += len(unconfirmed)
+    
+    def close(self):
+        """Flush pending batch, close the channel and release the shared memory ring (if any)."""
+        self._flush_batch("close")
+        self.encoder.close()
+        shared = self.manager is not None and not self.reliable
+        if self.channel.is_open and not shared:
+            self.channel.close()
 
-    def publish(self, obj):
-        bdata = pickle.dumps(obj)
+    def _on_confirm(self, method_frame):
+        method = method_frame.method
+        tag = method.delivery_tag
+        unconfirmed = self._unconfirmed
+        nacked = self._nacked
+        if isinstance(method, pika.spec.Basic.Nack):
+            # the broker failed to handle them: they stay in the buffer, which
+            # _resend_nacked publishes again in order, not here while pika
+            # dispatches events
+            tags = [m[0] for m in unconfirmed if (m[0] <= tag if method.multiple else m[0] == tag)
+                    and m[0] not in nacked]
+            nacked.update(tags)
+            self.confirm_counters["nacked"] += len(tags)
+            return
+        
+        if method.multiple:
+            confirmed = []
+            while unconfirmed and unconfirmed[0][0] <= tag:
+                confirmed.append(unconfirmed.popleft())
+            if nacked:
+                # a multiple ack does not cover the messages nacked before
+                kept = [m for m in confirmed if m[0] in nacked]
+                unconfirmed.extendleft(reversed(kept))
+                confirmed = [m for m in confirmed if m[0] not in nacked]
+        elif unconfirmed and unconfirmed[0][0] == tag:
+            confirmed = [unconfirmed.popleft()]
+        else:
+            confirmed = [m for m in unconfirmed if m[0] == tag]
+            for m in confirmed:
+                unconfirmed.remove(m)
+        self.confirm_counters["acked"] += len(confirmed)
+    
+    def _resend_nacked(self):
+        """Publish the unconfirmed messages again in order if the broker nacked some of them."""
+        if not self._nacked:
+            return
         try:
-            self.channel.basic_publish(
-                exchange=self.topic,
-                routing_key="",
-                body=bdata
-            )
-        except pika.exceptions.StreamLostError as e:
-            traceback.print_exc()
-            print("[INFO] Try reconnect.")
-            self.reconnect()
-            self.channel.basic_publish(
-                exchange=self.topic,
-                routing_key="",
-                body=bdata
-            )
+            self._replay_unconfirmed()
+        except _CONNECTION_ERRORS:
+            self._reconnect_after_error()
+    
+    def _make_room(self):
+        if len(self._unconfirmed) < self.max_unconfirmed:
+            return
+        if self.buffer_policy == "drop_oldest":
+            while len(self._unconfirmed) >= self.max_unconfirmed:
+                self._unconfirmed.popleft()
+                self.confirm_counters["dropped"] += 1
+        elif self.buffer_policy == "raise":
+            raise PublishBufferFull(
+                "{} messages of topic {} are not confirmed yet"
+                .format(len(self._unconfirmed), self.topic))
+        else:
+            self._process_until(lambda: len(self._unconfirmed) < self.max_unconfirmed)
+    
+    def _track(self, body: bytes, properties: pika.BasicProperties):
+        self._delivery_tag += 1
+        self._unconfirmed.append((self._delivery_tag, body, properties))
+    
+    def _basic_publish(self, body: bytes, properties: pika.BasicProperties):
+        self.channel.basic_publish(
+            exchange=self.exchange,
+            routing_key=self.routing_key,
+            body=body,
+            properties=properties
+        )
+    
+    def wait_for_confirms(self, timeout: float = None) -> bool:
+        """Process events until all messages are confirmed, returns False on timeout."""
+        return self._process_until(lambda: not self._unconfirmed, timeout)
+
+    def _reconnect_after_error(self):
+        traceback.print_exc()
+        print("[INFO] Try reconnect.")
+        self.reconnect()
+
+    @property
+    def compression_stats(self) -> dict:
+        """Compression counters, sizes and CPU time of this topic."""
+        stats = dict(self.encoder.compression_stats)
+        stats["ratio"] = self.encoder.compression_ratio()
+        return stats
+
+    def _send(self, body: bytes, properties: pika.BasicProperties):
+        if self.instrumenter is not None:
+            # one sequence number per message, shared by its chunks
+            properties = with_headers(properties, self.instrumenter.headers())
+        for chunk, chunk_properties in self.encoder.split(body, properties):
+            self._send_one(chunk, chunk_properties)
+
+    def _send_one(self, body: bytes, properties: pika.BasicProperties):
+        body, properties = self.encoder.compress(body, properties)
+        if not self.reliable:
+            try:
+                self._basic_publish(body, properties)
+            except _CONNECTION_ERRORS:
+                self._reconnect_after_error()
+                self._basic_publish(body, properties)
+            return
+        
+        # nacked messages go before this one
+        self._resend_nacked()
+        try:
+            self._make_room()
+        except _CONNECTION_ERRORS:
+            self._reconnect_after_error()
+            self._make_room()
+        # tracked before sending, so it is replayed if the connection is lost
+        self._track(body, properties)
+        try:
+            self._basic_publish(body, properties)
+            # non-blocking poll to handle confirms received so far
+            self.connection.process_data_events(time_limit=0)
+        except _CONNECTION_ERRORS:
+            self._reconnect_after_error()
+
+    def _flush_batch(self, reason: str):
+        if self._linger_timer is not None:
+            self.connection.remove_timeout(self._linger_timer)
+            self._linger_timer = None
+        batch = self._batch
+        if not batch:
+            return
+        self._batch = []
+        self._batch_bytes = 0
+        self._batch_start = None
+        
+        counters = self.batch_counters
+        counters["batches"] += 1
+        counters["messages"] += len(batch)
+        counters["max_batch_size"] = max(counters["max_batch_size"], len(batch))
+        counters["flush_" + reason] += 1
+        if len(batch) == 1:
+            self._send(batch[0], self.encoder.properties)
+        else:
+            properties = with_headers(self.encoder.batch_properties, {BATCH_COUNT_HEADER: len(batch)})
+            self._send(pack_batch(batch), properties)
+    
+    def _on_linger(self):
+        self._linger_timer = None
+        self._flush_batch("linger")
+    
+    def flush(self):
+        """Send the pending batch now."""
+        self._flush_batch("manual")
+    
+    def _add_to_batch(self, bdata: bytes):
+        if self._batch_start is None:
+            self._batch_start = time.perf_counter()
+            self._linger_timer = self.connection.call_later(self.linger, self._on_linger)
+        self._batch.append(bdata)
+        self._batch_bytes += len(bdata)
+        if self._batch_bytes >= self.max_batch_bytes:
+            self._flush_batch("size")
+        elif time.perf_counter() - self._batch_start >= self.linger:
+            self._flush_batch("linger")
+
+    def publish(self, obj, stamp: float = None):
+        """Publish a message.
+
+        Args:
+            obj (Any): message
+            stamp (float, optional): 
+                timestamp (seconds) of the message, carried in the "x-stamp" header 
+                so it can be read without deserializing the message. Stamped 
+                messages are not batched
+        """
+        if self.intra_process:
+            intra_registry.deliver(self.topic, obj)
+            if not self.remote:
+                return
+        bdata, properties = self.encoder.encode(obj)
+        if stamp is None and self.stamp:
+            stamp = time.time()
+        if stamp is not None:
+            properties = with_headers(properties, {STAMP_HEADER: float(stamp)})
+        
+        if self.linger > 0 and properties is self.encoder.properties:
+            self._add_to_batch(bdata)
+        else:
+            # keep order, messages batched earlier go first
+            self._flush_batch("bypass")
+            self._send(bdata, properties)
+    
+    def publish_many(self, objs):
+        """Publish several messages packed into as few AMQP messages as possible.
+        
+        Subscribers receive them one by one, as if published with publish().
+        With stamp=True every message is stamped, so none is batched.
+        """
+        for obj in objs:
+            if self.intra_process:
+                intra_registry.deliver(self.topic, obj)
+                if not self.remote:
+                    continue
+            bdata, properties = self.encoder.encode(obj)
+            if self.stamp:
+                properties = with_headers(properties, {STAMP_HEADER: time.time()})
+            if properties is not self.encoder.properties:
+                self._flush_batch("bypass")
+                self._send(bdata, properties)
+                continue
+            self._batch.append(bdata)
+            self._batch_bytes += len(bdata)
+            if self._batch_bytes >= self.max_batch_bytes:
+                self._flush_batch("size")
+        self._flush_batch("manual")
+
+    def publish_raw(self, body: bytes, properties: pika.BasicProperties):
+        """Publish an already encoded message (e.g. recorded by pika_topic.record) as is.
 
+        The body is not encoded again, and not compressed again if
+        properties.content_encoding is set.
+        """
+        self._flush_batch("bypass")
+        self._send(body, properties)
@@ -1,29 +1,33 @@
 import time
+from .timer import Timer, TimerExecutor
 
 
 class Rate(object):
-    def __init__(self, hz: float):
+    def __init__(self, hz: float, sleep_mode: str = "hybrid", connection=None):
+        """Pace a loop at hz, a thin wrapper over a TimerExecutor with one timer.
+
+        Args:
+            hz (float): loop frequency
+            sleep_mode (str, optional): "sleep", "hybrid" or "spin", see TimerExecutor
+            connection (pika.BlockingConnection, optional):
+                process the events of this connection while sleeping
+        """
         self.hz = hz
         self.dt = 1.0 / hz
         self.last_sleep = None
-        self.short_sleep_thresh = 1e-4
-    
-    def __sleep(self, current: float, to_sleep: float):
-        if to_sleep > self.short_sleep_thresh:
-            time.sleep(to_sleep)
-            last_sleep = current + max(to_sleep, 0)
-        else:
-            desired = current + to_sleep
-            while current < desired:
-                current = time.perf_counter()
-            last_sleep = max(current, desired)
-        return last_sleep
-    
+        self.executor = TimerExecutor(connection, sleep_mode)
+        self.timer = Timer(self.dt)
+
     def sleep(self):
+        """Sleep until the next period, the first call returns immediately."""
         if self.last_sleep is None:
             self.last_sleep = time.perf_counter()
-        else:
-            current = time.perf_counter()
-            to_sleep = self.dt - (current - self.last_sleep)
-            self.last_sleep = self.__sleep(current, to_sleep)
+            self.timer.start(self.last_sleep)
+            return
+        self.executor.wait_until(self.timer.deadline, self.dt)
+        self.last_sleep = time.perf_counter()
+        self.timer._fired(self.last_sleep)
 
+    def stats(self) -> dict:
+        """Overruns, missed periods and lateness, see Timer.stats."""
+        return self.timer.stats()
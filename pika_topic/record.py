@@ -0,0 +1,190 @@
+import time
+import pika
+import queue
+import argparse
+import threading
+from ._utils import *
+from .bag import BagWriter
+from .sub import Subscriber
+from .echo import select_matches
+from .intra import ORIGIN_HEADER
+from .shm import ShmReader, StaleSlotError, SHM_CONTENT_TYPE, INNER_CONTENT_TYPE_HEADER
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description="Record topics to a bag directory, replay it with pika_topic.play.")
+    default_param = pika.ConnectionParameters
+    parser.add_argument("-n", "--name", type=str, default="", help="re pattern to filter name of queried exchanges")
+    parser.add_argument("-u", "--user", type=str, default="", help="re pattern to filter user of queried exchanges")
+    parser.add_argument("-v", "--vhost", type=str, default="", help="re pattern to filter vhost of queried exchanges")
+    parser.add_argument("-t", "--topics", type=str, default="",
+                        help="comma separated topics to record, skips the query of the management API")
+    parser.add_argument("-A", "--all", action="store_true",
+                        help="record all the matched exchanges instead of selecting some")
+    parser.add_argument("-N", "--namespace", type=str, default="",
+                        help="record the hierarchical topics matching this pattern, e.g. robot.*.pose or #")
+    parser.add_argument("-o", "--output", type=str, default="",
+                        help="bag directory, default is bag-<date>-<time>")
+    parser.add_argument("-s", "--segment_size", type=int, default=1024,
+                        help="size in MB of the segment files, default is 1024")
+    parser.add_argument("-d", "--duration", type=float, default=0,
+                        help="stop after this many seconds, default (0) records until Ctrl+C")
+    parser.add_argument("-ip", "--ip", type=str, default=default_param.DEFAULT_HOST,
+                        help="address of server hosting rabbitmq-server and rabbitmq_management, "
+                            f"default is {default_param.DEFAULT_HOST}")
+    parser.add_argument("-mp", "--manage_port", type=int, default=15672,
+                        help="port of rabbitmq_management, default is 15672")
+    parser.add_argument("-pp", "--pika_port", type=int, default=default_param.DEFAULT_PORT,
+                        help=f"address of rabbitmq-server, default is {default_param.DEFAULT_PORT}")
+    default_auth = "@".join([default_param.DEFAULT_USERNAME, default_param.DEFAULT_PASSWORD])
+    parser.add_argument("-a", "--auth", type=str, default=default_auth,
+                        help=f"auth to establish connection to host, format is username@passwd, default is {default_auth}")
+    opt = parser.parse_args()
+    if not opt.output:
+        opt.output = time.strftime("bag-%Y%m%d-%H%M%S")
+    return opt
+
+
+class Recorder(object):
+    def __init__(self, subscriber: Subscriber, topics: list, path: str, segment_size: int = 1 << 30,
+                 backlog_warn: int = 10000, patterns: list = ()):
+        """Record the raw messages of several topics to a bag directory.
+
+        Messages are received undecoded on the connection thread, stamped and
+        handed to a writer thread which appends them to the segment files with
+        large buffered writes, so the connection keeps draining the queues
+        while the disk is busy. The hand-over queue is unbounded, nothing is
+        dropped, a warning is printed when the writer falls behind by more than
+        `backlog_warn` messages.
+
+        Shared memory messages are copied out of their slot before the hand-over,
+        the bag only contains inline bodies. Hierarchical topics matching
+        `patterns` are added to the bag when their first message arrives.
+        """
+        self.subscriber = subscriber
+        self.writer = BagWriter(path, topics, segment_size)
+        self.backlog_warn = backlog_warn
+        self.shm_reader = None
+        self.shm_stale_drops = 0
+        self._queue = queue.Queue()
+        self._warned = False
+        for topic in topics:
+            subscriber.subscribe(topic, -1, self._make_callback(topic), shm=True, raw=True)
+        for pattern in patterns:
+            # raw hierarchical callbacks are given the topic of each message
+            subscriber.subscribe(pattern, -1, self._make_callback(None), shm=True, raw=True, hierarchical=True)
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def _make_callback(self, topic: str):
+        def callback(properties, body, topic=topic):
+            stamp = time.time()
+            headers = properties.headers
+            if headers and ORIGIN_HEADER in headers:
+                headers = dict(headers)
+                del headers[ORIGIN_HEADER]
+                properties = pika.BasicProperties(
+                    content_type=properties.content_type,
+                    content_encoding=properties.content_encoding,
+                    headers=headers)
+            if properties.content_type == SHM_CONTENT_TYPE:
+                properties, body = self._resolve_shm(properties, body)
+                if body is None:
+                    return
+            self._queue.put((topic, stamp, properties, body))
+            backlog = self._queue.qsize()
+            if backlog > self.backlog_warn and not self._warned:
+                self._warned = True
+                print("[WARN] The writer is {} messages behind, the disk may be too slow.".format(backlog))
+            elif self._warned and backlog < self.backlog_warn // 2:
+                self._warned = False
+        return callback
+
+    def _resolve_shm(self, properties, body):
+        if self.shm_reader is None:
+            self.shm_reader = ShmReader()
+        try:
+            body = self.shm_reader.read(body)
+        except StaleSlotError:
+            self.shm_stale_drops += 1
+            return properties, None
+        headers = dict(properties.headers)
+        content_type = headers.pop(INNER_CONTENT_TYPE_HEADER)
+        return pika.BasicProperties(content_type=content_type, content_encoding=properties.content_encoding,
+                                    headers=headers), body
+
+    def _write_loop(self):
+        writer = self.writer
+        get = self._queue.get
+        while True:
+            item = get()
+            if item is None:
+                break
+            if item[0] not in writer._topic_ids:
+                # the fanout topics are known from the start, new ones come from patterns
+                writer.add_topic(item[0], hierarchical=True)
+            writer.write(*item)
+
+    def close(self):
+        """Write the pending messages and the indices."""
+        self._queue.put(None)
+        self._thread.join()
+        self.writer.close()
+        if self.shm_reader is not None:
+            self.shm_reader.close()
+
+    def summary(self) -> str:
+        writer = self.writer
+        lines = ["[INFO] Recorded {} messages, {:.2f}MB to {}".format(
+            sum(writer.counts), writer.bytes / 1e6, writer.path)]
+        for topic, count in zip(writer.topics, writer.counts):
+            lines.append("    {}: {}".format(topic, count))
+        if self.shm_stale_drops:
+            lines.append("[WARN] {} shared memory messages were overwritten before being recorded."
+                         .format(self.shm_stale_drops))
+        return "\n".join(lines)
+
+
+def main():
+    opt = parse_opt()
+    username, password = opt.auth.strip().split("@")
+    if opt.topics:
+        topics = [t.strip() for t in opt.topics.split(",") if t.strip()]
+    elif opt.namespace:
+        topics = []
+    else:
+        filters = []
+        if opt.name:
+            filters.append(gen_name_filter(opt.name))
+        if opt.user:
+            filters.append(gen_user_filter(opt.user))
+        if opt.vhost:
+            filters.append(gen_vhost_filter(opt.vhost))
+        ret = fetch_all_exchanges(":".join([opt.ip, str(opt.manage_port)]), username, password, opt.name)
+        matches = find_matches(filters, ret)
+        if len(matches) == 0:
+            print("[INFO] No match found.")
+            return
+        topics = [m["name"] for m in select_matches(matches, opt.all)]
+
+    cred = pika.PlainCredentials(username, password)
+    connection = pika.BlockingConnection(pika.ConnectionParameters(
+        host=opt.ip, port=opt.pika_port, credentials=cred))
+    subscriber = Subscriber(connection)
+    recorder = Recorder(subscriber, topics, opt.output, opt.segment_size << 20,
+                        patterns=[opt.namespace] if opt.namespace else [])
+    if opt.duration > 0:
+        connection.call_later(opt.duration, subscriber.channel.stop_consuming)
+    try:
+        watched = topics + ([opt.namespace] if opt.namespace else [])
+        print("[INFO] Recording {} to {}...".format(", ".join(watched), opt.output))
+        subscriber.spin()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recorder.close()
+        print(recorder.summary())
+
+
+if __name__ == "__main__":
+    main()
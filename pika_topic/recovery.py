@@ -0,0 +1,111 @@
+import time
+import random
+import pika
+from .stats import SEQ_HEADER, PUB_ID_HEADER
+
+
+# a channel in the wrong state is only recovered when its connection is gone
+CONNECTION_ERRORS = (pika.exceptions.AMQPConnectionError, pika.exceptions.ChannelWrongStateError)
+
+
+class Backoff(object):
+    def __init__(self, initial: float = 0.05, maximum: float = 5.0, multiplier: float = 2.0,
+                 jitter: float = 0.5):
+        """Exponential backoff between reconnection attempts.
+
+        The delay before attempt n (from 0) is min(initial * multiplier**n, maximum),
+        shortened by a random fraction of up to `jitter`, so the clients of a
+        broker which restarted do not all reconnect at the same time.
+        """
+        assert 0 <= jitter <= 1, "jitter should be in [0, 1]"
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.jitter = jitter
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.initial * self.multiplier ** attempt, self.maximum)
+        return delay * (1 - self.jitter * random.random())
+
+
+class Recovery(object):
+    def __init__(self, backoff: Backoff = None):
+        """Reconnection schedule and metrics of a Subscriber created with recover=True.
+
+        Counts the recoveries, the failed attempts, the outage durations and the
+        messages missed during the outages: the exclusive queues are gone with
+        the connection, so the messages published in between are lost. They are
+        counted from the gap between the last sequence number of a publisher
+        before the outage and its first one after (publishers created with
+        instrument=True), messages of other publishers are not counted.
+        """
+        self.backoff = Backoff() if backoff is None else backoff
+        self.recoveries = 0
+        self.attempts = 0  # failed attempts
+        self.last_outage = 0.0
+        self.total_outage = 0.0
+        self.missed = 0
+        self.down_since = None
+        self.next_attempt = 0.0
+        self._attempt = 0
+        self._last_seq = dict()  # (queue_name, pub_id) -> seq
+        self._unchecked = set()  # keys of _last_seq without message since the last recovery
+
+    @property
+    def connected(self) -> bool:
+        return self.down_since is None
+
+    def lost(self) -> bool:
+        """Start an outage, returns False if already in one."""
+        if self.down_since is not None:
+            return False
+        self.down_since = time.monotonic()
+        self._attempt = 0
+        self.next_attempt = self.down_since + self.backoff.delay(0)
+        return True
+
+    def failed(self):
+        self.attempts += 1
+        self._attempt += 1
+        self.next_attempt = time.monotonic() + self.backoff.delay(self._attempt)
+
+    def recovered(self, renamed: dict) -> float:
+        """End the outage, renamed is {old queue name: new queue name}. Returns its duration."""
+        outage = time.monotonic() - self.down_since
+        self.down_since = None
+        self.recoveries += 1
+        self.last_outage = outage
+        self.total_outage += outage
+        self._last_seq = {(renamed[q], p): s for (q, p), s in self._last_seq.items() if q in renamed}
+        self._unchecked = set(self._last_seq)
+        return outage
+
+    def record(self, queue_name: str, properties):
+        headers = properties.headers
+        if not headers:
+            return
+        seq = headers.get(SEQ_HEADER)
+        if seq is None:
+            return
+        key = (queue_name, headers.get(PUB_ID_HEADER))
+        if self._unchecked and key in self._unchecked:
+            # first message of this publisher since the recovery
+            self._unchecked.discard(key)
+            last = self._last_seq[key]
+            if seq > last + 1:
+                self.missed += seq - last - 1
+        self._last_seq[key] = seq
+
+    def forget(self, queue_name: str):
+        self._last_seq = {k: s for k, s in self._last_seq.items() if k[0] != queue_name}
+        self._unchecked = {k for k in self._unchecked if k[0] != queue_name}
+
+    def summary(self) -> dict:
+        return {
+            "connected": self.connected,
+            "recoveries": self.recoveries,
+            "failed_attempts": self.attempts,
+            "last_outage": self.last_outage,
+            "total_outage": self.total_outage,
+            "missed": self.missed,
+        }
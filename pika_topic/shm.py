@@ -0,0 +1,117 @@
+import struct
+import weakref
+from multiprocessing import shared_memory, resource_tracker
+
+
+SHM_CONTENT_TYPE = "application/x-pika-topic-shm"
+INNER_CONTENT_TYPE_HEADER = "x-shm-content-type"
+
+# per slot header: generation (u64), payload length (u64)
+_SLOT_HEADER = struct.Struct("<QQ")
+# descriptor body: slot (u32), slot stride (u64), generation (u64), length (u64),
+# followed by the utf-8 segment name
+_DESCRIPTOR = struct.Struct("<IQQQ")
+
+
+# segments created by the rings of this process, see ShmReader._attach
+_own_segments = set()
+
+
+class StaleSlotError(Exception):
+    """The slot referred by a descriptor was overwritten before it was read."""
+    pass
+
+
+def _unlink(shm: shared_memory.SharedMemory):
+    _own_segments.discard(shm.name)
+    shm.close()
+    try:
+        shm.unlink()
+    except FileNotFoundError:
+        pass
+
+
+class ShmRing(object):
+    def __init__(self, n_slots: int, slot_size: int):
+        """A ring of fixed size slots in one shared memory segment (writer side).
+
+        Every slot is guarded by a generation counter which works as a seqlock:
+        it is odd while the slot is being written, and the descriptor carries the
+        even value written after the payload. Readers compare both before and after
+        copying the payload, so a slot reused while wrapping around is detected.
+
+        Args:
+            n_slots (int): number of slots in the ring
+            slot_size (int): max payload size in bytes of one slot
+        """
+        self.n_slots = n_slots
+        self.slot_size = slot_size
+        self.stride = _SLOT_HEADER.size + slot_size
+        self.shm = shared_memory.SharedMemory(create=True, size=n_slots * self.stride)
+        self.name = self.shm.name
+        _own_segments.add(self.name)
+        self.generations = [0] * n_slots
+        self.next_slot = 0
+        self._finalizer = weakref.finalize(self, _unlink, self.shm)
+
+    def write(self, data) -> bytes:
+        """Copy data into the next slot, returns the descriptor of the slot."""
+        length = len(data)
+        assert length <= self.slot_size, "data exceeds slot size"
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.n_slots
+
+        buf = self.shm.buf
+        base = slot * self.stride
+        gen = self.generations[slot]
+        _SLOT_HEADER.pack_into(buf, base, gen + 1, length)
+        start = base + _SLOT_HEADER.size
+        buf[start:start+length] = data
+        gen += 2
+        _SLOT_HEADER.pack_into(buf, base, gen, length)
+        self.generations[slot] = gen
+        return _DESCRIPTOR.pack(slot, self.stride, gen, length) + self.name.encode()
+
+    def close(self):
+        self._finalizer()
+
+
+class ShmReader(object):
+    """Resolve descriptors into payloads (reader side), caches attached segments."""
+    def __init__(self):
+        self.segments = dict()
+
+    def _attach(self, name: str) -> shared_memory.SharedMemory:
+        shm = self.segments.get(name)
+        if shm is None:
+            shm = shared_memory.SharedMemory(name=name)
+            # the segment is owned by the publisher, do not let the resource
+            # tracker of this process unlink it on exit (unless it is the owner)
+            if name not in _own_segments:
+                resource_tracker.unregister(shm._name, "shared_memory")
+            self.segments[name] = shm
+        return shm
+
+    def read(self, descriptor: bytes) -> bytes:
+        """Copy the payload out of shared memory.
+
+        Raises:
+            StaleSlotError: the slot has been overwritten by a newer message
+        """
+        slot, stride, gen, length = _DESCRIPTOR.unpack_from(descriptor, 0)
+        name = bytes(descriptor[_DESCRIPTOR.size:]).decode()
+        buf = self._attach(name).buf
+        base = slot * stride
+        
+        if _SLOT_HEADER.unpack_from(buf, base)[0] != gen:
+            raise StaleSlotError(name, slot, gen)
+        start = base + _SLOT_HEADER.size
+        data = bytes(buf[start:start+length])
+        if _SLOT_HEADER.unpack_from(buf, base)[0] != gen:
+            raise StaleSlotError(name, slot, gen)
+        return data
+
+    def close(self):
+        for shm in self.segments.values():
+            shm.close()
+        self.segments.clear()
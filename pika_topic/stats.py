@@ -0,0 +1,226 @@
+import os
+import math
+import time
+import json
+import socket
+import itertools
+
+
+SEQ_HEADER = "x-seq"
+PUB_ID_HEADER = "x-pub-id"
+SEND_MONO_HEADER = "x-send-mono"  # time.monotonic_ns() of the publisher host
+SEND_WALL_HEADER = "x-send-wall"  # time.time() of the publisher
+
+HOSTNAME = socket.gethostname()
+_pub_counter = itertools.count()
+
+
+def new_publisher_id() -> str:
+    """Unique id of a publisher: hostname/pid/counter. Subscribers on the same host
+    use the monotonic send time to measure latency, others the wall time."""
+    return "{}/{}/{}".format(HOSTNAME, os.getpid(), next(_pub_counter))
+
+
+def _label_value(value) -> str:
+    """Escape backslash, double quote and newline, per the Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Instrumenter(object):
+    """Publisher side, adds sequence number, publisher id and send times to headers."""
+    def __init__(self):
+        self.pub_id = new_publisher_id()
+        self.seq = 0
+
+    def headers(self) -> dict:
+        self.seq += 1
+        return {
+            SEQ_HEADER: self.seq,
+            PUB_ID_HEADER: self.pub_id,
+            SEND_MONO_HEADER: time.monotonic_ns(),
+            SEND_WALL_HEADER: time.time(),
+        }
+
+
+class LatencyHistogram(object):
+    """Log-spaced histogram from 1 us to 100 s, `per_decade` buckets per decade."""
+    def __init__(self, per_decade: int = 10, min_exp: int = -6, max_exp: int = 2):
+        self.per_decade = per_decade
+        self.min_exp = min_exp
+        self.n_buckets = (max_exp - min_exp) * per_decade + 2  # + underflow, overflow
+        self.counts = [0] * self.n_buckets
+        self.total = 0
+        self.sum = 0.0
+
+    def add(self, value: float):
+        if value <= 0:
+            index = 0
+        else:
+            index = int((math.log10(value) - self.min_exp) * self.per_decade) + 1
+            index = min(max(index, 0), self.n_buckets - 1)
+        self.counts[index] += 1
+        self.total += 1
+        self.sum += value
+
+    def merge(self, other: "LatencyHistogram"):
+        """Add the counts of a histogram with the same buckets."""
+        assert other.n_buckets == self.n_buckets, "histograms have different buckets"
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.total += other.total
+        self.sum += other.sum
+
+    def upper_bound(self, index: int) -> float:
+        if index == self.n_buckets - 1:
+            return math.inf
+        return 10 ** (self.min_exp + index / self.per_decade)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile, None if empty."""
+        if self.total == 0:
+            return None
+        rank = q * self.total
+        acc = 0
+        for i, c in enumerate(self.counts):
+            acc += c
+            if acc >= rank:
+                return self.upper_bound(i)
+        return math.inf
+
+
+class TopicStats(object):
+    def __init__(self, topic: str, alpha: float = 0.05):
+        """Rolling statistics of one subscribed queue, O(1) per message.
+
+        Rates are exponentially weighted moving averages (weight `alpha` per message),
+        latencies go into a log-spaced histogram, gaps and drops are detected from
+        the per-publisher sequence numbers. Records are whole AMQP messages after
+        chunk reassembly, a batch counts as `count` messages.
+        """
+        self.topic = topic
+        self.alpha = alpha
+        self.messages = 0
+        self.bytes = 0
+        self.gaps = 0
+        self.dropped = 0
+        self.duplicates = 0  # sequence number not increasing, e.g. replayed messages
+        self.latency = LatencyHistogram()
+        self._last_seq = dict()  # pub_id -> seq
+        self._last_t = None
+        self._ewma_dt = None
+        self._ewma_bytes = 0.0
+
+    def record(self, headers: dict, nbytes: int, count: int = 1):
+        now = time.monotonic()
+        self.messages += count
+        self.bytes += nbytes
+        if self._last_t is not None:
+            # count messages spread over dt, the same as count updates of weight alpha
+            dt = (now - self._last_t) / count
+            size = nbytes / count
+            if self._ewma_dt is None:
+                self._ewma_dt = dt
+                self._ewma_bytes = size
+            else:
+                alpha = 1 - (1 - self.alpha) ** count
+                self._ewma_dt += alpha * (dt - self._ewma_dt)
+                self._ewma_bytes += alpha * (size - self._ewma_bytes)
+        self._last_t = now
+
+        if not headers:
+            return
+        pub_id = headers.get(PUB_ID_HEADER)
+        seq = headers.get(SEQ_HEADER)
+        if pub_id is not None and seq is not None:
+            last = self._last_seq.get(pub_id)
+            if last is None or seq == last + 1:
+                self._last_seq[pub_id] = seq
+            elif seq > last + 1:
+                self.gaps += 1
+                self.dropped += seq - last - 1
+                self._last_seq[pub_id] = seq
+            else:
+                self.duplicates += 1
+
+            if pub_id.startswith(HOSTNAME + "/") and SEND_MONO_HEADER in headers:
+                self.latency.add(now - headers[SEND_MONO_HEADER] * 1e-9)
+            elif SEND_WALL_HEADER in headers:
+                self.latency.add(time.time() - headers[SEND_WALL_HEADER])
+
+    @property
+    def rate(self) -> float:
+        """Messages per second."""
+        return 1.0 / self._ewma_dt if self._ewma_dt else 0.0
+
+    @property
+    def bandwidth(self) -> float:
+        """Bytes per second."""
+        return self._ewma_bytes / self._ewma_dt if self._ewma_dt else 0.0
+
+    def summary(self) -> dict:
+        lat = self.latency
+        return {
+            "topic": self.topic,
+            "messages": self.messages,
+            "bytes": self.bytes,
+            "rate": self.rate,
+            "bandwidth": self.bandwidth,
+            "gaps": self.gaps,
+            "dropped": self.dropped,
+            "duplicates": self.duplicates,
+            "latency_mean": lat.sum / lat.total if lat.total else None,
+            "latency_p50": lat.quantile(0.5),
+            "latency_p99": lat.quantile(0.99),
+        }
+
+
+class StatsRegistry(object):
+    """Statistics of all the queues of a Subscriber, keyed by queue name."""
+    def __init__(self):
+        self.queues = dict()  # queue_name -> TopicStats
+
+    def add(self, queue_name: str, topic: str):
+        self.queues[queue_name] = TopicStats(topic)
+
+    def remove(self, queue_name: str):
+        self.queues.pop(queue_name, None)
+
+    def record(self, queue_name: str, properties, body, count: int = 1):
+        stats = self.queues.get(queue_name)
+        if stats is not None:
+            stats.record(properties.headers, len(body), count)
+
+    def summary(self) -> dict:
+        return {q: s.summary() for q, s in list(self.queues.items())}
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.summary(), **kwargs)
+
+    def to_prometheus(self, prefix: str = "pika_topic") -> str:
+        """Prometheus text exposition format, counters are suffixed with _total."""
+        lines = []
+        stats = list(self.queues.items())
+        for name in ["messages", "bytes", "rate", "bandwidth", "gaps", "dropped", "duplicates"]:
+            if name in ("rate", "bandwidth"):
+                metric, kind = "{}_{}".format(prefix, name), "gauge"
+            else:
+                metric, kind = "{}_{}_total".format(prefix, name), "counter"
+            lines.append("# TYPE {} {}".format(metric, kind))
+            for queue, s in stats:
+                lines.append('{}{{topic="{}",queue="{}"}} {}'.format(
+                    metric, _label_value(s.topic), _label_value(queue), getattr(s, name)))
+        lines.append("# TYPE {}_latency_seconds histogram".format(prefix))
+        for queue, s in stats:
+            lat = s.latency
+            label = 'topic="{}",queue="{}"'.format(_label_value(s.topic), _label_value(queue))
+            acc = 0
+            for i, c in enumerate(lat.counts):
+                acc += c
+                le = lat.upper_bound(i)
+                if c == 0 and le != math.inf:
+                    continue
+                lines.append('{}_latency_seconds_bucket{{{},le="{}"}} {}'.format(
+                    prefix, label, "+Inf" if le == math.inf else "{:.6g}".format(le), acc))
+            lines.append("{}_latency_seconds_sum{{{}}} {}".format(prefix, label, lat.sum))
+            lines.append("{}_latency_seconds_count{{{}}} {}".format(prefix, label, lat.total))
+        return "\n".join(lines) + "\n"
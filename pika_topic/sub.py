@@ -1,55 +1,495 @@
+import time
 import pika
-import pickle
 import threading
-from typing import Callable
-from functools import partial
+import traceback
+from collections import deque, namedtuple
+from typing import Callable, Union
+from functools import partial, wraps
+from concurrent.futures import Executor
+from .message import MessageDecoder, LazyMessage, Conflation, BATCH_COUNT_HEADER
+from .chunk import CHUNK_ID_HEADER
+from .msgtype import StructCodec
+from .dispatch import CallbackDispatcher
+from .manager import ConnectionManager
+from .cluster import BrokerCluster
+from .stats import StatsRegistry
+from .recovery import Backoff, Recovery, CONNECTION_ERRORS
+from .namespace import NAMESPACE_EXCHANGE, TopicMessage, is_pattern
+from . import intra
+
+
+def group_queue_name(topic: str, group: str) -> str:
+    """Name of the queue shared by the workers of a group, see Subscriber.subscribe."""
+    return "pika_topic.group.{}.{}".format(group, topic)
+
+
+def _recoverable(default: Callable):
+    """Subscriber methods returning default() while a lost connection is recovered (recover=True)."""
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.recovery is None:
+                return method(self, *args, **kwargs)
+            if not self.recovery.connected and not self._try_recover():
+                return default()
+            try:
+                return method(self, *args, **kwargs)
+            except CONNECTION_ERRORS as e:
+                if not self._lost(e):
+                    raise
+                return default()
+        return wrapper
+    return decorator
+
+
+class _TopicCallback(object):
+    """Picklable callback(data) -> callback(TopicMessage(topic, data)), for executors."""
+    def __init__(self, callback: Callable, topic: str):
+        self.callback = callback
+        self.topic = topic
+    
+    def __call__(self, data):
+        return self.callback(TopicMessage(self.topic, data))
 
 
 class Subscriber(object):
-    def __init__(self, conn: pika.BlockingConnection = None):
-        self.connection = pika.BlockingConnection() if conn is None else conn
-        self.channel = self.connection.channel()
+    def __init__(
+        self, 
+        conn: Union[pika.BlockingConnection, ConnectionManager] = None, 
+        push_get: bool = False,
+        executor: Executor = None,
+        prefetch_count: int = 8,
+        stats: bool = False,
+        chunk_timeout: float = 30.0,
+        recover: bool = False,
+        backoff: Backoff = None,
+        connect: Callable = None
+    ):
+        """Subscribe to topics.
+
+        Args:
+            conn (pika.BlockingConnection or ConnectionManager, optional): 
+                connection to use, a new local connection is created if None. 
+                With a ConnectionManager, a dedicated channel is opened on the 
+                connection of the calling thread
+            push_get (bool, optional): 
+                queues without callback are consumed with basic_consume into local 
+                buffers instead of being polled by basic_get, so get() costs one 
+                non-blocking I/O poll no matter how many queues are subscribed
+            executor (concurrent.futures.Executor, optional): 
+                run callbacks in a thread or process pool instead of the connection 
+                thread. Messages of one queue keep their order, different queues run 
+                in parallel. See dispatch.CallbackDispatcher
+            prefetch_count (int, optional): 
+                with executor, max number of unacked messages per queue, the broker 
+                stops delivering when workers fall behind
+            stats (bool, optional): 
+                keep rolling statistics of every queue (rate, bytes/s, latency 
+                percentiles, gaps and drops) in .stats, latency and drops need 
+                publishers created with instrument=True. See stats.StatsRegistry
+            chunk_timeout (float, optional): 
+                drop a chunked message (see Publisher chunk_size) when none of its 
+                missing chunks arrived for this many seconds
+            recover (bool, optional): 
+                when the connection is lost, open a new one (with backoff) and subscribe 
+                every topic again instead of raising: spin() keeps going and get() 
+                returns nothing until recovered. Queues get new names, the names 
+                returned by subscribe() keep working with get() and unsubscribe_queue(). 
+                Recoveries, outages and missed messages are given by recovery_stats()
+            backoff (recovery.Backoff, optional): delays between reconnection attempts
+            connect (Callable, optional): 
+                connect(parameters) -> connection used to reconnect, default is 
+                pika.BlockingConnection with the parameters of conn. Not used with 
+                a ConnectionManager, which reconnects its own connection
+        """
+        self.manager = None
+        if isinstance(conn, ConnectionManager):
+            self.manager = conn
+            self.manager.register(self)
+            self.connection = self.manager.connection()
+            self.channel = self.manager.channel(dedicated=True)
+        else:
+            self.connection = pika.BlockingConnection() if conn is None else conn
+            self.channel = self.connection.channel()
+        self._connect = pika.BlockingConnection if connect is None else connect
+        self.push_get = push_get
         self.queue_names = []
         self.topic_names = []
         self.callbacks = []
+        self._queue_index = dict()  # queue_name -> index in the lists above
+        self._consumer_tags = dict()  # queue_name -> consumer tag
+        # queue_name -> keyword arguments of subscribe(), used to subscribe again after reconnecting
+        self._subscriptions = dict()
+        self.decoder = MessageDecoder(chunk_timeout)
+        self._expiry_timer = None  # drops the timed out chunked messages while some are incomplete
+        self.dispatcher = None
+        self.prefetch_count = prefetch_count
+        if executor is not None:
+            self.channel.basic_qos(prefetch_count=prefetch_count)
+            self.dispatcher = CallbackDispatcher(executor, self.connection, self.channel, self.decoder)
+        # decoded messages not yet returned by get(), a batch may carry several
+        self._pending = dict()
+        # raw (properties, body) pushed by the broker in push_get mode, 
+        # decoded only when returned by get()
+        self._raw = dict()
+        self.stats = StatsRegistry() if stats else None
+        self.recovery = Recovery(backoff) if recover else None
+        # queue names returned by subscribe() before reconnections -> current queue name
+        self._aliases = dict()
+        self._originals = dict()  # current queue name -> name returned by subscribe()
+        self._replay = None  # [(queue_name, subscribe() arguments)] until subscribed again
+        self._endpoints = dict()  # queue_name -> intra-process endpoint
+        # queues bound to the namespace exchange, their messages carry the topic
+        self._hierarchical = set()
+        self._groups = dict()  # queue_name -> group of the shared worker group queues
+        self._conflation = dict()  # queue_name -> message.Conflation of the conflating queues
+        self._flush_scheduled = False
+        self._lazy = dict()  # queue_name -> topic of the queues delivering LazyMessage
+    
+    @property
+    def shm_stale_drops(self):
+        return self.decoder.shm_stale_drops
+    
+    @property
+    def chunk_timeouts(self):
+        return self.decoder.chunks.timeouts
+    
+    def decode(self, queue_name: str, properties, body) -> list:
+        """Decode a raw message received on queue_name, returns the list of messages it carries."""
+        return self.decoder.decode(queue_name, properties, body)
+    
+    def _messages(self, queue_name: str, properties, body, routing_key: str) -> list:
+        """Decode a delivery into what callbacks and get() return: data, TopicMessage or LazyMessage.
+        
+        Only the last message of a batch is kept (and decoded) on conflating queues.
+        """
+        codec, bodies = self.decoder.unwrap(queue_name, properties, body)
+        conflation = self._conflation.get(queue_name)
+        if conflation is not None and bodies:
+            conflation.count(len(bodies) - 1)
+            bodies = bodies[-1:]
+        hierarchical = queue_name in self._hierarchical
+        if queue_name in self._lazy:
+            topic = routing_key if hierarchical else self._lazy[queue_name]
+            return [LazyMessage(codec, b, properties, topic) for b in bodies]
+        if hierarchical:
+            return [TopicMessage(routing_key, codec.decode(b)) for b in bodies]
+        return [codec.decode(b) for b in bodies]
+    
+    def _record(self, queue_name: str, properties, body):
+        """Statistics of a whole message (chunks reassembled), a batch counts its messages."""
+        if self.stats is not None:
+            headers = properties.headers
+            count = headers.get(BATCH_COUNT_HEADER, 1) if headers else 1
+            self.stats.record(queue_name, properties, body, count)
+        if self.recovery is not None:
+            self.recovery.record(queue_name, properties)
     
-    @staticmethod
-    def _callback_wrapper(callback: Callable, channel, method, properties, body):
-        data = pickle.loads(body)
-        return callback(data)
+    def _assemble(self, queue_name: str, properties, body):
+        """Reassemble a chunked message and record it once complete, None until then."""
+        message = self.decoder.assemble(queue_name, properties, body)
+        if message is not None:
+            self._record(queue_name, *message)
+        elif self._expiry_timer is None and self.decoder.chunks.partials:
+            self._expiry_timer = self.connection.call_later(self.decoder.chunks.timeout, self._expire_chunks)
+        return message
     
-    def _attach_queue_to_exchange(self, topic: str, queue_size: int = -1) -> str:
+    def _expire_chunks(self):
+        deadline = self.decoder.chunks.expire()
+        if deadline == float("inf"):
+            self._expiry_timer = None
+        else:
+            self._expiry_timer = self.connection.call_later(
+                max(deadline - time.monotonic(), 0.0), self._expire_chunks)
+    
+    def _reject_chunk(self, queue_name: str, channel, method, properties) -> bool:
+        """Reject a chunk received on a worker group queue, returns False for other messages.
+        
+        The chunks of a message are spread over the workers of the group, none 
+        of them could reassemble it. Rejected chunks go to the dead letter 
+        exchange of the group, if any, where one subscriber gets them all.
+        """
+        if not properties.headers or CHUNK_ID_HEADER not in properties.headers:
+            return False
+        print("[WARN] Reject chunk of message {} on worker group queue {}, chunked messages can not be "
+              "shared by a group.".format(properties.headers[CHUNK_ID_HEADER], queue_name))
+        channel.basic_nack(method.delivery_tag, requeue=False)
+        return True
+    
+    def _callback_wrapper(self, queue_name: str, callback: Callable, channel, method, properties, body):
+        message = self._assemble(queue_name, properties, body)
+        if message is None:
+            return
+        properties, body = message
+        for message in self._messages(queue_name, properties, body, method.routing_key):
+            callback(message)
+    
+    def _conflate_wrapper(self, queue_name: str, channel, method, properties, body):
+        """Keep the newest delivery of a conflating queue, undecoded.
+        
+        With a callback, it is handed out once the deliveries received in the 
+        same pass are dispatched (by a callback of the connection, so on its 
+        next pass), so a backlog costs one decode and one call.
+        """
+        conflation = self._conflation.get(queue_name)
+        if conflation is None:
+            return
+        message = self._assemble(queue_name, properties, body)
+        if message is None:
+            return
+        properties, body = message
+        conflation.put((properties, body, method.routing_key))
+        if conflation.deliver is not None and not self._flush_scheduled:
+            # the connection runs callbacks after the deliveries of the current pass, 
+            # so the flush comes after them even if the last ones are for other queues
+            self._flush_scheduled = True
+            self.connection.add_callback_threadsafe(self._flush_conflated)
+    
+    def _flush_conflated(self):
+        """Hand the newest message of every conflating queue to its callback."""
+        self._flush_scheduled = False
+        for conflation in list(self._conflation.values()):
+            if conflation.deliver is not None:
+                while conflation.latest:
+                    conflation.deliver(conflation.take())
+    
+    def _deliver_latest(self, queue_name: str, callback: Callable, raw: bool, latest: tuple):
+        properties, body, routing_key = latest
+        if not raw:
+            for message in self._messages(queue_name, properties, body, routing_key):
+                callback(message)
+            return
+        self._conflation[queue_name].count()
+        if queue_name in self._hierarchical:
+            callback(properties, body, routing_key)
+        else:
+            callback(properties, body)
+    
+    def _raw_callback_wrapper(self, queue_name: str, callback: Callable, channel, method, properties, body):
+        message = self._assemble(queue_name, properties, body)
+        if message is None:
+            return
+        properties, body = message
+        if queue_name in self._hierarchical:
+            callback(properties, body, method.routing_key)
+        else:
+            callback(properties, body)
+    
+    def _dispatch_wrapper(self, queue_name: str, callback: Callable, channel, method, properties, body):
+        if queue_name in self._groups and self._reject_chunk(queue_name, channel, method, properties):
+            return
+        message = self._assemble(queue_name, properties, body)
+        if message is None:
+            # chunk of a message not complete yet
+            channel.basic_ack(method.delivery_tag)
+            return
+        properties, body = message
+        if queue_name in self._hierarchical:
+            callback = _TopicCallback(callback, method.routing_key)
+        self.dispatcher.on_message(queue_name, callback, channel, method, properties, body)
+    
+    def _ack_wrapper(self, queue_name: str, wrapper: Callable, channel, method, properties, body):
+        """Ack once the callback returned, requeue the message if it raised (worker groups).
+        
+        The broker counts the deliveries, see the max_redeliveries of subscribe.
+        """
+        if self._reject_chunk(queue_name, channel, method, properties):
+            return
+        try:
+            wrapper(channel, method, properties, body)
+        except Exception:
+            traceback.print_exc()
+            channel.basic_nack(method.delivery_tag, requeue=True)
+        else:
+            channel.basic_ack(method.delivery_tag)
+    
+    def _attach_queue_to_exchange(self, topic: str, queue_size: int = -1, hierarchical: bool = False) -> str:
         if queue_size is not None and queue_size > 0:
             arguments = {"x-max-length": queue_size}
         else:
             arguments = None
         
-        self.channel.exchange_declare(topic, exchange_type="fanout", auto_delete=False)
+        if hierarchical:
+            self.channel.exchange_declare(NAMESPACE_EXCHANGE, exchange_type="topic", auto_delete=False)
+        else:
+            self.channel.exchange_declare(topic, exchange_type="fanout", auto_delete=False)
         result = self.channel.queue_declare(queue="", exclusive=True, auto_delete=True, 
                                             arguments=arguments)
         queue_name = result.method.queue
+        if hierarchical:
+            self.channel.queue_bind(
+                queue=queue_name,
+                exchange=NAMESPACE_EXCHANGE,
+                routing_key=topic
+            )
+        else:
+            self.channel.queue_bind(
+                queue=queue_name,
+                exchange=topic
+            )
+        return queue_name
+    
+    def _attach_group_queue(self, topic: str, group: str, queue_size: int = -1, hierarchical: bool = False,
+                            max_redeliveries: int = 3, dead_letter: str = None) -> str:
+        # a quorum queue, durable and counting deliveries, so redelivery is bounded 
+        # even when workers crash before acking
+        arguments = {"x-queue-type": "quorum", "x-delivery-limit": max_redeliveries}
+        if queue_size is not None and queue_size > 0:
+            arguments["x-max-length"] = queue_size
+        if dead_letter is not None:
+            self.channel.exchange_declare(dead_letter, exchange_type="fanout", auto_delete=False)
+            arguments["x-dead-letter-exchange"] = dead_letter
+        
+        queue_name = group_queue_name(topic, group)
+        if hierarchical:
+            self.channel.exchange_declare(NAMESPACE_EXCHANGE, exchange_type="topic", auto_delete=False)
+        else:
+            self.channel.exchange_declare(topic, exchange_type="fanout", auto_delete=False)
+        self.channel.queue_declare(queue=queue_name, durable=True, arguments=arguments)
         self.channel.queue_bind(
             queue=queue_name,
-            exchange=topic
+            exchange=NAMESPACE_EXCHANGE if hierarchical else topic,
+            routing_key=topic if hierarchical else None
         )
+        # fair dispatch, a worker gets at most prefetch_count unacked messages
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
         return queue_name
     
-    def _attach_callback_to_queue(self, queue_name: str, callback: Callable = None) -> Callable:
-        if callback is not None:
-            callback = partial(self._callback_wrapper, callback)
-            self.channel.basic_consume(
+    def _attach_callback_to_queue(self, queue_name: str, callback: Callable = None, raw: bool = False, 
+                                  group: bool = False, conflate: bool = False) -> Callable:
+        if callback is not None and conflate and (raw or self.dispatcher is None):
+            self._conflation[queue_name].deliver = partial(self._deliver_latest, queue_name, callback, raw)
+            callback = partial(self._conflate_wrapper, queue_name)
+            self._consumer_tags[queue_name] = self.channel.basic_consume(
+                queue=queue_name,
+                on_message_callback=callback,
+                auto_ack=True
+            )
+        elif callback is not None and group and (raw or self.dispatcher is None):
+            wrapper = self._raw_callback_wrapper if raw else self._callback_wrapper
+            callback = partial(self._ack_wrapper, queue_name, partial(wrapper, queue_name, callback))
+            self._consumer_tags[queue_name] = self.channel.basic_consume(
+                queue=queue_name,
+                on_message_callback=callback,
+                auto_ack=False
+            )
+        elif callback is not None and raw:
+            callback = partial(self._raw_callback_wrapper, queue_name, callback)
+            self._consumer_tags[queue_name] = self.channel.basic_consume(
+                queue=queue_name,
+                on_message_callback=callback,
+                auto_ack=True
+            )
+        elif callback is not None and self.dispatcher is not None:
+            if group:
+                self.dispatcher.requeue_queues.add(queue_name)
+            if conflate:
+                self.dispatcher.conflating[queue_name] = self._conflation[queue_name]
+            callback = partial(self._dispatch_wrapper, queue_name, callback)
+            self._consumer_tags[queue_name] = self.channel.basic_consume(
+                queue=queue_name,
+                on_message_callback=callback,
+                auto_ack=False
+            )
+        elif callback is not None:
+            callback = partial(self._callback_wrapper, queue_name, callback)
+            self._consumer_tags[queue_name] = self.channel.basic_consume(
                 queue=queue_name,
                 on_message_callback=callback,
                 auto_ack=True
             )
         return callback
     
+    def _buffer_wrapper(self, queue_name: str, channel, method, properties, body):
+        raw = self._raw.get(queue_name)
+        if raw is not None:
+            # chunks are reassembled before they could be pushed out of a short buffer
+            message = self._assemble(queue_name, properties, body)
+            if message is None:
+                return
+            properties, body = message
+            raw.append((properties, body, method.routing_key))
+    
+    def _attach_buffer_to_queue(self, queue_name: str, queue_size: int = -1, conflate: bool = False):
+        if conflate:
+            # the newest message is kept in the Conflation of the queue
+            on_message_callback = partial(self._conflate_wrapper, queue_name)
+        else:
+            self._raw[queue_name] = deque(maxlen=queue_size if queue_size and queue_size > 0 else None)
+            on_message_callback = partial(self._buffer_wrapper, queue_name)
+        self._consumer_tags[queue_name] = self.channel.basic_consume(
+            queue=queue_name,
+            on_message_callback=on_message_callback,
+            auto_ack=True
+        )
+    
     def _append(self, topic_name: str, queue_name: str, callback: Callable = None):
+        if self.stats is not None:
+            self.stats.add(queue_name, topic_name)
+        self._queue_index[queue_name] = len(self.queue_names)
         self.topic_names.append(topic_name)
         self.queue_names.append(queue_name)
         self.callbacks.append(callback)
     
-    def subscribe(self, topic: str, queue_size: int = -1, callback: Callable = None) -> str:
+    def _remove(self, index: int):
+        topic_name = self.topic_names.pop(index)
+        queue_name = self.queue_names.pop(index)
+        self.callbacks.pop(index)
+        self._queue_index = {q: i for i, q in enumerate(self.queue_names)}
+        self._subscriptions.pop(queue_name, None)
+        self.decoder.forget(queue_name)
+        self._pending.pop(queue_name, None)
+        self._raw.pop(queue_name, None)
+        hierarchical = queue_name in self._hierarchical
+        self._hierarchical.discard(queue_name)
+        group = self._groups.pop(queue_name, None)
+        self._conflation.pop(queue_name, None)
+        self._lazy.pop(queue_name, None)
+        endpoint = self._endpoints.pop(queue_name, None)
+        if endpoint is not None:
+            intra.registry.unregister(topic_name, endpoint)
+        if self.stats is not None:
+            self.stats.remove(queue_name)
+        if self.recovery is not None:
+            self.recovery.forget(queue_name)
+        if self._aliases:
+            self._aliases = {old: q for old, q in self._aliases.items() if q != queue_name}
+            self._originals.pop(queue_name, None)
+        if self.dispatcher is not None:
+            self.dispatcher.forget(queue_name)
+        consumer_tag = self._consumer_tags.pop(queue_name, None)
+        if consumer_tag is not None:
+            self.channel.basic_cancel(consumer_tag)
+        if group is not None:
+            # the group queue stays bound for the other workers
+            return
+        if hierarchical:
+            self.channel.queue_unbind(
+                queue=queue_name,
+                exchange=NAMESPACE_EXCHANGE,
+                routing_key=topic_name
+            )
+        else:
+            self.channel.queue_unbind(
+                queue=queue_name,
+                exchange=topic_name
+            )
+    
+    def subscribe(
+        self, 
+        topic: str, 
+        queue_size: int = -1, 
+        callback: Callable = None, 
+        shm: bool = False, 
+        raw: bool = False,
+        intra_process: str = None,
+        hierarchical: bool = False,
+        group: str = None,
+        max_redeliveries: int = 3,
+        dead_letter: str = None,
+        conflate: bool = False,
+        lazy: bool = False
+    ) -> str:
         """Subscribe to topic
 
         Args:
@@ -63,70 +503,299 @@ class Subscriber(object):
                 then the result can be obtained with non-blocking .get() method
                 
                 example callback: callback = lambda message: print(message)
+            shm (bool, optional): 
+                accept messages sent through the same-host shared memory transport, 
+                messages whose slot was overwritten before being read are dropped
+            raw (bool, optional): 
+                call callback(properties, body) with the undecoded message on the 
+                connection thread, decode it later with .decode(queue_name, properties, body)
+            intra_process (str, optional): 
+                receive messages of publishers in this process created with 
+                intra_process=True as objects, without serialization nor broker. 
+                "shared" passes the published object itself, "readonly" makes its 
+                NumPy arrays read-only views, "copy" passes a deep copy. Not 
+                available with raw or executor
+            hierarchical (bool, optional): 
+                subscribe to a dotted topic of the shared namespace (see Publisher), 
+                "*" matches one word and "#" zero or more words, e.g. "robot.*.pose" 
+                receives the messages of all the robots with one queue. Messages 
+                come as namespace.TopicMessage(topic, data) and raw callbacks are 
+                called as callback(properties, body, topic)
+            group (str, optional): 
+                join a worker group: all the subscribers of the group (in any process 
+                or host) share one durable queue and the broker load-balances the 
+                messages between them, instead of each subscriber getting a copy. 
+                Needs a callback, messages are acked after it returns (fair dispatch 
+                with basic_qos(prefetch_count), use prefetch_count=1 for long tasks) 
+                and requeued if it raises or the worker dies. See workers.WorkerPool
+            max_redeliveries (int, optional): 
+                with group, a message is delivered at most 1 + max_redeliveries times, 
+                then dead-lettered or dropped (the group queue is a quorum queue, 
+                RabbitMQ 3.8+)
+            dead_letter (str, optional): 
+                with group, topic receiving the messages which exceeded max_redeliveries 
+                (or were rejected), subscribe to it like to any topic
+            conflate (bool, optional): 
+                for slow consumers of fast topics: all the deliveries received in one 
+                pass are drained, only the undecoded bytes of the newest one are kept 
+                (of each topic with hierarchical) and only the message actually handed 
+                to the callback (or returned by get()) is decoded, older ones are 
+                skipped. Counters per topic are given by conflation_stats(). Not 
+                available with group or intra_process
+            lazy (bool, optional): 
+                callbacks and get() receive message.LazyMessage objects, decoded on 
+                the first access of .data, with .headers, .stamp and .size available 
+                without decoding. Not available with raw, executor or intra_process
 
         Returns:
-            queue_name (str): the auto generated queue name
+            queue_name (str): the auto generated queue name, or the name of the group queue
         """
-        queue_name = self._attach_queue_to_exchange(topic, queue_size)
-        callback = self._attach_callback_to_queue(queue_name, callback)
+        if intra_process is not None:
+            assert intra_process in intra.MODES, "unknown intra_process mode: {}".format(intra_process)
+            assert not raw and (callback is None or self.dispatcher is None), \
+                "intra_process is not available with raw or executor"
+            assert not hierarchical, "intra_process is not available with hierarchical topics"
+        assert not conflate or (group is None and intra_process is None), \
+            "conflate is not available with group or intra_process"
+        assert not lazy or not (raw or intra_process is not None 
+                                or (callback is not None and self.dispatcher is not None)), \
+            "lazy is not available with raw, executor or intra_process"
+        if group is not None:
+            assert callback is not None and intra_process is None, \
+                "worker groups need a callback and are not available with intra_process"
+            queue_name = self._attach_group_queue(topic, group, queue_size, hierarchical, 
+                                                  max_redeliveries, dead_letter)
+            assert queue_name not in self._queue_index, "already in group {}".format(group)
+            self._groups[queue_name] = group
+        else:
+            queue_name = self._attach_queue_to_exchange(topic, queue_size, hierarchical)
+        self._subscriptions[queue_name] = dict(
+            topic=topic, queue_size=queue_size, callback=callback, shm=shm, raw=raw, 
+            intra_process=intra_process, hierarchical=hierarchical, group=group, 
+            max_redeliveries=max_redeliveries, dead_letter=dead_letter, conflate=conflate, lazy=lazy)
+        if hierarchical:
+            self._hierarchical.add(queue_name)
+        if conflate:
+            self._conflation[queue_name] = Conflation(by_topic=hierarchical)
+        if lazy:
+            self._lazy[queue_name] = topic
+        self._pending[queue_name] = deque(maxlen=queue_size if queue_size and queue_size > 0 else None)
+        if shm:
+            self.decoder.shm_queues.add(queue_name)
+        if intra_process is not None:
+            self.decoder.local_queues.add(queue_name)
+            endpoint = intra._Endpoint(self, queue_name, intra_process, callback, queue_size)
+            self._endpoints[queue_name] = endpoint
+            intra.registry.register(topic, endpoint)
+        callback = self._attach_callback_to_queue(queue_name, callback, raw, group is not None, conflate)
+        if callback is None and (self.push_get or conflate):
+            self._attach_buffer_to_queue(queue_name, queue_size, conflate)
         self._append(topic, queue_name, callback)
         return queue_name
     
+    def _on_reconnect(self):
+        """Called by the ConnectionManager after it opened a new connection (or by recover).
+        
+        The exclusive queues are gone with the old connection, every topic is 
+        subscribed again with a new queue (queue names change, the old ones are 
+        kept as aliases).
+        """
+        if self.manager is not None:
+            self.connection = self.manager.connection()
+            self.channel = self.manager.channel(dedicated=True)
+        else:
+            self.channel = self.connection.channel()
+        if self.dispatcher is not None:
+            self.channel.basic_qos(prefetch_count=self.prefetch_count)
+            self.dispatcher = CallbackDispatcher(
+                self.dispatcher.executor, self.connection, self.channel, self.decoder)
+        
+        if self._replay is None:
+            # kept until every topic is subscribed again, in case the new connection is lost too
+            self._replay = [(q, self._subscriptions.get(q)) for q in self.queue_names]
+        for topic, queue_name in zip(self.topic_names, self.queue_names):
+            endpoint = self._endpoints.pop(queue_name, None)
+            if endpoint is not None:
+                intra.registry.unregister(topic, endpoint)
+        self.queue_names, self.topic_names, self.callbacks = [], [], []
+        self._queue_index.clear()
+        self._consumer_tags.clear()
+        self._subscriptions.clear()
+        self._pending.clear()
+        self._raw.clear()
+        self._hierarchical.clear()
+        self._groups.clear()
+        self._conflation.clear()
+        self._lazy.clear()
+        self._flush_scheduled = False
+        # the timers of the old connection are gone
+        self._expiry_timer = None
+        self.decoder.shm_queues.clear()
+        self.decoder.local_queues.clear()
+        if self.stats is not None:
+            self.stats.queues.clear()
+        renamed = dict()
+        for queue_name, kwargs in self._replay:
+            if kwargs is not None:
+                renamed[queue_name] = self.subscribe(**kwargs)
+        self._replay = None
+        
+        self._aliases = {old: renamed.get(q, q) for old, q in self._aliases.items()}
+        self._aliases.update((old, q) for old, q in renamed.items() if old != q)
+        self._originals = {q: self._originals.get(old, old) for old, q in renamed.items() 
+                           if self._originals.get(old, old) != q}
+        if self.recovery is not None and not self.recovery.connected:
+            outage = self.recovery.recovered(renamed)
+            print("[INFO] Connection recovered after {:.3f}s, {} queues subscribed again.".format(
+                outage, len(renamed)))
+    
+    def _reconnect(self):
+        if self.manager is not None:
+            # reconnects the other dependents of the connection too
+            self.manager.reconnect()
+            return
+        # parameters of the pika connection, to reconnect to the same broker
+        parameters = getattr(getattr(self.connection, "_impl", None), "params", None)
+        if self.connection.is_open:
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+        self.connection = self._connect(parameters)
+        self._on_reconnect()
+    
+    def _lost(self, e: Exception) -> bool:
+        """Whether e is a lost connection to recover, starts the outage."""
+        if self.recovery is None or not isinstance(e, CONNECTION_ERRORS) or self.connection.is_open:
+            return False
+        if self.recovery.lost():
+            print("[WARN] Connection lost ({!r}), recovering...".format(e))
+        return True
+    
+    def _try_recover(self) -> bool:
+        """Reconnect if the next attempt is due, returns whether the connection is recovered."""
+        if time.monotonic() < self.recovery.next_attempt:
+            return False
+        try:
+            self._reconnect()
+        except CONNECTION_ERRORS:
+            self.recovery.failed()
+            return False
+        return True
+    
+    def _wait_recovered(self, stopping: Callable = None) -> bool:
+        """Blocked until the connection is recovered (True) or stopping() (False)."""
+        while not self._try_recover():
+            if stopping is not None and stopping():
+                return False
+            time.sleep(min(max(self.recovery.next_attempt - time.monotonic(), 0), 0.1))
+        return True
+    
+    def recovery_stats(self) -> dict:
+        """Recoveries, failed attempts, outage durations and missed messages, None unless recover=True.
+        
+        See recovery.Recovery.
+        """
+        return None if self.recovery is None else self.recovery.summary()
+    
     def unsubscribe_topic(self, topic_name: str):
         """Unbind all the queues related to the given topic."""
         success = False
         for i in range(len(self.topic_names) - 1, -1, -1):
             if self.topic_names[i] == topic_name:
-                self.topic_names.pop(i)
-                queue_name = self.queue_names.pop(i)
-                self.callbacks.pop(i)
-                self.channel.queue_unbind(
-                    queue=queue_name,
-                    exchange=topic_name
-                )
+                self._remove(i)
                 success = True
         return success
     
     def unsubscribe_queue(self, queue_name: str):
         """Unbind all the topics related to the given queue."""
         success = False
-        for i in range(len(self.queue_names) - 1, -1, -1):
-            if self.queue_names[i] == queue_name:
-                topic_name = self.topic_names.pop(i)
-                self.queue_names.pop(i)
-                self.callbacks.pop(i)
-                self.channel.queue_unbind(
-                    queue=queue_name,
-                    exchange=topic_name
-                )
-                success = True
+        index = self._queue_index.get(self._aliases.get(queue_name, queue_name))
+        if index is not None:
+            self._remove(index)
+            success = True
         return success
     
     def spin(self):
         """Blocked, run in loop. Similar as ros spin.
 
+        With recover, a lost connection is recovered instead of raised.
+
         Raises:
             e: Exception or KeyboardInterrupt
         """
-        try:
-            self.channel.start_consuming()
-        except (Exception, KeyboardInterrupt) as e:
-            print("[INFO] Stop consuming.")
-            self.channel.stop_consuming()
-            raise e
+        while True:
+            try:
+                self.channel.start_consuming()
+                return
+            except (Exception, KeyboardInterrupt) as e:
+                if self._lost(e):
+                    self._wait_recovered()
+                    continue
+                print("[INFO] Stop consuming.")
+                self.channel.stop_consuming()
+                raise e
     
-    def _get_qdata(self, queue: str):
-        method, properties, body = self.channel.basic_get(
-            queue=queue,
-            auto_ack=True
-        )
+    def metrics(self) -> dict:
+        """Queue depth and worker utilisation of the executor mode, None otherwise."""
+        return None if self.dispatcher is None else self.dispatcher.metrics()
+    
+    def conflation_stats(self) -> dict:
+        """Counters of the conflating queues per topic: {topic: {"delivered", "skipped", "conflated"}}.
         
-        if method is None:
-            return False, None
-        else:
-            data = pickle.loads(body)
-            return True, data
+        skipped messages were dropped without being decoded, conflated ones are 
+        delivered messages which superseded at least one skipped message.
+        """
+        ret = dict()
+        for topic, queue in zip(self.topic_names, self.queue_names):
+            conflation = self._conflation.get(queue)
+            if conflation is None:
+                continue
+            counters = ret.setdefault(topic, dict.fromkeys(("delivered", "skipped", "conflated"), 0))
+            for key, value in conflation.counters().items():
+                counters[key] += value
+        return ret
     
+    def _poll(self):
+        """In push_get mode (or with conflating queues), receive the messages pushed so far without blocking."""
+        if self.push_get or self._conflation:
+            self.connection.process_data_events(time_limit=0)
+    
+    @_recoverable(lambda: (False, None))
+    def _get_one(self, queue: str):
+        """(ok, data) of one queue, see SingleSubscriber.get."""
+        self._poll()
+        return self._get_qdata(queue)
+    
+    def _get_qdata(self, queue: str):
+        conflation = self._conflation.get(queue)
+        if conflation is not None:
+            latest = conflation.take()
+            messages = [] if latest is None else self._messages(queue, *latest)
+            return (True, messages[-1]) if messages else (False, None)
+        pending = self._pending[queue]
+        raw = self._raw.get(queue)
+        while not pending:
+            if raw is not None:
+                if not raw:
+                    return False, None
+                properties, body, routing_key = raw.popleft()
+            else:
+                method, properties, body = self.channel.basic_get(
+                    queue=queue,
+                    auto_ack=True
+                )
+                if method is None:
+                    return False, None
+                routing_key = method.routing_key
+                message = self._assemble(queue, properties, body)
+                if message is None:
+                    continue
+                properties, body = message
+            pending.extend(self._messages(queue, properties, body, routing_key))
+        return True, pending.popleft()
+    
+    @_recoverable(dict)
     def get(self, queues = None):
         """Fetch data in queues.topic: str, queue_size: int = -1, callback: Callable = None
 
@@ -135,24 +804,92 @@ class Subscriber(object):
                 Note queues with callback registered in channel.basic_consume will be ignored as it always returns None
 
         Returns:
-            ret (Dict[str, Any]): query results, returns {queue_name: queue_data}
+            ret (Dict[str, Any]): 
+                query results, returns {queue_name: queue_data}, keyed by the 
+                names returned by subscribe() even after recover changed them
         """
         if queues is None:
-            queues = self.queue_names
+            queues = [self._originals.get(q, q) for q in self.queue_names] if self._originals else self.queue_names
         elif isinstance(queues, str):
             queues = [queues]
         
+        self._poll()
         ret = dict()
         for queue in queues:
-            index = self.queue_names.index(queue)
+            current = self._aliases.get(queue, queue)
+            index = self._queue_index[current]
             if self.callbacks[index] is not None:
                 # this callback has been registered in channel.basic_consume, 
                 # therefore, the related queue always returns None. Here we just skip this
                 continue
-            ok, data = self._get_qdata(queue)
+            ok, data = self._get_qdata(current)
             if ok:
                 ret[queue] = data
         return ret
+    
+    @_recoverable(lambda: None)
+    def get_array(self, queue: str):
+        """Fetch all the available messages of a queue of struct messages as one structured array.
+        
+        The bodies are not decoded one by one but viewed together as a numpy
+        array of the message type's dtype (see msgtype.message_type), for
+        vectorized processing of high-rate topics.
+        
+        Returns:
+            ret (np.ndarray or None): structured array in arrival order, None if no message
+        """
+        queue = self._aliases.get(queue, queue)
+        self._poll()
+        codec = None
+        bodies = []
+        conflation = self._conflation.get(queue)
+        if conflation is not None:
+            # only the newest message is kept
+            latest = conflation.take()
+            if latest is None:
+                return None
+            codec, bodies = self.decoder.unwrap(queue, latest[0], latest[1])
+            if not bodies:
+                return None
+            conflation.count(len(bodies) - 1)
+            if not isinstance(codec, StructCodec):
+                raise ValueError("queue {} received {} messages, get_array needs messages of one "
+                                 "struct message type".format(queue, codec.content_type))
+            return codec.decode_array(bodies[-1:])
+        pending = self._pending[queue]
+        while pending:
+            # decoded earlier (e.g. intra-process messages)
+            obj = pending.popleft()
+            if isinstance(obj, TopicMessage):
+                obj = obj.data
+            codec = type(obj).codec if codec is None else codec
+            bodies.append(codec.to_record(obj))
+        raw = self._raw.get(queue)
+        while True:
+            if raw is not None:
+                if not raw:
+                    break
+                properties, body, _ = raw.popleft()
+            else:
+                method, properties, body = self.channel.basic_get(queue=queue, auto_ack=True)
+                if method is None:
+                    break
+                message = self._assemble(queue, properties, body)
+                if message is None:
+                    continue
+                properties, body = message
+            body_codec, unwrapped = self.decoder.unwrap(queue, properties, body)
+            if not unwrapped:
+                continue
+            if codec is None:
+                codec = body_codec
+            if body_codec is not codec or not isinstance(codec, StructCodec):
+                raise ValueError("queue {} received {} messages, get_array needs messages of one "
+                                 "struct message type".format(queue, body_codec.content_type))
+            bodies.extend(unwrapped)
+        if not bodies:
+            return None
+        return codec.decode_array(bodies)
 
 
 class SingleSubscriber(object):
@@ -161,7 +898,15 @@ class SingleSubscriber(object):
         topic: str, 
         queue_size: int = -1, 
         callback: Callable = None, 
-        conn: pika.BlockingConnection = None
+        conn: Union[pika.BlockingConnection, ConnectionManager, BrokerCluster] = None,
+        shm: bool = False,
+        push_get: bool = False,
+        stats: bool = False,
+        intra_process: str = None,
+        hierarchical: bool = False,
+        conflate: bool = False,
+        lazy: bool = False,
+        recover: bool = False
     ):
         """A subscriber only subscribes one topic with one queue.
 
@@ -174,10 +919,36 @@ class SingleSubscriber(object):
                 callback function when message arrives, 
                 only effective when combined with spin. If set to None, 
                 then the result can be obtained with non-blocking .get() method
-            conn (pika.BlockingConnection): 
+            conn (pika.BlockingConnection, ConnectionManager or BrokerCluster, optional): 
+                see Subscriber, with a BrokerCluster the broker owning the topic is used
+            shm (bool, optional): accept messages sent through shared memory
+            push_get (bool, optional): see Subscriber
+            stats (bool, optional): see Subscriber
+            intra_process (str, optional): see Subscriber.subscribe
+            hierarchical (bool, optional): see Subscriber.subscribe
+            conflate (bool, optional): see Subscriber.subscribe
+            lazy (bool, optional): see Subscriber.subscribe
+            recover (bool, optional): see Subscriber
         """
-        self._subscriber = Subscriber(conn)
-        self._subscriber.subscribe(topic, queue_size, callback)
+        if isinstance(conn, BrokerCluster):
+            assert not (hierarchical and is_pattern(topic)), \
+                "patterns span all the brokers of a cluster, use ClusterSubscriber"
+            conn = conn.manager_for(topic)
+        self._subscriber = Subscriber(conn, push_get, stats=stats, recover=recover)
+        self._subscriber.subscribe(topic, queue_size, callback, shm, intra_process=intra_process,
+                                   hierarchical=hierarchical, conflate=conflate, lazy=lazy)
+    
+    @property
+    def stats(self):
+        """Statistics of the queue (stats.TopicStats), None unless stats=True."""
+        registry = self._subscriber.stats
+        if registry is None:
+            return None
+        return registry.queues.get(self._subscriber.queue_names[0])
+    
+    def recovery_stats(self) -> dict:
+        """See Subscriber.recovery_stats."""
+        return self._subscriber.recovery_stats()
     
     def get(self):
         """Get data from queue (non-blocking). Do not use with spin.
@@ -187,42 +958,291 @@ class SingleSubscriber(object):
             ok (bool): whether data is valid
             data (Any): deseralized data
         """
-        ok, data = self._subscriber._get_qdata(self._subscriber.queue_names[0])
+        ok, data = self._subscriber._get_one(self._subscriber.queue_names[0])
         return ok, data
     
     def spin(self):
         self._subscriber.spin()
 
 
-class ThreadedDataGetter(object):
-    """Currenly, you'd better not use this :(
-    """
-    def __init__(self, conn: pika.BlockingConnection = None):
-        self._subscriber = Subscriber(conn)
-        self._data = dict()
+class ClusterSubscriber(object):
+    def __init__(self, cluster: BrokerCluster, **kwargs):
+        """Subscribe to topics sharded over the brokers of a BrokerCluster.
+        
+        Keeps one Subscriber per broker, created with the Subscriber arguments 
+        `kwargs` when the first topic of the broker is subscribed, so only the 
+        brokers owning the subscribed topics are connected. Queue names are 
+        those of the broker subscribers.
         
-        self.thread = threading.Thread(target=self._subscriber.spin)
-        self.thread.setDaemon(True)
+        spin() consumes every broker in its own thread, so callbacks of topics 
+        on different brokers may run concurrently.
+        """
+        self.cluster = cluster
+        self._kwargs = kwargs
+        self.subscribers = dict()  # broker name -> Subscriber
+        self._queue_nodes = dict()  # queue_name -> broker name
     
-    def data(self):
-        return self._data
+    def _subscriber(self, node: str) -> Subscriber:
+        subscriber = self.subscribers.get(node)
+        if subscriber is None:
+            subscriber = Subscriber(self.cluster.manager(node), **self._kwargs)
+            self.subscribers[node] = subscriber
+        return subscriber
+    
+    def subscribe(self, topic: str, queue_size: int = -1, callback: Callable = None, node: str = None, 
+                  **kwargs) -> Union[str, list]:
+        """Subscribe to topic on the broker owning it, see Subscriber.subscribe.
+        
+        Args:
+            node (str, optional): broker name, default is the broker owning topic
+        
+        Returns:
+            queue_name (str or list): 
+                the queue name, or the queue name on every broker for the 
+                wildcard patterns of hierarchical topics
+        """
+        if node is None and kwargs.get("hierarchical") and is_pattern(topic):
+            return [self.subscribe(topic, queue_size, callback, node, **kwargs) for node in self.cluster.nodes]
+        node = self.cluster.node_for(topic) if node is None else node
+        queue_name = self._subscriber(node).subscribe(topic, queue_size, callback, **kwargs)
+        self._queue_nodes[queue_name] = node
+        return queue_name
+    
+    @property
+    def queue_names(self) -> list:
+        return list(self._queue_nodes)
+    
+    @property
+    def connection(self):
+        """Connection of the first broker subscriber, e.g. for timers."""
+        return next(iter(self.subscribers.values())).connection
+    
+    def decode(self, queue_name: str, properties, body) -> list:
+        node = self._queue_nodes.get(queue_name)
+        subscriber = self.subscribers[node] if node is not None else next(iter(self.subscribers.values()))
+        return subscriber.decode(queue_name, properties, body)
+    
+    def get(self, queues = None) -> dict:
+        """Fetch data in queues of any broker, see Subscriber.get."""
+        if isinstance(queues, str):
+            queues = [queues]
+        ret = dict()
+        for node, subscriber in self.subscribers.items():
+            if queues is None:
+                ret.update(subscriber.get())
+                continue
+            mine = [q for q in queues if self._queue_nodes.get(q) == node]
+            if mine:
+                ret.update(subscriber.get(mine))
+        return ret
+    
+    def unsubscribe_topic(self, topic_name: str):
+        success = False
+        for subscriber in self.subscribers.values():
+            success = subscriber.unsubscribe_topic(topic_name) or success
+        self._queue_nodes = {q: n for q, n in self._queue_nodes.items() 
+                             if q in self.subscribers[n]._queue_index}
+        return success
+    
+    def unsubscribe_queue(self, queue_name: str):
+        node = self._queue_nodes.pop(queue_name, None)
+        if node is None:
+            return False
+        return self.subscribers[node].unsubscribe_queue(queue_name)
+    
+    def spin(self):
+        """Blocked, consume every broker until Ctrl+C or an error in one of them."""
+        subscribers = list(self.subscribers.values())
+        if len(subscribers) == 1:
+            subscribers[0].spin()
+            return
+        threads = [threading.Thread(target=s.spin, daemon=True) for s in subscribers]
+        for thread in threads:
+            thread.start()
+        try:
+            while all(thread.is_alive() for thread in threads):
+                threads[0].join(0.2)
+        finally:
+            print("[INFO] Stop consuming.")
+            for subscriber, thread in zip(subscribers, threads):
+                if thread.is_alive() and subscriber.connection.is_open:
+                    subscriber.connection.add_callback_threadsafe(subscriber.channel.stop_consuming)
+            for thread in threads:
+                thread.join(1.0)
+
+
+Sample = namedtuple("Sample", ["seq", "stamp", "data"])
+
+
+class _Slot(object):
+    """Latest value of one topic. Readers take `latest` without locking, 
+    the condition is only used by writers and by wait_for_new()."""
+    def __init__(self):
+        self.latest = Sample(0, None, None)
+        self.cond = threading.Condition()
+        self.closed = False
+    
+    def put(self, data):
+        with self.cond:
+            self.latest = Sample(self.latest.seq + 1, time.time(), data)
+            self.cond.notify_all()
+    
+    def close(self):
+        """Unsubscribed, wake up the waiters."""
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class ThreadedDataGetter(object):
+    def __init__(self, conn: pika.BlockingConnection = None, stats: bool = False, recover: bool = False,
+                 backoff: Backoff = None, connect: Callable = None):
+        """Receive messages in a background thread and keep the latest value of each topic.
+
+        The connection is only used by the background thread once started, 
+        subscribe/unsubscribe are marshalled onto it with add_callback_threadsafe. 
+        Reading the latest values never blocks on network I/O.
+
+        Args:
+            conn (pika.BlockingConnection, optional): 
+                connection used exclusively by the background thread, 
+                a new local connection is created if None
+            stats (bool, optional): keep statistics of every topic, see Subscriber
+            recover (bool, optional): 
+                the background thread recovers a lost connection (see Subscriber), 
+                the latest values stay readable meanwhile
+            backoff, connect (optional): see Subscriber
+        """
+        self._own_connection = conn is None
+        self._subscriber = Subscriber(conn, stats=stats, recover=recover, backoff=backoff, connect=connect)
+        self._slots = dict()  # topic -> _Slot
+        self._queues = dict()  # topic -> queue_name
+        self._stopping = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+    
+    def _run(self):
+        subscriber = self._subscriber
+        connection = subscriber.connection
+        try:
+            while not self._stopping:
+                try:
+                    connection.process_data_events(time_limit=None)
+                except CONNECTION_ERRORS as e:
+                    if not subscriber._lost(e) or not subscriber._wait_recovered(lambda: self._stopping):
+                        raise
+                    # the new connection is created here
+                    connection = subscriber.connection
+                    self._own_connection = True
+        finally:
+            if self._own_connection and connection.is_open:
+                connection.close()
+            for slot in list(self._slots.values()):
+                with slot.cond:
+                    slot.cond.notify_all()
+    
+    def _call(self, func: Callable, *args):
+        """Run func on the connection thread and wait for its result."""
+        if not self.thread.is_alive() or threading.current_thread() is self.thread:
+            return func(*args)
+        
+        done = threading.Event()
+        result = [None, None]
+        def task():
+            try:
+                result[0] = func(*args)
+            except Exception as e:
+                result[1] = e
+            finally:
+                done.set()
+        connection = self._subscriber.connection
+        connection.add_callback_threadsafe(task)
+        while not done.wait(0.1):
+            if connection is not self._subscriber.connection or not self.thread.is_alive():
+                raise pika.exceptions.ConnectionWrongStateError("connection lost before the call ran")
+        if result[1] is not None:
+            raise result[1]
+        return result[0]
     
     def start(self):
         self.thread.start()
     
-    def _set_data_callback(self, queue_name, data):
-        self._data[queue_name] = data
+    def stop(self, timeout: float = None):
+        """Stop the background thread, the connection is closed if it was created here."""
+        if not self.thread.is_alive():
+            return
+        self._stopping = True
+        # wake up process_data_events
+        if self._subscriber.connection.is_open:
+            self._subscriber.connection.add_callback_threadsafe(lambda: None)
+        self.thread.join(timeout)
+    
+    @property
+    def stats(self):
+        """stats.StatsRegistry of the background subscriber, None unless stats=True."""
+        return self._subscriber.stats
+    
+    def recovery_stats(self) -> dict:
+        """See Subscriber.recovery_stats."""
+        return self._subscriber.recovery_stats()
+    
+    def data(self):
+        """Latest data of every subscribed topic: {topic: data}, topics without data are skipped."""
+        return {topic: slot.latest.data for topic, slot in list(self._slots.items()) 
+                if slot.latest.seq > 0}
+    
+    def latest(self, topic: str) -> Sample:
+        """Latest (seq, stamp, data) of topic, seq is 0 if nothing has been received."""
+        return self._slots[topic].latest
     
-    def subscribe(self, topic: str, queue_size: int = -1):
-        queue_name = self._subscriber._attach_queue_to_exchange(topic, queue_size)
-        callback = partial(self._set_data_callback, queue_name)
-        callback = self._subscriber._attach_callback_to_queue(queue_name, callback)
-        self._subscriber._append(topic, queue_name, callback)
+    def wait_for_new(self, topic: str, timeout: float = None, seq: int = None) -> Sample:
+        """Wait for a message newer than `seq` (default: the latest one at call time).
+
+        Returns:
+            sample (Sample): (seq, stamp, data), or None on timeout, stop or unsubscribe
+        """
+        slot = self._slots[topic]
+        with slot.cond:
+            if seq is None:
+                seq = slot.latest.seq
+            ok = slot.cond.wait_for(
+                lambda: slot.latest.seq > seq or self._stopping or slot.closed, timeout)
+            if ok and not slot.closed and slot.latest.seq > seq:
+                return slot.latest
+            return None
+    
+    def _subscribe(self, topic: str, queue_size: int, shm: bool):
+        slot = self._slots[topic]
+        # only the latest value is kept, older messages are not decoded
+        return self._subscriber.subscribe(topic, queue_size, slot.put, shm, conflate=True)
+    
+    def subscribe(self, topic: str, queue_size: int = 1, shm: bool = False):
+        """Subscribe to topic, can be called before or after start().
+        
+        Subscribing the same topic again returns the existing queue.
+        """
+        if topic in self._queues:
+            return self._queues[topic]
+        self._slots.setdefault(topic, _Slot())
+        queue_name = self._call(self._subscribe, topic, queue_size, shm)
+        self._queues[topic] = queue_name
         return queue_name
     
+    def _unsubscribe(self, topic: str):
+        queue_name = self._queues.pop(topic)
+        queue_name = self._subscriber._aliases.get(queue_name, queue_name)
+        self._subscriber.unsubscribe_queue(queue_name)
+        # also cancels the consumer
+        self._subscriber.channel.queue_delete(queue_name)
+        self._slots.pop(topic).close()
+    
     def unsubscribe_topic(self, topic_name: str):
-        self._subscriber.unsubscribe_topic(topic_name)
+        if topic_name not in self._queues:
+            return False
+        self._call(self._unsubscribe, topic_name)
+        return True
     
     def unsubscribe_queue(self, queue_name: str):
-        self._subscriber.unsubscribe_queue(queue_name)
-
+        for topic, q in list(self._queues.items()):
+            if q == queue_name:
+                return self.unsubscribe_topic(topic)
+        return False
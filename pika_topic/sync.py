@@ -0,0 +1,137 @@
+from collections import deque
+from functools import partial
+from typing import Callable, List
+from .sub import Subscriber
+from .message import STAMP_HEADER
+
+
+class ApproximateTimeSynchronizer(object):
+    def __init__(
+        self,
+        subscriber: Subscriber,
+        topics: List[str],
+        callback: Callable,
+        queue_size: int = 10,
+        slop: float = 0.1,
+        shm: bool = False
+    ):
+        """Match messages of several topics by the timestamps in their "x-stamp" header,
+        similar to ROS message_filters.ApproximateTimeSynchronizer.
+
+        Publishers should stamp their messages (Publisher(stamp=True) or
+        publish(obj, stamp=t)). Messages are buffered undecoded and only the matched
+        ones are deserialized. The callback receives one message per topic, in the
+        order of `topics`, whose stamps are within `slop` seconds. Stamps of one topic
+        are expected to increase.
+
+        Example:
+            subscriber = Subscriber()
+            ApproximateTimeSynchronizer(subscriber, ["camera", "lidar", "imu"],
+                                        callback=fuse, queue_size=10, slop=0.02)
+            subscriber.spin()
+
+        Args:
+            subscriber (Subscriber): subscriber used to subscribe the topics
+            topics (List[str]): topic names
+            callback (Callable): called as callback(msg_0, msg_1, ...)
+            queue_size (int, optional): max number of buffered messages per topic
+            slop (float, optional): max difference in seconds between matched stamps
+            shm (bool, optional): accept messages sent through shared memory
+        """
+        self.subscriber = subscriber
+        self.topics = list(topics)
+        self.callback = callback
+        self.slop = slop
+        # per topic buffer of (stamp, properties, body), ordered by stamp
+        self._buffers = [deque() for _ in self.topics]
+        self._queue_size = queue_size
+        self.queue_names = []
+        self.matched = 0
+        self.drops = {t: 0 for t in self.topics}  # messages which never found a match
+        self.unstamped = {t: 0 for t in self.topics}
+
+        for i, topic in enumerate(self.topics):
+            self.queue_names.append(subscriber.subscribe(
+                topic, queue_size, partial(self._on_message, i), shm=shm, raw=True))
+
+    def _drop(self, index: int):
+        self._buffers[index].popleft()
+        self.drops[self.topics[index]] += 1
+
+    def _on_message(self, index: int, properties, body):
+        headers = properties.headers or {}
+        stamp = headers.get(STAMP_HEADER)
+        if stamp is None:
+            self.unstamped[self.topics[index]] += 1
+            return
+        buffer = self._buffers[index]
+        if buffer and stamp < buffer[-1][0]:
+            # out of order, can not be matched any more
+            self.drops[self.topics[index]] += 1
+            return
+        buffer.append((stamp, properties, body))
+        if len(buffer) > self._queue_size:
+            self._drop(index)
+        self._match()
+
+    def _candidate(self, index: int, pivot: float):
+        """Index in buffer of the message closest to pivot, None if a closer one may
+        still arrive. Messages before the candidate can not be matched any more."""
+        buffer = self._buffers[index]
+        # drop heads followed by a message not after the pivot, O(1) amortized
+        while len(buffer) > 1 and buffer[1][0] <= pivot:
+            self._drop(index)
+        head = buffer[0][0]
+        if head >= pivot:
+            return 0
+        if len(buffer) == 1:
+            return None
+        return 0 if pivot - head <= buffer[1][0] - pivot else 1
+
+    def _match(self):
+        buffers = self._buffers
+        while all(buffers):
+            # the latest head is the pivot: every other topic needs a message close to it
+            pivot = max(b[0][0] for b in buffers)
+            candidates = [self._candidate(i, pivot) for i in range(len(buffers))]
+            if None in candidates:
+                return
+            stamps = [buffers[i][c][0] for i, c in enumerate(candidates)]
+            if max(stamps) - min(stamps) <= self.slop:
+                self._emit(candidates)
+            else:
+                # the earliest candidate is too far from the pivot, it will never match
+                self._drop(stamps.index(min(stamps)))
+
+    def _emit(self, candidates: list):
+        # decode before popping, so a failure leaves the other candidates buffered
+        messages = []
+        for i, c in enumerate(candidates):
+            _, properties, body = self._buffers[i][c]
+            decoded = self.subscriber.decode(self.queue_names[i], properties, body)
+            if not decoded:
+                # e.g. the shared memory slot has been overwritten
+                for _ in range(c + 1):
+                    self._drop(i)
+                return
+            messages.append(decoded[-1])
+        for i, c in enumerate(candidates):
+            for _ in range(c):
+                self._drop(i)
+            self._buffers[i].popleft()
+        self.matched += 1
+        self.callback(*messages)
+
+
+class TimeSynchronizer(ApproximateTimeSynchronizer):
+    def __init__(
+        self,
+        subscriber: Subscriber,
+        topics: List[str],
+        callback: Callable,
+        queue_size: int = 10,
+        shm: bool = False
+    ):
+        """Match messages of several topics with exactly the same stamp,
+        see ApproximateTimeSynchronizer."""
+        super().__init__(subscriber, topics, callback, queue_size, slop=0.0, shm=shm)
@@ -0,0 +1,652 @@
+import re
+import copy
+import json
+import time
+import heapq
+import base64
+import threading
+import itertools
+from collections import deque
+from urllib.parse import urlsplit, parse_qs, unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pika
+import pika.spec
+import pika.frame
+import pika.exceptions
+from .namespace import topic_match
+from .cluster import BrokerCluster
+
+
+# server-named queues are unique across the brokers of a process, like the random names of RabbitMQ
+_queue_ids = itertools.count()
+
+
+class _Queue(object):
+    def __init__(self, name: str, arguments: dict, owner):
+        arguments = arguments or {}
+        self.name = name
+        self.messages = deque()  # (exchange, routing_key, properties, body, delivery count)
+        self.max_length = arguments.get("x-max-length")
+        self.dead_letter_exchange = arguments.get("x-dead-letter-exchange")
+        # quorum queues count the returned deliveries, in the x-delivery-count header
+        self.quorum = arguments.get("x-queue-type") == "quorum"
+        self.delivery_limit = arguments.get("x-delivery-limit")
+        self.owner = owner  # connection of an exclusive queue
+
+
+class LocalBroker(object):
+    def __init__(self, delivery_batch: int = 64):
+        """In-process stand-in for a RabbitMQ broker, for tests and benchmarks without a server.
+
+        Connections returned by connection() behave like pika.BlockingConnection for
+        what pika_topic uses: fanout/direct/topic exchanges, exclusive and shared
+        queues with x-max-length and x-dead-letter-exchange, quorum queues with
+        x-delivery-limit, basic_get/consume/ack/nack,
+        basic_qos, publisher confirms, call_later and add_callback_threadsafe.
+        Messages are passed by reference, nothing is copied or sent over a socket.
+
+        Every connection must be used by one thread only, like pika connections.
+
+        Example:
+            broker = LocalBroker()
+            publisher = Publisher("topic", broker.connection())
+            subscriber = Subscriber(broker.connection())
+
+        Args:
+            delivery_batch (int, optional): max messages delivered to one consumer
+                per process_data_events pass
+        """
+        self.delivery_batch = delivery_batch
+        self.exchanges = dict()  # name -> (exchange_type, set of (queue_name, routing_key))
+        self.queues = dict()  # name -> _Queue
+        self.connections = []
+        self._counter = itertools.count()
+        self._lock = threading.RLock()
+        self._cond = threading.Condition(self._lock)
+        self._down_until = 0.0
+
+    def connection(self) -> "LocalConnection":
+        if time.monotonic() < self._down_until:
+            raise pika.exceptions.AMQPConnectionError("broker is down")
+        connection = LocalConnection(self)
+        with self._lock:
+            self.connections.append(connection)
+        return connection
+
+    def connect(self, parameters: pika.ConnectionParameters = None) -> "LocalConnection":
+        """connect function of ConnectionManager and Subscriber, parameters are ignored."""
+        return self.connection()
+
+    def close_connections(self, down_for: float = 0):
+        """Close every connection as if the broker went down, e.g. to test reconnection.
+
+        New connections are refused for down_for seconds.
+        """
+        self._down_until = time.monotonic() + down_for
+        with self._lock:
+            connections = list(self.connections)
+        for connection in connections:
+            connection._lost()
+
+    def _route(self, exchange: str, routing_key: str, properties, body: bytes):
+        with self._lock:
+            if exchange == "":
+                queue_names = [routing_key]
+            else:
+                exchange_type, bindings = self.exchanges[exchange]
+                queue_names = [q for q, key in bindings
+                               if exchange_type == "fanout"
+                               or (exchange_type == "direct" and key == routing_key)
+                               or (exchange_type == "topic" and topic_match(key, routing_key))]
+            for queue_name in queue_names:
+                queue = self.queues.get(queue_name)
+                if queue is None:
+                    continue
+                queue.messages.append((exchange, routing_key, properties, body, 0))
+                if queue.max_length is not None and len(queue.messages) > queue.max_length:
+                    queue.messages.popleft()
+            self._cond.notify_all()
+
+    def _dead_letter(self, queue_name: str, message: tuple):
+        queue = self.queues.get(queue_name)
+        if queue is None or queue.dead_letter_exchange is None:
+            return
+        if queue.dead_letter_exchange not in self.exchanges:
+            return
+        exchange, routing_key, properties, body, _ = message
+        self._route(queue.dead_letter_exchange, routing_key, properties, body)
+
+    def _requeue(self, queue_name: str, message: tuple):
+        with self._lock:
+            queue = self.queues.get(queue_name)
+            if queue is not None:
+                exchange, routing_key, properties, body, count = message
+                count += 1
+                if queue.delivery_limit is not None and count > queue.delivery_limit:
+                    self._dead_letter(queue_name, message)
+                else:
+                    if queue.quorum:
+                        properties = copy.copy(properties)
+                        properties.headers = dict(properties.headers or {}, **{"x-delivery-count": count})
+                    queue.messages.appendleft((exchange, routing_key, properties, body, count))
+            self._cond.notify_all()
+
+    def _wake(self):
+        with self._lock:
+            self._cond.notify_all()
+
+    def _wait(self, timeout: float):
+        with self._lock:
+            self._cond.wait(timeout)
+
+
+class LocalConnection(object):
+    def __init__(self, broker: LocalBroker):
+        self.broker = broker
+        self.is_open = True
+        self.is_closed = False
+        self._channels = []
+        self._callbacks = deque()
+        self._callbacks_lock = threading.Lock()
+        self._timers = []  # heap of (deadline, timer_id, callback)
+        self._timer_ids = itertools.count()
+        self._impl = self
+        self._error = None  # raised by the next process_data_events after the connection was lost
+
+    def channel(self) -> "LocalChannel":
+        self._check_open()
+        channel = LocalChannel(self, len(self._channels) + 1)
+        self._channels.append(channel)
+        return channel
+
+    def _check_open(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        if not self.is_open:
+            raise pika.exceptions.ConnectionWrongStateError("Connection is closed")
+
+    def add_callback_threadsafe(self, callback):
+        with self._callbacks_lock:
+            self._callbacks.append(callback)
+        self.broker._wake()
+
+    def call_later(self, delay: float, callback):
+        timer_id = next(self._timer_ids)
+        heapq.heappush(self._timers, (time.monotonic() + delay, timer_id, callback))
+        return timer_id
+
+    def remove_timeout(self, timer_id):
+        self._timers = [t for t in self._timers if t[1] != timer_id]
+        heapq.heapify(self._timers)
+
+    def _dispatch(self) -> int:
+        n = 0
+        while True:
+            with self._callbacks_lock:
+                if not self._callbacks:
+                    break
+                callback = self._callbacks.popleft()
+            callback()
+            n += 1
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, callback = heapq.heappop(self._timers)
+            callback()
+            n += 1
+        for channel in list(self._channels):
+            if channel.is_open:
+                n += channel._deliver()
+        return n
+
+    def process_data_events(self, time_limit: float = 0):
+        """Dispatch callbacks, timers and deliveries, waits up to time_limit
+        (forever if None) for at least one event."""
+        self._check_open()
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        while True:
+            if self._dispatch() or not self.is_open:
+                if self._error is not None:
+                    self._check_open()
+                return
+            wait = 0.01
+            if self._timers:
+                wait = min(wait, max(0.0, self._timers[0][0] - time.monotonic()))
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                wait = min(wait, remaining)
+            self.broker._wait(wait)
+
+    def sleep(self, duration: float):
+        deadline = time.monotonic() + duration
+        while self.is_open and time.monotonic() < deadline:
+            self.process_data_events(deadline - time.monotonic())
+
+    def _lost(self):
+        """Connection lost without the client closing it, like pika the next process_data_events raises."""
+        self.close()
+        self._error = pika.exceptions.StreamLostError("Transport indicated EOF")
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        self.is_closed = True
+        for channel in self._channels:
+            channel._close()
+        broker = self.broker
+        with broker._lock:
+            for name in [q.name for q in broker.queues.values() if q.owner is self]:
+                broker.queues.pop(name)
+                for _, bindings in broker.exchanges.values():
+                    for binding in [b for b in bindings if b[0] == name]:
+                        bindings.discard(binding)
+            if self in broker.connections:
+                broker.connections.remove(self)
+
+
+class LocalChannel(object):
+    def __init__(self, connection: LocalConnection, channel_number: int):
+        self.connection = connection
+        self.broker = connection.broker
+        self.channel_number = channel_number
+        self.is_open = True
+        self.is_closed = False
+        self._consumers = dict()  # consumer_tag -> [queue_name, callback, auto_ack, unacked count]
+        self._deliveries = deque()  # (consumer_tag, method, properties, body) not dispatched yet
+        self._unacked = dict()  # delivery_tag -> (consumer_tag, queue_name, message)
+        self._delivery_tags = itertools.count(1)
+        self._prefetch_count = 0
+        self._consuming = False
+        self._confirm_callback = None
+        self._publish_tag = 0
+        self._impl = self
+
+    @property
+    def consumer_tags(self):
+        return list(self._consumers)
+
+    def _check_open(self):
+        if not self.is_open:
+            raise pika.exceptions.ChannelWrongStateError("Channel is closed.")
+
+    def _not_found(self, what: str):
+        self._close()
+        raise pika.exceptions.ChannelClosedByBroker(404, "NOT_FOUND - no {}".format(what))
+
+    def confirm_delivery(self, ack_nack_callback=None, callback=None):
+        self._check_open()
+        self._confirm_callback = ack_nack_callback
+        self._reply(callback, pika.spec.Confirm.SelectOk())
+
+    def _reply(self, callback, method):
+        """Asynchronous reply of the _impl API, nothing is sent back without callback (nowait)."""
+        if callback is not None:
+            frame = pika.frame.Method(self.channel_number, method)
+            self.connection.add_callback_threadsafe(lambda: callback(frame))
+
+    def exchange_declare(self, exchange: str, exchange_type: str = "direct", callback=None, **kwargs):
+        self._check_open()
+        with self.broker._lock:
+            self.broker.exchanges.setdefault(exchange, (str(exchange_type), set()))
+        self._reply(callback, pika.spec.Exchange.DeclareOk())
+
+    def exchange_delete(self, exchange: str = None, if_unused: bool = False, callback=None):
+        self._check_open()
+        with self.broker._lock:
+            self.broker.exchanges.pop(exchange, None)
+        self._reply(callback, pika.spec.Exchange.DeleteOk())
+
+    def queue_declare(self, queue: str = "", exclusive: bool = False, arguments: dict = None, **kwargs):
+        self._check_open()
+        broker = self.broker
+        with broker._lock:
+            if not queue:
+                queue = "amq.gen-{}".format(next(_queue_ids))
+            if queue not in broker.queues:
+                owner = self.connection if exclusive else None
+                broker.queues[queue] = _Queue(queue, arguments, owner)
+            q = broker.queues[queue]
+            consumers = sum(1 for c in broker.connections for ch in c._channels
+                            for cons in ch._consumers.values() if cons[0] == queue)
+            method = pika.spec.Queue.DeclareOk(queue, len(q.messages), consumers)
+        return pika.frame.Method(self.channel_number, method)
+
+    def queue_delete(self, queue: str, **kwargs):
+        self._check_open()
+        with self.broker._lock:
+            self.broker.queues.pop(queue, None)
+            for _, bindings in self.broker.exchanges.values():
+                for binding in [b for b in bindings if b[0] == queue]:
+                    bindings.discard(binding)
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: str = None, **kwargs):
+        self._check_open()
+        with self.broker._lock:
+            if exchange not in self.broker.exchanges:
+                self._not_found("exchange '{}'".format(exchange))
+            if queue not in self.broker.queues:
+                self._not_found("queue '{}'".format(queue))
+            self.broker.exchanges[exchange][1].add((queue, routing_key or ""))
+
+    def queue_unbind(self, queue: str, exchange: str = None, routing_key: str = None, **kwargs):
+        self._check_open()
+        with self.broker._lock:
+            if exchange in self.broker.exchanges:
+                self.broker.exchanges[exchange][1].discard((queue, routing_key or ""))
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes, properties=None, mandatory: bool = False):
+        self._check_open()
+        if exchange and exchange not in self.broker.exchanges:
+            self._not_found("exchange '{}'".format(exchange))
+        self.broker._route(exchange, routing_key, properties or pika.BasicProperties(), body)
+        if self._confirm_callback is not None:
+            self._publish_tag += 1
+            frame = pika.frame.Method(self.channel_number,
+                                      pika.spec.Basic.Ack(delivery_tag=self._publish_tag))
+            self.connection.add_callback_threadsafe(lambda: self._confirm_callback(frame))
+
+    def basic_qos(self, prefetch_size: int = 0, prefetch_count: int = 0, global_qos: bool = False):
+        self._check_open()
+        self._prefetch_count = prefetch_count
+
+    def basic_get(self, queue: str, auto_ack: bool = False):
+        self._check_open()
+        with self.broker._lock:
+            q = self.broker.queues.get(queue)
+            if q is None:
+                self._not_found("queue '{}'".format(queue))
+            if not q.messages:
+                return None, None, None
+            message = q.messages.popleft()
+        exchange, routing_key, properties, body, count = message
+        tag = next(self._delivery_tags)
+        if not auto_ack:
+            self._unacked[tag] = (None, queue, message)
+        method = pika.spec.Basic.GetOk(tag, count > 0, exchange, routing_key, len(q.messages))
+        return method, properties, body
+
+    def basic_consume(self, queue: str, on_message_callback, auto_ack: bool = False, consumer_tag: str = None, **kwargs):
+        self._check_open()
+        with self.broker._lock:
+            if queue not in self.broker.queues:
+                self._not_found("queue '{}'".format(queue))
+            if consumer_tag is None:
+                consumer_tag = "ctag{}.{}".format(self.channel_number, next(self.broker._counter))
+        self._consumers[consumer_tag] = [queue, on_message_callback, auto_ack, 0]
+        return consumer_tag
+
+    def basic_cancel(self, consumer_tag: str):
+        self._consumers.pop(consumer_tag, None)
+        for tag, (ctag, queue, message) in list(self._unacked.items()):
+            if ctag == consumer_tag:
+                self._unacked.pop(tag)
+                self.broker._requeue(queue, message)
+
+    def _settle(self, delivery_tag: int, multiple: bool):
+        if multiple:
+            tags = [t for t in self._unacked if t <= delivery_tag]
+        else:
+            tags = [delivery_tag] if delivery_tag in self._unacked else []
+        settled = []
+        for tag in tags:
+            consumer_tag, queue, message = self._unacked.pop(tag)
+            consumer = self._consumers.get(consumer_tag)
+            if consumer is not None:
+                consumer[3] -= 1
+            settled.append((queue, message))
+        if settled:
+            self.broker._wake()
+        return settled
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False):
+        self._check_open()
+        self._settle(delivery_tag, multiple)
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True):
+        self._check_open()
+        for queue, message in self._settle(delivery_tag, multiple):
+            if requeue:
+                self.broker._requeue(queue, message)
+            else:
+                self.broker._dead_letter(queue, message)
+
+    def basic_reject(self, delivery_tag: int = 0, requeue: bool = True):
+        self.basic_nack(delivery_tag, False, requeue)
+
+    def _deliver(self) -> int:
+        broker = self.broker
+        pending = self._deliveries
+        for consumer_tag, consumer in list(self._consumers.items()):
+            queue, callback, auto_ack = consumer[:3]
+            for _ in range(broker.delivery_batch):
+                if not auto_ack and self._prefetch_count and consumer[3] >= self._prefetch_count:
+                    break
+                with broker._lock:
+                    q = broker.queues.get(queue)
+                    if q is None or not q.messages:
+                        break
+                    message = q.messages.popleft()
+                exchange, routing_key, properties, body, count = message
+                tag = next(self._delivery_tags)
+                if not auto_ack:
+                    self._unacked[tag] = (consumer_tag, queue, message)
+                    consumer[3] += 1
+                method = pika.spec.Basic.Deliver(consumer_tag, tag, count > 0, exchange, routing_key)
+                pending.append((consumer_tag, method, properties, body))
+        # like BlockingChannel, the deliveries received in one pass are queued, then dispatched
+        n = 0
+        while pending and self.is_open:
+            consumer_tag, method, properties, body = pending.popleft()
+            consumer = self._consumers.get(consumer_tag)
+            if consumer is None:
+                continue
+            consumer[1](self, method, properties, body)
+            n += 1
+        return n
+
+    def start_consuming(self):
+        self._consuming = True
+        while self._consuming and self.is_open:
+            self.connection.process_data_events(time_limit=None)
+        if self.connection._error is not None:
+            # lost while consuming
+            self.connection._check_open()
+
+    def stop_consuming(self, consumer_tag: str = None):
+        self._consuming = False
+
+    def _close(self):
+        if not self.is_open:
+            return
+        self.is_open = False
+        self.is_closed = True
+        self._consumers.clear()
+        self._deliveries.clear()
+        # unacked messages go back to their queues, like RabbitMQ does
+        for tag, (_, queue, message) in list(self._unacked.items()):
+            self.broker._requeue(queue, message)
+        self._unacked.clear()
+
+    def close(self, reply_code: int = 0, reply_text: str = "Normal shutdown"):
+        self._check_open()
+        self._close()
+
+
+_DEFAULT_EXCHANGES = ["", "amq.direct", "amq.fanout", "amq.headers", "amq.match", "amq.rabbitmq.trace", "amq.topic"]
+
+
+class ManagementStub(object):
+    def __init__(self, broker: LocalBroker = None, exchanges: list = None, username: str = "guest",
+                 password: str = "guest", host: str = "127.0.0.1", port: int = 0):
+        """HTTP stub of the RabbitMQ management API, serves GET /api/exchanges.
+
+        Supports the pagination (page, page_size), name filtering (name, use_regex),
+        sort and columns query parameters, and basic auth. Exchanges are those of
+        `broker` if given, else the `exchanges` list of dicts, plus the default
+        amq.* exchanges owned by "rmq-internal".
+
+        Example:
+            broker = LocalBroker()
+            with ManagementStub(broker) as stub:
+                fetch_all_exchanges(stub.host_port, "guest", "guest")
+
+        Args:
+            port (int, optional): port to listen on, 0 picks a free one
+        """
+        self.broker = broker
+        self.exchanges = exchanges or []
+        self.username = username
+        self.password = password
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                stub._handle(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.host_port = "{}:{}".format(*self.server.server_address[:2])
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _all_exchanges(self) -> list:
+        ret = [{"name": n, "vhost": "/", "type": "direct", "durable": True, "auto_delete": False,
+                "internal": n.startswith("amq.r"), "user_who_performed_action": "rmq-internal",
+                "arguments": {}} for n in _DEFAULT_EXCHANGES]
+        if self.broker is not None:
+            with self.broker._lock:
+                items = list(self.broker.exchanges.items())
+            ret += [{"name": name, "vhost": "/", "type": exchange_type, "durable": True,
+                     "auto_delete": False, "internal": False, "user_who_performed_action": self.username,
+                     "arguments": {}} for name, (exchange_type, _) in items]
+        return ret + list(self.exchanges)
+
+    def _reply(self, handler, code: int, body):
+        data = json.dumps(body).encode()
+        handler.send_response(code)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _handle(self, handler):
+        expected = "Basic " + base64.b64encode("{}:{}".format(self.username, self.password).encode()).decode()
+        if handler.headers.get("Authorization") != expected:
+            self._reply(handler, 401, {"error": "not_authorized", "reason": "Login failed"})
+            return
+        url = urlsplit(handler.path)
+        parts = [unquote(p) for p in url.path.split("/") if p]
+        if parts[:2] != ["api", "exchanges"] or len(parts) > 3:
+            self._reply(handler, 404, {"error": "Object Not Found", "reason": "Not Found"})
+            return
+        query = {k: v[-1] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+
+        exchanges = self._all_exchanges()
+        if len(parts) == 3:
+            exchanges = [e for e in exchanges if e["vhost"] == parts[2]]
+        total = len(exchanges)
+        name = query.get("name")
+        if name:
+            if query.get("use_regex") == "true":
+                pattern = re.compile(name)
+                exchanges = [e for e in exchanges if pattern.search(e["name"])]
+            else:
+                exchanges = [e for e in exchanges if name.lower() in e["name"].lower()]
+        if "sort" in query:
+            exchanges.sort(key=lambda e: e.get(query["sort"]), reverse=query.get("sort_reverse") == "true")
+        if "columns" in query:
+            columns = query["columns"].split(",")
+            exchanges = [{c: e[c] for c in columns if c in e} for e in exchanges]
+        if "page" not in query:
+            self._reply(handler, 200, exchanges)
+            return
+
+        page = int(query["page"])
+        page_size = int(query.get("page_size", 100))
+        page_count = max((len(exchanges) + page_size - 1) // page_size, 1)
+        if page > page_count:
+            self._reply(handler, 400, {"error": "bad_request", "reason": "page_out_of_range"})
+            return
+        items = exchanges[(page - 1) * page_size:page * page_size]
+        self._reply(handler, 200, {
+            "filtered_count": len(exchanges),
+            "item_count": len(items),
+            "items": items,
+            "page": page,
+            "page_count": page_count,
+            "page_size": page_size,
+            "total_count": total,
+        })
+
+
+class LocalCluster(object):
+    def __init__(self, n_nodes: int = 3, username: str = "guest", password: str = "guest",
+                 host: str = "127.0.0.1"):
+        """Several LocalBroker stand-ins of a cluster.BrokerCluster, on different ports.
+
+        Every broker gets a ManagementStub listening on a port of its own, which
+        is also the AMQP port of its endpoint "host:port:port", so the endpoints
+        work with the management queries of the tools and with connect().
+
+        Example:
+            with LocalCluster(3) as local:
+                cluster = local.cluster()
+                publisher = Publisher("topic", cluster)
+
+        Args:
+            n_nodes (int, optional): number of brokers to start with
+        """
+        self.username = username
+        self.password = password
+        self.host = host
+        self.brokers = dict()  # broker name "host:port" -> LocalBroker
+        self.stubs = dict()  # broker name -> ManagementStub
+        for _ in range(n_nodes):
+            self.add_node()
+
+    def add_node(self) -> str:
+        """Start a broker, returns its endpoint."""
+        broker = LocalBroker()
+        stub = ManagementStub(broker, username=self.username, password=self.password, host=self.host)
+        self.brokers[stub.host_port] = broker
+        self.stubs[stub.host_port] = stub
+        return "{}:{}".format(stub.host_port, stub.server.server_address[1])
+
+    @property
+    def endpoints(self) -> list:
+        return ["{}:{}".format(name, stub.server.server_address[1]) for name, stub in self.stubs.items()]
+
+    def connect(self, parameters: pika.ConnectionParameters) -> LocalConnection:
+        """connect function of BrokerCluster and ConnectionManager."""
+        return self.brokers["{}:{}".format(parameters.host, parameters.port)].connection()
+
+    def cluster(self, **kwargs):
+        """BrokerCluster of the brokers, kwargs are passed to it."""
+        return BrokerCluster(self.endpoints, connect=self.connect, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        for stub in self.stubs.values():
+            stub.close()
@@ -0,0 +1,212 @@
+import math
+import time
+import heapq
+import itertools
+from typing import Callable
+
+
+SLEEP_MODES = ("sleep", "hybrid", "spin")
+
+
+class Timer(object):
+    def __init__(self, period: float, callback: Callable = None, name: str = None):
+        """Periodic timer of a TimerExecutor, see TimerExecutor.create_timer.
+
+        Deadlines are start + k * period, so errors do not accumulate (drift
+        compensation). When the timer falls behind by more than one period, the
+        missed ticks are skipped instead of fired in a burst.
+        """
+        self.period = period
+        self.callback = callback
+        self.name = name
+        self.cancelled = False
+        self.deadline = None
+        self._start = None
+        self._k = 0
+        # statistics
+        self.count = 0
+        self.overruns = 0  # ticks which fired more than one period late
+        self.missed = 0  # skipped ticks
+        self._lateness_sum = 0.0
+        self._lateness_sq_sum = 0.0
+        self.lateness_max = 0.0
+        self._duration_sum = 0.0
+        self.duration_max = 0.0
+
+    def start(self, now: float):
+        self._start = now
+        self._k = 1
+        self.deadline = now + self.period
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _fired(self, now: float):
+        """Record the lateness of the tick due at self.deadline and schedule the next one."""
+        lateness = now - self.deadline
+        self.count += 1
+        self._lateness_sum += lateness
+        self._lateness_sq_sum += lateness * lateness
+        self.lateness_max = max(self.lateness_max, lateness)
+        if lateness >= self.period:
+            skipped = int(lateness // self.period)
+            self.overruns += 1
+            self.missed += skipped
+            self._k += skipped
+        self._k += 1
+        self.deadline = self._start + self._k * self.period
+
+    def _ran(self, duration: float):
+        self._duration_sum += duration
+        self.duration_max = max(self.duration_max, duration)
+
+    def stats(self) -> dict:
+        """Tick count, overruns, missed ticks, lateness (jitter) and callback duration in seconds."""
+        n = max(self.count, 1)
+        mean = self._lateness_sum / n
+        return {
+            "period": self.period,
+            "count": self.count,
+            "overruns": self.overruns,
+            "missed": self.missed,
+            "lateness_mean": mean,
+            "lateness_std": math.sqrt(max(self._lateness_sq_sum / n - mean * mean, 0.0)),
+            "lateness_max": self.lateness_max,
+            "duration_mean": self._duration_sum / n,
+            "duration_max": self.duration_max,
+        }
+
+
+class TimerExecutor(object):
+    def __init__(
+        self,
+        connection=None,
+        sleep_mode: str = "hybrid",
+        max_spin: float = 100e-6,
+        spin_fraction: float = 0.05
+    ):
+        """Run periodic timers and subscription callbacks on one thread.
+
+        Timers are kept in a heap ordered by deadline. While waiting for the next
+        deadline, the connection (if any) processes I/O with
+        process_data_events(time_limit=...), so subscriber callbacks run in between.
+
+        Example:
+            subscriber = Subscriber()
+            subscriber.subscribe("joint_states", callback=on_state)
+            executor = TimerExecutor(subscriber.connection)
+            executor.create_timer(1 / 500, control_step)
+            executor.create_timer(1 / 10, publish_status)
+            executor.spin()
+
+        Args:
+            connection (pika.BlockingConnection, optional):
+                connection whose events are processed while waiting
+            sleep_mode (str, optional):
+                "sleep" waits with the OS only (lowest CPU, lateness of the OS
+                scheduler), "spin" busy-waits (most precise, one full core),
+                "hybrid" waits with the OS until a short margin before the
+                deadline and busy-waits the rest
+            max_spin (float, optional): max busy-wait in seconds per tick in hybrid mode
+            spin_fraction (float, optional):
+                max busy-wait as a fraction of the timer period in hybrid mode,
+                bounds the CPU used by spinning
+        """
+        assert sleep_mode in SLEEP_MODES, "unknown sleep_mode: {}".format(sleep_mode)
+        self.connection = connection
+        self.sleep_mode = sleep_mode
+        self.max_spin = max_spin
+        self.spin_fraction = spin_fraction
+        self.timers = []
+        self._heap = []  # (deadline, seq, timer)
+        self._seq = itertools.count()
+        self._stopping = False
+
+    def create_timer(self, period: float, callback: Callable, name: str = None) -> Timer:
+        """Call callback() every period seconds, first call one period from now."""
+        timer = Timer(period, callback, name)
+        timer.start(time.perf_counter())
+        self.timers.append(timer)
+        heapq.heappush(self._heap, (timer.deadline, next(self._seq), timer))
+        return timer
+
+    def cancel_timer(self, timer: Timer):
+        timer.cancel()
+        if timer in self.timers:
+            self.timers.remove(timer)
+
+    def _spin_margin(self, period: float) -> float:
+        if self.sleep_mode == "sleep":
+            return 0.0
+        if self.sleep_mode == "spin":
+            return math.inf
+        return min(self.max_spin, self.spin_fraction * period)
+
+    def wait_until(self, deadline: float, period: float = math.inf):
+        """Wait until deadline (time.perf_counter() clock), processing connection events if any."""
+        margin = self._spin_margin(period)
+        connection = self.connection
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining <= margin:
+                break
+            if connection is not None:
+                connection.process_data_events(time_limit=remaining - margin)
+            else:
+                time.sleep(remaining - margin)
+        # busy-wait the margin, the spin mode keeps processing events
+        poll = connection is not None and self.sleep_mode == "spin"
+        while time.perf_counter() < deadline:
+            if poll:
+                connection.process_data_events(time_limit=0)
+
+    def _next(self):
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+    def spin_once(self, timeout: float = None):
+        """Wait for the next timer (at most timeout seconds) and run the due timers."""
+        entry = self._next()
+        if entry is None:
+            if self.connection is not None:
+                self.connection.process_data_events(time_limit=timeout)
+            elif timeout is not None:
+                time.sleep(timeout)
+            return
+        deadline, _, timer = entry
+        if timeout is not None and deadline > time.perf_counter() + timeout:
+            self.wait_until(time.perf_counter() + timeout)
+            return
+        self.wait_until(deadline, timer.period)
+
+        now = time.perf_counter()
+        while self._heap and self._heap[0][0] <= now:
+            _, _, timer = heapq.heappop(self._heap)
+            if timer.cancelled:
+                continue
+            timer._fired(now)
+            heapq.heappush(self._heap, (timer.deadline, next(self._seq), timer))
+            t0 = time.perf_counter()
+            timer.callback()
+            timer._ran(time.perf_counter() - t0)
+            now = time.perf_counter()
+
+    def spin(self):
+        """Run timers and callbacks until stop() is called."""
+        self._stopping = False
+        try:
+            while not self._stopping:
+                self.spin_once()
+        except KeyboardInterrupt:
+            print("[INFO] Stop spinning.")
+            raise
+
+    def stop(self):
+        """Make spin() return, call from a timer or subscription callback."""
+        self._stopping = True
+
+    def stats(self) -> dict:
+        """{name or index: Timer.stats()} of the active timers."""
+        return {t.name if t.name is not None else i: t.stats() for i, t in enumerate(self.timers)}
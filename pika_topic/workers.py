@@ -0,0 +1,201 @@
+import time
+import pika
+import argparse
+import importlib
+import multiprocessing
+from typing import Callable, Union
+from .sub import Subscriber
+
+
+def resolve_callback(target: Union[str, Callable]) -> Callable:
+    """"package.module:function" -> function, callables are returned as is."""
+    if callable(target):
+        return target
+    module_name, _, name = target.partition(":")
+    assert name, "callback should be given as package.module:function, got {}".format(target)
+    obj = importlib.import_module(module_name)
+    for attr in name.split("."):
+        obj = getattr(obj, attr)
+    return obj
+
+
+def _worker_main(target, topic: str, group: str, parameters: pika.ConnectionParameters, options: dict):
+    callback = resolve_callback(target)
+    connection = pika.BlockingConnection(parameters)
+    subscriber = Subscriber(connection, prefetch_count=options.pop("prefetch_count"))
+    subscriber.subscribe(topic, callback=callback, group=group, **options)
+    try:
+        subscriber.spin()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if connection.is_open:
+            connection.close()
+
+
+class WorkerPool(object):
+    def __init__(
+        self,
+        callback: Union[str, Callable],
+        topic: str,
+        group: str,
+        n_workers: int = 4,
+        parameters: pika.ConnectionParameters = None,
+        prefetch_count: int = 1,
+        queue_size: int = -1,
+        shm: bool = False,
+        hierarchical: bool = False,
+        max_redeliveries: int = 3,
+        dead_letter: str = None,
+        restart: bool = True,
+        restart_delay: float = 1.0,
+        start_method: str = "spawn"
+    ):
+        """Run a pool of worker processes sharing the group queue of a topic.
+
+        Every worker opens its own connection and subscribes with
+        Subscriber.subscribe(topic, callback=callback, group=group), so the broker
+        load-balances the messages between them; pools started on several hosts
+        with the same group share the work too. Workers which die are restarted
+        (their unacked message is redelivered to another worker, at most
+        max_redeliveries times).
+
+        Example:
+            pool = WorkerPool("detector.model:on_frame", "camera", "detectors", n_workers=8)
+            pool.start()
+            pool.join()
+
+        Args:
+            callback (str or Callable):
+                "package.module:function" imported by each worker, or a picklable
+                callable (module level function)
+            topic (str): topic name
+            group (str): group name
+            n_workers (int, optional): number of worker processes
+            parameters (pika.ConnectionParameters, optional): broker of the workers, default is localhost
+            prefetch_count (int, optional): unacked messages per worker, 1 dispatches fairly long tasks
+            queue_size, shm, hierarchical, max_redeliveries, dead_letter: see Subscriber.subscribe
+            restart (bool, optional): restart workers which exited
+            restart_delay (float, optional): seconds to wait before restarting a worker
+            start_method (str, optional): multiprocessing start method
+        """
+        self.callback = callback
+        self.topic = topic
+        self.group = group
+        self.n_workers = n_workers
+        self.parameters = pika.ConnectionParameters() if parameters is None else parameters
+        self.options = {
+            "prefetch_count": prefetch_count,
+            "queue_size": queue_size,
+            "shm": shm,
+            "hierarchical": hierarchical,
+            "max_redeliveries": max_redeliveries,
+            "dead_letter": dead_letter,
+        }
+        self.restart = restart
+        self.restart_delay = restart_delay
+        self._context = multiprocessing.get_context(start_method)
+        self.workers = [None] * n_workers
+        self._died_at = [None] * n_workers
+        self.restarts = 0
+        self._stopping = False
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.callback, self.topic, self.group, self.parameters, dict(self.options)),
+            name="{}-worker-{}".format(self.group, index),
+            daemon=True
+        )
+        process.start()
+        self.workers[index] = process
+        self._died_at[index] = None
+
+    def start(self):
+        self._stopping = False
+        for i in range(self.n_workers):
+            self._spawn(i)
+
+    @property
+    def alive(self) -> int:
+        return sum(1 for w in self.workers if w is not None and w.is_alive())
+
+    def check(self):
+        """Restart the workers which exited, after restart_delay."""
+        now = time.monotonic()
+        for i, worker in enumerate(self.workers):
+            if worker is None or worker.is_alive() or self._stopping or not self.restart:
+                continue
+            if self._died_at[i] is None:
+                self._died_at[i] = now
+                print("[WARN] Worker {} exited with code {}.".format(worker.name, worker.exitcode))
+            if now - self._died_at[i] >= self.restart_delay:
+                self.restarts += 1
+                self._spawn(i)
+
+    def join(self, poll_interval: float = 0.5):
+        """Supervise the workers until they all exit (restart=False) or Ctrl+C."""
+        try:
+            while True:
+                self.check()
+                if not self.restart and self.alive == 0:
+                    return
+                time.sleep(poll_interval)
+        except KeyboardInterrupt:
+            print("[INFO] Stop workers.")
+            self.stop()
+
+    def stop(self, timeout: float = 5.0):
+        self._stopping = True
+        for worker in self.workers:
+            if worker is not None and worker.is_alive():
+                worker.terminate()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            if worker is not None:
+                worker.join(max(deadline - time.monotonic(), 0))
+
+
+def parse_opt():
+    parser = argparse.ArgumentParser(description="Run a pool of workers sharing the messages of a topic.")
+    default_param = pika.ConnectionParameters
+    parser.add_argument("callback", type=str, help="callback called with each message, as package.module:function")
+    parser.add_argument("-t", "--topic", type=str, required=True, help="topic name")
+    parser.add_argument("-g", "--group", type=str, required=True, help="group name, shared with the pools of other hosts")
+    parser.add_argument("-n", "--workers", type=int, default=multiprocessing.cpu_count(),
+                        help="number of worker processes, default is the number of CPUs")
+    parser.add_argument("--prefetch", type=int, default=1, help="unacked messages per worker, default is 1")
+    parser.add_argument("--max_redeliveries", type=int, default=3,
+                        help="deliveries of a message after the first one before it is dead-lettered, default is 3")
+    parser.add_argument("--dead_letter", type=str, default=None,
+                        help="topic receiving the messages which exceeded max_redeliveries")
+    parser.add_argument("--hierarchical", action="store_true", help="the topic is a hierarchical topic")
+    parser.add_argument("--shm", action="store_true", help="accept shared memory messages")
+    parser.add_argument("-ip", "--ip", type=str, default=default_param.DEFAULT_HOST,
+                        help=f"address of rabbitmq-server, default is {default_param.DEFAULT_HOST}")
+    parser.add_argument("-pp", "--pika_port", type=int, default=default_param.DEFAULT_PORT,
+                        help=f"port of rabbitmq-server, default is {default_param.DEFAULT_PORT}")
+    default_auth = "@".join([default_param.DEFAULT_USERNAME, default_param.DEFAULT_PASSWORD])
+    parser.add_argument("-a", "--auth", type=str, default=default_auth,
+                        help=f"auth to establish connection to host, format is username@passwd, default is {default_auth}")
+    opt = parser.parse_args()
+    return opt
+
+
+def main():
+    opt = parse_opt()
+    # fail early on a wrong callback
+    resolve_callback(opt.callback)
+    username, password = opt.auth.strip().split("@")
+    parameters = pika.ConnectionParameters(host=opt.ip, port=opt.pika_port,
+                                           credentials=pika.PlainCredentials(username, password))
+    pool = WorkerPool(opt.callback, opt.topic, opt.group, opt.workers, parameters, opt.prefetch,
+                      shm=opt.shm, hierarchical=opt.hierarchical, max_redeliveries=opt.max_redeliveries,
+                      dead_letter=opt.dead_letter)
+    print("[INFO] Starting {} workers of group {} on topic {}...".format(opt.workers, opt.group, opt.topic))
+    pool.start()
+    pool.join()
+
+
+if __name__ == "__main__":
+    main()
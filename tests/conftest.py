@@ -0,0 +1,152 @@
+import socket
+import threading
+import pika
+import pika.frame
+import pika.spec
+import pytest
+
+
+class FakeAmqpServer(object):
+    """Minimal AMQP 0-9-1 server speaking to a real pika.BlockingConnection.
+
+    Handles the handshake, channels, declarations and publisher confirms:
+    every published message is acked after `ack_delay` seconds. Published
+    messages are kept in `published` as (channel, exchange, body). Declaring
+    one of `fail_exchanges` closes the channel with PRECONDITION_FAILED, the
+    publishes with a delivery tag in `nack_tags` are nacked instead of acked.
+    """
+    _REPLIES = {
+        pika.spec.Channel.Open: pika.spec.Channel.OpenOk,
+        pika.spec.Exchange.Declare: pika.spec.Exchange.DeclareOk,
+        pika.spec.Exchange.Delete: pika.spec.Exchange.DeleteOk,
+        pika.spec.Queue.Bind: pika.spec.Queue.BindOk,
+        pika.spec.Basic.Qos: pika.spec.Basic.QosOk,
+        pika.spec.Confirm.Select: pika.spec.Confirm.SelectOk,
+        pika.spec.Channel.Close: pika.spec.Channel.CloseOk,
+    }
+
+    def __init__(self, ack_delay: float = 0.0, fail_exchanges: tuple = (), nack_tags: tuple = ()):
+        self.ack_delay = ack_delay
+        self.nack_tags = set(nack_tags)
+        self.fail_exchanges = set(fail_exchanges)
+        self.published = []
+        self.methods = []  # (channel, method) received
+        self._listener = socket.socket()
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen(8)
+        self.port = self._listener.getsockname()[1]
+        self._closed = False
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def parameters(self) -> pika.ConnectionParameters:
+        return pika.ConnectionParameters(host="127.0.0.1", port=self.port, heartbeat=0,
+                                         connection_attempts=1, socket_timeout=5)
+
+    def _accept(self):
+        while not self._closed:
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+
+    def _serve(self, sock: socket.socket):
+        lock = threading.Lock()
+        confirm_tags = dict()  # channel -> last delivery tag, channels in confirm mode
+        publishing = dict()  # channel -> [exchange, body parts, remaining size]
+
+        def send(channel, method):
+            with lock:
+                try:
+                    sock.sendall(pika.frame.Method(channel, method).marshal())
+                except OSError:
+                    pass
+
+        def ack(channel, tag):
+            if tag in self.nack_tags:
+                send(channel, pika.spec.Basic.Nack(delivery_tag=tag))
+            else:
+                send(channel, pika.spec.Basic.Ack(delivery_tag=tag))
+
+        def published(channel):
+            exchange, parts, _ = publishing.pop(channel)
+            self.published.append((channel, exchange, b"".join(parts)))
+            if channel in confirm_tags:
+                confirm_tags[channel] += 1
+                if self.ack_delay:
+                    threading.Timer(self.ack_delay, ack, (channel, confirm_tags[channel])).start()
+                else:
+                    ack(channel, confirm_tags[channel])
+
+        data = b""
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    return
+                data += chunk
+                while data:
+                    consumed, frame = pika.frame.decode_frame(data)
+                    if frame is None:
+                        break
+                    data = data[consumed:]
+                    if isinstance(frame, pika.frame.ProtocolHeader):
+                        send(0, pika.spec.Connection.Start(server_properties={"capabilities": {
+                            "publisher_confirms": True, "basic.nack": True,
+                            "consumer_cancel_notify": True}}))
+                    elif isinstance(frame, pika.frame.Method):
+                        method = frame.method
+                        self.methods.append((frame.channel_number, method))
+                        if isinstance(method, pika.spec.Connection.StartOk):
+                            send(0, pika.spec.Connection.Tune(channel_max=2047, frame_max=131072, heartbeat=0))
+                        elif isinstance(method, pika.spec.Connection.Open):
+                            send(0, pika.spec.Connection.OpenOk())
+                        elif isinstance(method, pika.spec.Connection.Close):
+                            send(0, pika.spec.Connection.CloseOk())
+                            return
+                        elif isinstance(method, pika.spec.Basic.Publish):
+                            publishing[frame.channel_number] = [method.exchange, [], None]
+                        elif (isinstance(method, pika.spec.Exchange.Declare)
+                              and method.exchange in self.fail_exchanges):
+                            send(frame.channel_number, pika.spec.Channel.Close(
+                                reply_code=406, reply_text="PRECONDITION_FAILED",
+                                class_id=method.INDEX >> 16, method_id=method.INDEX & 0xffff))
+                        elif isinstance(method, pika.spec.Queue.Declare):
+                            if not method.nowait:
+                                send(frame.channel_number, pika.spec.Queue.DeclareOk(
+                                    queue=method.queue or "amq.gen-{}".format(len(self.methods))))
+                        elif type(method) in self._REPLIES:
+                            if isinstance(method, pika.spec.Confirm.Select):
+                                confirm_tags[frame.channel_number] = 0
+                            if not getattr(method, "nowait", False):
+                                send(frame.channel_number, self._REPLIES[type(method)]())
+                    elif isinstance(frame, pika.frame.Header):
+                        publishing[frame.channel_number][2] = frame.body_size
+                        if frame.body_size == 0:
+                            published(frame.channel_number)
+                    elif isinstance(frame, pika.frame.Body):
+                        message = publishing[frame.channel_number]
+                        message[1].append(frame.fragment)
+                        message[2] -= len(frame.fragment)
+                        if message[2] <= 0:
+                            published(frame.channel_number)
+        finally:
+            sock.close()
+
+    def close(self):
+        self._closed = True
+        self._listener.close()
+
+
+@pytest.fixture
+def amqp_server():
+    server = FakeAmqpServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def slow_ack_server():
+    server = FakeAmqpServer(ack_delay=0.05)
+    yield server
+    server.close()
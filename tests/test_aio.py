@@ -0,0 +1,162 @@
+import asyncio
+import types
+import pika
+import pika.spec
+import pytest
+from pika_topic import aio
+from pika_topic.aio import AsyncPublisher, AsyncSubscriber
+
+
+class FakeChannel(object):
+    """Just enough of a pika asyncio channel, callbacks are called immediately
+    (on the next loop iteration if `deferred`, like replies of a broker)."""
+    def __init__(self):
+        self.deferred = False
+        self.published = []
+        self.properties = []
+        self.consumers = dict()
+        self.on_close = []
+        self.ack_nack = None
+
+    def _reply(self, callback, value=None):
+        if self.deferred:
+            asyncio.get_running_loop().call_soon(callback, value)
+        else:
+            callback(value)
+
+    def exchange_declare(self, exchange, callback=None, **kwargs):
+        self._reply(callback)
+
+    def queue_declare(self, queue, callback=None, **kwargs):
+        self.declared = getattr(self, "declared", 0) + 1
+        self._reply(callback, types.SimpleNamespace(method=types.SimpleNamespace(queue="q{}".format(self.declared))))
+
+    def queue_bind(self, queue, exchange, callback=None, **kwargs):
+        self._reply(callback)
+
+    def confirm_delivery(self, ack_nack_callback, callback=None):
+        self.ack_nack = ack_nack_callback
+        callback(None)
+
+    def add_on_close_callback(self, callback):
+        self.on_close.append(callback)
+
+    def basic_publish(self, exchange, routing_key, body, properties=None):
+        self.published.append(body)
+        self.properties.append(properties)
+
+    def basic_consume(self, queue, on_message_callback, auto_ack=False):
+        self.consumers[queue] = on_message_callback
+        return "ctag-" + queue
+
+    def basic_cancel(self, consumer_tag):
+        pass
+
+    def close(self):
+        for callback in self.on_close:
+            callback(self, pika.exceptions.ChannelClosedByClient(200, "Normal shutdown"))
+
+
+class FakeConnection(object):
+    def add_on_connection_blocked_callback(self, callback):
+        pass
+
+    def add_on_connection_unblocked_callback(self, callback):
+        pass
+
+
+@pytest.fixture
+def channel(monkeypatch):
+    channel = FakeChannel()
+
+    async def open_channel(connection):
+        return channel
+    monkeypatch.setattr(aio, "_open_channel", open_channel)
+    return channel
+
+
+def confirm(method_class, tag, multiple):
+    return types.SimpleNamespace(method=method_class(delivery_tag=tag, multiple=multiple))
+
+
+def test_multiple_nack_settles_every_tag(channel):
+    async def main():
+        publisher = AsyncPublisher("t", FakeConnection(), max_inflight=4)
+        for i in range(4):
+            await publisher.publish(i)
+        channel.ack_nack(confirm(pika.spec.Basic.Nack, 3, True))
+        assert publisher.nacked == 3
+        assert list(publisher._unconfirmed) == [4]
+        channel.ack_nack(confirm(pika.spec.Basic.Ack, 4, False))
+        assert publisher.nacked == 3
+        # the window is free again
+        await asyncio.wait_for(publisher.publish(4), 1)
+    asyncio.run(main())
+
+
+def test_channel_close_fails_waiting_publish_and_flush(channel):
+    async def main():
+        publisher = AsyncPublisher("t", FakeConnection(), max_inflight=1)
+        await publisher.publish(0)
+        waiting = asyncio.ensure_future(publisher.publish(1))
+        flushing = asyncio.ensure_future(publisher.flush())
+        await asyncio.sleep(0.01)
+        assert not waiting.done() and not flushing.done()
+        channel.on_close[0](channel, pika.exceptions.ChannelClosedByBroker(404, "NOT_FOUND"))
+        with pytest.raises(pika.exceptions.ChannelClosedByBroker):
+            await asyncio.wait_for(waiting, 1)
+        with pytest.raises(pika.exceptions.ChannelClosedByBroker):
+            await asyncio.wait_for(flushing, 1)
+        with pytest.raises(pika.exceptions.ChannelClosedByBroker):
+            await publisher.publish(2)
+        assert len(channel.published) == 1
+    asyncio.run(main())
+
+
+def test_unsubscribe_wakes_up_waiters(channel):
+    async def main():
+        subscriber = AsyncSubscriber(FakeConnection())
+        await subscriber.subscribe("t")
+        getter = asyncio.ensure_future(subscriber.get("t"))
+        received = []
+
+        async def iterate():
+            async for message in subscriber.messages("t"):
+                received.append(message)
+        iterator = asyncio.ensure_future(iterate())
+        await asyncio.sleep(0.01)
+        assert await subscriber.unsubscribe("t")
+        with pytest.raises(EOFError):
+            await asyncio.wait_for(getter, 1)
+        await asyncio.wait_for(iterator, 1)
+        assert received == []
+    asyncio.run(main())
+
+
+def test_concurrent_subscribe_shares_one_queue(channel):
+    async def main():
+        channel.deferred = True
+        subscriber = AsyncSubscriber(FakeConnection())
+        names = await asyncio.gather(subscriber.subscribe("t"), subscriber.subscribe("t"),
+                                     subscriber.get("t", timeout=0.01), return_exceptions=True)
+        assert names[0] == names[1] == "q1"
+        assert isinstance(names[2], asyncio.TimeoutError)
+        assert channel.declared == 1
+        assert list(channel.consumers) == ["q1"] and list(subscriber._inboxes) == ["q1"]
+        assert not subscriber._subscribing
+    asyncio.run(main())
+
+
+def test_publish_splits_chunks(channel):
+    async def main():
+        publisher = AsyncPublisher("t", FakeConnection(), chunk_size=100)
+        subscriber = AsyncSubscriber(FakeConnection())
+        queue_name = await subscriber.subscribe("t")
+        message = bytes(range(256)) * 4
+        await publisher.publish(message)
+        assert len(channel.published) > 1
+        assert all(len(body) <= 100 for body in channel.published)
+        for body, properties in zip(channel.published, channel.properties):
+            channel.consumers[queue_name](channel, None, properties, bytes(body))
+        assert await subscriber.get("t", timeout=1) == message
+    asyncio.run(main())
@@ -0,0 +1,44 @@
+import decimal
+import datetime
+import pika
+from pika_topic import Publisher, Subscriber
+from pika_topic.bag import BagReader
+from pika_topic.play import Player
+from pika_topic.record import Recorder
+from pika_topic.testing import LocalBroker
+
+
+HEADERS = {
+    "bytes": b"\x00\xff",
+    "stamp": datetime.datetime(2024, 1, 1, 12, 0, 0),
+    "price": decimal.Decimal("1.25"),
+    "nested": {"list": [1, "x", None, True]},
+}
+
+
+def test_record_and_play_headers_without_json_type(tmp_path):
+    broker = LocalBroker()
+    recorder = Recorder(Subscriber(broker.connection()), ["t"], str(tmp_path / "bag"))
+    publisher = Publisher("t", broker.connection())
+    publisher.publish_raw(b"body", pika.BasicProperties(content_type="application/octet-stream", headers=HEADERS))
+    recorder.subscriber.connection.process_data_events(0)
+    recorder.close()
+    assert recorder.writer.counts == [1]
+
+    bag = BagReader(str(tmp_path / "bag"))
+    try:
+        subscriber = Subscriber(broker.connection())
+        got = []
+        subscriber.subscribe("t", -1, lambda properties, body: got.append((properties, bytes(body))), raw=True)
+        player = Player(bag, broker.connection())
+        player.play(fast=True)
+        subscriber.connection.process_data_events(0)
+        assert len(got) == 1
+        properties, body = got[0]
+        assert body == b"body"
+        assert properties.content_type == "application/octet-stream"
+        for key, value in HEADERS.items():
+            assert properties.headers[key] == value
+        player.close()
+    finally:
+        bag.close()
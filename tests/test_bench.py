@@ -0,0 +1,15 @@
+import sys
+import json
+from pika_topic import bench
+
+
+def test_report_leaves_out_credentials(tmp_path, monkeypatch):
+    output = tmp_path / "bench.json"
+    monkeypatch.setattr(sys, "argv", [
+        "bench", "--auth", "user@secret", "--sizes", "100", "--payloads", "bytes", "--subscribers", "1",
+        "--modes", "spin", "--count", "10", "--idle_timeout", "0.2", "-o", str(output)])
+    bench.main()
+    report = json.loads(output.read_text())
+    assert "auth" not in report["meta"]["options"]
+    assert "secret" not in output.read_text()
+    assert report["results"][0]["messages_received"] == 10
@@ -0,0 +1,103 @@
+import os
+import time
+import pika
+from pika_topic import Publisher, Subscriber
+from pika_topic.chunk import ChunkSplitter, ChunkAssembler, CHUNK_INDEX_HEADER
+from pika_topic.testing import LocalBroker
+
+
+def split(body: bytes, chunk_size: int):
+    properties = pika.BasicProperties(content_type="application/octet-stream", headers={"k": "v"})
+    return list(ChunkSplitter(chunk_size).split(body, properties))
+
+
+def test_reassemble_in_any_order():
+    body = os.urandom(10000)
+    chunks = split(body, 1024)
+    assert len(chunks) == 10
+    assembler = ChunkAssembler()
+    # interleaved with the chunks of another message
+    others = split(os.urandom(3000), 1024)
+    order = [9, 0, 5, 3, 1, 2, 8, 7, 6, 4]
+    results, other_results = [], []
+    for i, index in enumerate(order):
+        if i < len(others):
+            other_results.append(assembler.add("q", others[i][1], bytes(others[i][0])))
+        results.append(assembler.add("q", chunks[index][1], bytes(chunks[index][0])))
+    assert other_results[:-1] == [None] * (len(others) - 1) and other_results[-1] is not None
+    assert results[:-1] == [None] * 9
+    properties, whole = results[-1]
+    assert bytes(whole) == body
+    assert properties.headers == {"k": "v"}
+    assert not assembler.partials
+
+
+def test_redelivered_chunk_is_ignored():
+    body = os.urandom(3000)
+    chunks = split(body, 1024)
+    assembler = ChunkAssembler()
+    assert assembler.add("q", chunks[0][1], bytes(chunks[0][0])) is None
+    assert assembler.add("q", chunks[0][1], bytes(chunks[0][0])) is None
+    assert assembler.add("q", chunks[1][1], bytes(chunks[1][0])) is None
+    assert bytes(assembler.add("q", chunks[2][1], bytes(chunks[2][0]))[1]) == body
+
+
+def test_out_of_range_index_is_dropped():
+    chunks = split(os.urandom(3000), 1024)
+    assembler = ChunkAssembler()
+    for index in (3, -1):
+        properties = chunks[0][1]
+        properties.headers = dict(properties.headers, **{CHUNK_INDEX_HEADER: index})
+        assert assembler.add("q", properties, b"x" * 1024) is None
+    assert not assembler.partials
+
+
+def test_expire_returns_next_deadline():
+    chunks = split(os.urandom(3000), 1024)
+    assembler = ChunkAssembler(timeout=0.01)
+    assert assembler.expire() == float("inf")
+    assembler.add("q", chunks[0][1], bytes(chunks[0][0]))
+    assert assembler.expire() > time.monotonic()
+    time.sleep(0.02)
+    assert assembler.expire() == float("inf")
+    assert assembler.timeouts == 1 and not assembler.partials
+
+
+def test_subscriber_expires_without_traffic():
+    broker = LocalBroker()
+    publisher = Publisher("t", broker.connection(), chunk_size=1024)
+    subscriber = Subscriber(broker.connection(), chunk_timeout=0.05)
+    received = []
+    subscriber.subscribe("t", callback=received.append)
+    chunks = list(publisher.encoder.split(*publisher.encoder.encode(os.urandom(5000))))
+    for body, properties in chunks[:-1]:
+        publisher._send_one(body, properties)
+    subscriber.connection.process_data_events(0.01)
+    assert subscriber.decoder.chunks.partials
+    # no more deliveries, the timer frees the buffer
+    subscriber.connection.process_data_events(0.2)
+    assert not subscriber.decoder.chunks.partials
+    assert subscriber.chunk_timeouts == 1
+    assert received == []
+
+
+def test_worker_group_rejects_chunks_to_dead_letter():
+    broker = LocalBroker()
+    publisher = Publisher("t", broker.connection(), chunk_size=1024)
+    workers = [Subscriber(broker.connection()) for _ in range(2)]
+    received = []
+    for worker in workers:
+        worker.subscribe("t", callback=received.append, group="g", dead_letter="t.failed")
+    failed = Subscriber(broker.connection())
+    dead = []
+    failed.subscribe("t.failed", callback=dead.append)
+    message = os.urandom(5000)
+    publisher.publish(message)
+    publisher.publish("small")
+    for _ in range(3):
+        for subscriber in workers + [failed]:
+            subscriber.connection.process_data_events(0.01)
+    assert received == ["small"]
+    # the dead letter subscriber gets all the chunks and reassembles the message
+    assert dead == [message]
+    assert all(not w.decoder.chunks.partials for w in workers)
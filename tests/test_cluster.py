@@ -0,0 +1,51 @@
+import pytest
+import pika
+from pika_topic.cluster import HashRing, BrokerCluster, parse_endpoint
+
+
+KEYS = ["topic_{}".format(i) for i in range(3000)]
+
+
+def test_keys_spread_over_nodes():
+    ring = HashRing(["a", "b", "c"])
+    owners = [ring.get(k) for k in KEYS]
+    assert owners == [HashRing(["c", "a", "b"]).get(k) for k in KEYS]
+    for node in "abc":
+        assert 0.2 < owners.count(node) / len(KEYS) < 0.47
+
+
+def test_add_node_moves_keys_to_it_only():
+    ring = HashRing(["a", "b", "c"])
+    before = {k: ring.get(k) for k in KEYS}
+    ring.add("d")
+    moved = [k for k in KEYS if ring.get(k) != before[k]]
+    assert all(ring.get(k) == "d" for k in moved)
+    assert 0.15 < len(moved) / len(KEYS) < 0.35
+
+
+def test_remove_node_moves_its_keys_only():
+    ring = HashRing(["a", "b", "c", "d"])
+    before = {k: ring.get(k) for k in KEYS}
+    ring.remove("d")
+    assert ring.nodes == {"a", "b", "c"}
+    for k in KEYS:
+        if before[k] != "d":
+            assert ring.get(k) == before[k]
+        else:
+            assert ring.get(k) != "d"
+
+
+def test_empty_ring():
+    ring = HashRing()
+    with pytest.raises(AssertionError):
+        ring.get("t")
+
+
+def test_ipv6_endpoints():
+    assert parse_endpoint("[::1]:5673:15673") == ("::1", 5673, 15673)
+    assert parse_endpoint("[fe80::1]") == ("fe80::1", 5672, 15672)
+    cluster = BrokerCluster(["[::1]:5673:15673", "h2"], credentials=pika.PlainCredentials("u", "p"))
+    assert cluster.nodes == ["[::1]:5673", "h2:5672"]
+    assert cluster.manage_host_ports["[::1]:5673"] == "[::1]:15673"
+    parameters = cluster.parameters["[::1]:5673"]
+    assert (parameters.host, parameters.port, parameters.credentials.username) == ("::1", 5673, "u")
@@ -0,0 +1,79 @@
+import random
+import pika
+import pytest
+from pika_topic import Publisher, Subscriber
+from pika_topic.compress import get_compression
+from pika_topic.message import MessageEncoder, MessageDecoder
+from pika_topic.testing import LocalBroker
+
+
+COMPRESSIBLE = b"pika_topic " * 1000
+
+
+@pytest.mark.parametrize("encoding", ["zlib", "xz"])
+def test_round_trip(encoding):
+    compression = get_compression(encoding)
+    assert compression.decompress(compression.compress(COMPRESSIBLE)) == COMPRESSIBLE
+    encoder = MessageEncoder(compression=encoding)
+    body, properties = encoder.compress(*encoder.encode(COMPRESSIBLE))
+    assert properties.content_encoding == encoding
+    assert len(body) < len(COMPRESSIBLE) / 10
+    # the shared properties are not modified
+    assert encoder.properties.content_encoding is None
+    assert MessageDecoder().decode("q", properties, body) == [COMPRESSIBLE]
+
+
+@pytest.mark.parametrize("encoding", ["zlib", "xz"])
+def test_publisher_round_trip(encoding):
+    broker = LocalBroker()
+    publisher = Publisher("t", broker.connection(), compression=encoding)
+    subscriber = Subscriber(broker.connection())
+    received = []
+    subscriber.subscribe("t", -1, callback=received.append)
+    publisher.publish(COMPRESSIBLE)
+    publisher.publish(b"small")
+    subscriber.connection.process_data_events(0)
+    assert received == [COMPRESSIBLE, b"small"]
+    assert publisher.encoder.compression_stats["compressed"] == 1
+
+
+def test_threshold():
+    encoder = MessageEncoder(compression="zlib", compress_threshold=100)
+    body, properties = encoder.compress(b"a" * 99, pika.BasicProperties())
+    assert body == b"a" * 99 and properties.content_encoding is None
+    assert encoder.compression_stats["skipped_small"] == 1
+    body, properties = encoder.compress(b"a" * 100, pika.BasicProperties())
+    assert properties.content_encoding == "zlib" and get_compression("zlib").decompress(body) == b"a" * 100
+    assert encoder.compression_stats["compressed"] == 1
+
+
+def test_min_ratio_backs_off():
+    encoder = MessageEncoder(compression="zlib", compress_threshold=0, compress_min_ratio=0.5)
+    noise = random.Random(0).randbytes(4096)
+    stats = encoder.compression_stats
+    # poorly compressed, sent as is, then skipped for 1, 2, 4... messages
+    body, properties = encoder.compress(noise, pika.BasicProperties())
+    assert body == noise and properties.content_encoding is None
+    assert stats["skipped_ratio"] == 1 and stats["bytes_out"] == len(noise)
+    encoder.compress(noise, pika.BasicProperties())
+    assert stats["skipped_backoff"] == 1
+    encoder.compress(noise, pika.BasicProperties())
+    assert stats["skipped_ratio"] == 2
+    for _ in range(2):
+        encoder.compress(noise, pika.BasicProperties())
+    assert stats["skipped_backoff"] == 3
+    # a good ratio resets the back-off
+    body, properties = encoder.compress(COMPRESSIBLE, pika.BasicProperties())
+    assert properties.content_encoding == "zlib" and stats["compressed"] == 1
+    encoder.compress(COMPRESSIBLE, pika.BasicProperties())
+    assert stats["compressed"] == 2 and stats["skipped_backoff"] == 3
+
+
+def test_unknown_encoding_is_dropped(capsys):
+    encoder = MessageEncoder()
+    body, properties = encoder.encode(1)
+    properties = pika.BasicProperties(content_type=properties.content_type, content_encoding="br")
+    assert MessageDecoder().decode("q", properties, body) == []
+    assert "Unknown content encoding: br" in capsys.readouterr().out
+    with pytest.raises(ValueError):
+        get_compression("br")
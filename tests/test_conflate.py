@@ -0,0 +1,33 @@
+from pika_topic import Publisher, Subscriber
+from pika_topic.testing import LocalBroker
+
+
+def test_conflating_callback_gets_newest_of_pass():
+    broker = LocalBroker()
+    subscriber = Subscriber(broker.connection())
+    got = []
+    subscriber.subscribe("t", callback=got.append, conflate=True)
+    publisher = Publisher("t", broker.connection())
+    for i in range(50):
+        publisher.publish(i)
+    # deliveries, then the flush queued behind them
+    subscriber.connection.process_data_events(0)
+    subscriber.connection.process_data_events(0)
+    assert got == [49]
+    assert subscriber.conflation_stats()["t"] == {"delivered": 1, "skipped": 49, "conflated": 1}
+
+
+def test_flush_after_deliveries_of_other_queues():
+    broker = LocalBroker()
+    subscriber = Subscriber(broker.connection())
+    events = []
+    subscriber.subscribe("a", callback=lambda m: events.append(("a", m)), conflate=True)
+    subscriber.subscribe("b", callback=lambda m: events.append(("b", m)))
+    pa = Publisher("a", broker.connection())
+    pb = Publisher("b", broker.connection())
+    for i in range(5):
+        pa.publish(i)
+        pb.publish(i)
+    subscriber.connection.process_data_events(0)
+    subscriber.connection.process_data_events(0)
+    assert events == [("b", i) for i in range(5)] + [("a", 4)]
@@ -0,0 +1,48 @@
+import time
+import types
+import threading
+from pika_topic import Publisher
+from pika_topic.sub import ClusterSubscriber
+from pika_topic.echo import Monitor
+from pika_topic.testing import LocalCluster
+
+
+def test_monitor_of_cluster_subscriber(monkeypatch):
+    with LocalCluster(2) as local:
+        cluster = local.cluster()
+        # one topic on each broker
+        topics = dict()
+        for i in range(100):
+            topics.setdefault(cluster.node_for("t{}".format(i)), "t{}".format(i))
+        topics = list(topics.values())
+        assert len(topics) == 2
+        subscriber = ClusterSubscriber(cluster)
+        timer_threads = set()
+        on_timer = Monitor._on_timer
+        def record_thread(self, *args):
+            timer_threads.add(threading.current_thread())
+            return on_timer(self, *args)
+        monkeypatch.setattr(Monitor, "_on_timer", record_thread)
+        opt = types.SimpleNamespace(mode="hz", window=100, queue_size=-1, display_hz=50, max_elements=10)
+        monitor = Monitor(subscriber, topics, opt)
+        displays = []
+        monitor.display_hz = lambda: displays.append(sum(m.counts for m in monitor.monitors))
+
+        def publish():
+            publishers = [Publisher(t, cluster) for t in topics]
+            for k in range(200):
+                for p in publishers:
+                    p.publish(k)
+                time.sleep(0.001)
+            time.sleep(0.1)
+            for s in subscriber.subscribers.values():
+                s.connection.add_callback_threadsafe(s.channel.stop_consuming)
+        thread = threading.Thread(target=publish, daemon=True)
+        thread.start()
+        subscriber.spin()
+        thread.join(5)
+        assert [m.counts for m in monitor.monitors] == [200, 200]
+        assert displays and displays == sorted(displays)
+        # the display timer runs on the connection of every broker
+        assert len(timer_threads) == 2
+        cluster.close()
@@ -0,0 +1,37 @@
+import threading
+from pika_topic import Publisher
+from pika_topic.sub import ThreadedDataGetter
+from pika_topic.testing import LocalBroker
+
+
+def test_unsubscribe_wakes_up_wait_for_new():
+    broker = LocalBroker()
+    getter = ThreadedDataGetter(broker.connection())
+    getter.start()
+    try:
+        getter.subscribe("t")
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(getter.wait_for_new("t")), daemon=True)
+        waiter.start()
+        waiter.join(0.1)
+        assert waiter.is_alive()
+        assert getter.unsubscribe_topic("t")
+        waiter.join(5)
+        assert not waiter.is_alive(), "wait_for_new still waiting after unsubscribe"
+        assert result == [None]
+    finally:
+        getter.stop(5)
+
+
+def test_wait_for_new_returns_new_sample():
+    broker = LocalBroker()
+    getter = ThreadedDataGetter(broker.connection())
+    getter.start()
+    try:
+        getter.subscribe("t")
+        publisher = Publisher("t", broker.connection())
+        publisher.publish(1)
+        sample = getter.wait_for_new("t", timeout=5, seq=0)
+        assert sample is not None and sample.data == 1
+    finally:
+        getter.stop(5)
@@ -0,0 +1,96 @@
+import numpy as np
+from pika_topic import Publisher, Subscriber
+from pika_topic.intra import ORIGIN_HEADER, PROCESS_TOKEN
+from pika_topic.testing import LocalBroker
+
+
+def spin_once(*subscribers):
+    # deliveries, then the callbacks queued by the local endpoints
+    for _ in range(2):
+        for subscriber in subscribers:
+            subscriber.connection.process_data_events(0)
+
+
+def test_local_subscriber_gets_the_object_once():
+    broker = LocalBroker()
+    local, remote = [], []
+    local_subscriber = Subscriber(broker.connection())
+    local_subscriber.subscribe("t", -1, callback=local.append, intra_process="shared")
+    remote_subscriber = Subscriber(broker.connection())
+    remote_subscriber.subscribe("t", -1, callback=remote.append)
+    publisher = Publisher("t", broker.connection(), intra_process=True)
+    messages = [{"i": i} for i in range(3)]
+    for message in messages:
+        publisher.publish(message)
+    spin_once(local_subscriber, remote_subscriber)
+    # the broker copies of this process are skipped by the local subscriber
+    assert len(local) == 3 and all(a is b for a, b in zip(local, messages))
+    assert remote == messages and not any(a is b for a, b in zip(remote, messages))
+
+
+def test_broker_copies_carry_the_process_token():
+    broker = LocalBroker()
+    headers = []
+    raw_subscriber = Subscriber(broker.connection())
+    raw_subscriber.subscribe("t", -1, lambda properties, body: headers.append(properties.headers), raw=True)
+    Publisher("t", broker.connection(), intra_process=True).publish(1)
+    Publisher("t", broker.connection()).publish(2)
+    spin_once(raw_subscriber)
+    assert headers[0][ORIGIN_HEADER] == PROCESS_TOKEN
+    assert ORIGIN_HEADER not in (headers[1] or {})
+
+
+def test_other_publishers_reach_local_subscriber_through_the_broker():
+    broker = LocalBroker()
+    received = []
+    subscriber = Subscriber(broker.connection())
+    subscriber.subscribe("t", -1, callback=received.append, intra_process="shared")
+    Publisher("t", broker.connection(), intra_process=True).publish(1)
+    Publisher("t", broker.connection()).publish(2)
+    spin_once(subscriber)
+    assert sorted(received) == [1, 2]
+
+
+def test_not_remote_skips_the_broker():
+    broker = LocalBroker()
+    local, remote = [], []
+    local_subscriber = Subscriber(broker.connection())
+    local_subscriber.subscribe("t", -1, callback=local.append, intra_process="shared")
+    remote_subscriber = Subscriber(broker.connection())
+    remote_subscriber.subscribe("t", -1, callback=remote.append)
+    publisher = Publisher("t", broker.connection(), intra_process=True, remote=False)
+    publisher.publish(1)
+    spin_once(local_subscriber, remote_subscriber)
+    assert local == [1] and remote == []
+
+
+def test_modes():
+    broker = LocalBroker()
+    got = {}
+    subscriber = Subscriber(broker.connection())
+    for mode in ["readonly", "copy"]:
+        subscriber.subscribe("t", -1, callback=lambda m, mode=mode: got.setdefault(mode, m), intra_process=mode)
+    array = np.arange(4)
+    Publisher("t", broker.connection(), intra_process=True, remote=False).publish({"a": array})
+    spin_once(subscriber)
+    assert not got["readonly"]["a"].flags.writeable and np.shares_memory(got["readonly"]["a"], array)
+    assert got["copy"]["a"].flags.writeable and not np.shares_memory(got["copy"]["a"], array)
+    assert array.flags.writeable
+
+
+def test_get_without_callback():
+    broker = LocalBroker()
+    subscriber = Subscriber(broker.connection())
+    queue = subscriber.subscribe("t", -1, intra_process="shared")
+    publisher = Publisher("t", broker.connection(), intra_process=True)
+    publisher.publish(1)
+    publisher.publish(2)
+    spin_once(subscriber)
+    received = []
+    while True:
+        ret = subscriber.get(queue)
+        if queue not in ret:
+            break
+        received.append(ret[queue])
+    # the broker copies are skipped, no duplicates
+    assert received == [1, 2]
@@ -0,0 +1,34 @@
+import pika
+import pytest
+from pika_topic import ConnectionManager, Publisher
+from conftest import FakeAmqpServer
+
+
+def test_exchange_declared_before_reliable_publish(amqp_server):
+    manager = ConnectionManager(amqp_server.parameters())
+    try:
+        publisher = Publisher("t", manager, reliable=True)
+        publisher.publish(1)
+        assert publisher.wait_for_confirms(timeout=5)
+        declares = [(ch, m) for ch, m in amqp_server.methods if isinstance(m, pika.spec.Exchange.Declare)]
+        assert [m.exchange for _, m in declares] == [publisher.exchange]
+        assert not declares[0][1].nowait
+        # confirmed, so the publish came after the declaration
+        publishes = [i for i, (_, m) in enumerate(amqp_server.methods) if isinstance(m, pika.spec.Basic.Publish)]
+        assert amqp_server.methods.index(declares[0]) < publishes[0]
+    finally:
+        manager.close()
+
+
+def test_failed_declaration_raises_and_channel_is_reopened():
+    server = FakeAmqpServer(fail_exchanges=("bad",))
+    manager = ConnectionManager(server.parameters())
+    try:
+        with pytest.raises(pika.exceptions.ChannelClosedByBroker):
+            manager.declare_exchange("bad")
+        manager.declare_exchange("good")
+        assert manager.channel().is_open
+        assert manager._state().declared == {"good"}
+    finally:
+        manager.close()
+        server.close()
@@ -0,0 +1,55 @@
+import pytest
+from pika_topic import Publisher, Subscriber
+from pika_topic.message import (MessageEncoder, MessageDecoder, pack_batch, unpack_batch, with_headers,
+                                BATCH_COUNT_HEADER)
+from pika_topic.testing import LocalBroker
+
+
+def test_batch_round_trip():
+    bodies = [b"", b"a", bytes(range(256)) * 10]
+    assert [bytes(b) for b in unpack_batch(pack_batch(bodies))] == bodies
+    assert unpack_batch(pack_batch([])) == []
+
+
+def test_publish_many_round_trip():
+    broker = LocalBroker()
+    publisher = Publisher("t", broker.connection())
+    subscriber = Subscriber(broker.connection())
+    received = []
+    subscriber.subscribe("t", -1, callback=received.append)
+    messages = [{"i": i, "data": "x" * i} for i in range(20)]
+    publisher.publish_many(messages)
+    subscriber.connection.process_data_events(0)
+    assert received == messages
+
+
+@pytest.mark.parametrize("envelope", [
+    b"",
+    b"\x02\x00",  # truncated count
+    pack_batch([b"abc", b"def"])[:-1],  # truncated body
+    pack_batch([b"abc", b"def"])[:9],  # truncated length
+    pack_batch([b"abc"]) + b"\x00",  # trailing bytes
+    b"\xff\xff\xff\xff" + pack_batch([b"abc"])[4:],  # corrupt count
+])
+def test_malformed_batch(envelope):
+    with pytest.raises(ValueError):
+        unpack_batch(envelope)
+
+
+def batch_delivery(bodies: list, count: int = None):
+    encoder = MessageEncoder()
+    encoded = [encoder.codec.encode(b) for b in bodies]
+    count = len(bodies) if count is None else count
+    return with_headers(encoder.batch_properties, {BATCH_COUNT_HEADER: count}), pack_batch(encoded)
+
+
+def test_decoder_drops_malformed_batch(capsys):
+    decoder = MessageDecoder()
+    properties, envelope = batch_delivery([1, 2, 3])
+    assert decoder.decode("q", properties, envelope) == [1, 2, 3]
+    assert decoder.decode("q", properties, envelope[:-2]) == []
+    assert "malformed batch" in capsys.readouterr().out
+    # the count header does not match the envelope
+    properties, envelope = batch_delivery([1, 2, 3], count=4)
+    assert decoder.decode("q", properties, envelope) == []
+    assert "3 messages, 4 expected" in capsys.readouterr().out
@@ -0,0 +1,41 @@
+import pika
+from pika_topic import Publisher, Subscriber
+from pika_topic.recovery import Backoff
+from pika_topic.testing import LocalBroker
+
+
+def recover(subscriber: Subscriber, broker: LocalBroker):
+    broker.close_connections()
+    for _ in range(100):
+        subscriber.get()
+        if subscriber.recovery.connected:
+            return
+    assert False, "not recovered"
+
+
+def test_subscribe_options_survive_reconnect():
+    broker = LocalBroker()
+    subscriber = Subscriber(broker.connection(), recover=True, connect=broker.connect, backoff=Backoff(0, 0))
+    latest = subscriber.subscribe("latest", queue_size=1)
+    conflated = []
+    subscriber.subscribe("conflated", callback=conflated.append, conflate=True)
+    raw = []
+    subscriber.subscribe("raw", callback=lambda properties, body: raw.append(bytes(body)), raw=True)
+    before = {subscriber._subscriptions[q]["topic"]: subscriber._subscriptions[q] for q in subscriber.queue_names}
+
+    recover(subscriber, broker)
+    after = {subscriber._subscriptions[q]["topic"]: subscriber._subscriptions[q] for q in subscriber.queue_names}
+    assert after == before
+
+    for topic in ["latest", "conflated"]:
+        publisher = Publisher(topic, broker.connection())
+        for i in range(5):
+            publisher.publish(i)
+    Publisher("raw", broker.connection()).publish_raw(b"body", pika.BasicProperties())
+    # deliveries, then the conflated flush
+    subscriber.connection.process_data_events(0)
+    subscriber.connection.process_data_events(0)
+    # queue_size=1 keeps the newest message only, conflate hands out the newest of the pass
+    assert subscriber.get(latest) == {latest: 4}
+    assert conflated == [4]
+    assert raw == [b"body"]
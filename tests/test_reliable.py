@@ -0,0 +1,135 @@
+import time
+import pickle
+import threading
+import pika
+import pytest
+from pika_topic import Publisher
+from pika_topic.testing import LocalBroker
+from conftest import FakeAmqpServer
+
+
+def run_with_timeout(func, timeout: float = 5.0):
+    """Run func in a thread, fail instead of hanging the test run."""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "hung for {}s".format(timeout)
+    return result[0]
+
+
+def test_reliable_publisher_on_real_pika(amqp_server):
+    def publish():
+        connection = pika.BlockingConnection(amqp_server.parameters())
+        publisher = Publisher("t", connection, reliable=True)
+        for i in range(20):
+            publisher.publish(i)
+        ok = publisher.wait_for_confirms(timeout=None)
+        counters = dict(publisher.confirm_counters)
+        publisher.close()
+        connection.close()
+        return ok, counters
+    ok, counters = run_with_timeout(publish)
+    assert ok
+    assert counters["acked"] == 20
+    assert len(amqp_server.published) == 20
+
+
+def test_block_policy_on_real_pika(slow_ack_server):
+    def publish():
+        connection = pika.BlockingConnection(slow_ack_server.parameters())
+        publisher = Publisher("t", connection, reliable=True, max_unconfirmed=2, buffer_policy="block")
+        for i in range(6):
+            publisher.publish(i)
+            assert len(publisher._unconfirmed) <= 2
+        ok = publisher.wait_for_confirms(timeout=5)
+        connection.close()
+        return ok, publisher.confirm_counters["acked"]
+    assert run_with_timeout(publish) == (True, 6)
+
+
+def test_wait_for_confirms_returns_once_confirmed(slow_ack_server):
+    def publish():
+        connection = pika.BlockingConnection(slow_ack_server.parameters())
+        publisher = Publisher("t", connection, reliable=True)
+        publisher.publish("x")
+        t0 = time.perf_counter()
+        ok = publisher.wait_for_confirms(timeout=3)
+        elapsed = time.perf_counter() - t0
+        connection.close()
+        return ok, elapsed
+    ok, elapsed = run_with_timeout(publish)
+    assert ok
+    assert elapsed < 1.0
+
+
+def test_wait_for_confirms_timeout():
+    broker = LocalBroker()
+    publisher = Publisher("t", broker.connection(), reliable=True)
+    # no confirm will come
+    publisher._track(b"", pika.BasicProperties())
+    t0 = time.perf_counter()
+    assert not publisher.wait_for_confirms(timeout=0.05)
+    assert time.perf_counter() - t0 < 1.0
+
+
+def confirm(publisher, method):
+    publisher._on_confirm(pika.frame.Method(publisher.channel.channel_number, method))
+
+
+def test_confirm_settlement():
+    broker = LocalBroker()
+    publisher = Publisher("t", broker.connection(), reliable=True)
+    for i in range(5):
+        publisher._track(str(i).encode(), pika.BasicProperties())
+    tags = lambda: [m[0] for m in publisher._unconfirmed]
+    # out of order single ack
+    confirm(publisher, pika.spec.Basic.Ack(delivery_tag=3))
+    assert tags() == [1, 2, 4, 5]
+    # multiple settles every tag up to it
+    confirm(publisher, pika.spec.Basic.Ack(delivery_tag=4, multiple=True))
+    assert tags() == [5]
+    assert publisher.confirm_counters["acked"] == 4
+    # unknown tag, e.g. dropped by drop_oldest
+    confirm(publisher, pika.spec.Basic.Ack(delivery_tag=2))
+    assert publisher.confirm_counters["acked"] == 4
+
+
+def test_nack_keeps_order():
+    broker = LocalBroker()
+    publisher = Publisher("t", broker.connection(), reliable=True)
+    for i in range(3):
+        publisher._track(str(i).encode(), pika.BasicProperties())
+    confirm(publisher, pika.spec.Basic.Nack(delivery_tag=2))
+    # a later multiple ack does not settle the nacked message
+    confirm(publisher, pika.spec.Basic.Ack(delivery_tag=2, multiple=True))
+    assert publisher.confirm_counters == dict(publisher.confirm_counters, nacked=1, acked=1)
+    assert [(m[0], m[1]) for m in publisher._unconfirmed] == [(2, b"1"), (3, b"2")]
+    # published again in order, not from the confirm callback
+    publisher._resend_nacked()
+    assert [(m[0], m[1]) for m in publisher._unconfirmed] == [(4, b"1"), (5, b"2")]
+
+
+def test_nack_from_broker_is_published_again_in_order():
+    server = FakeAmqpServer(ack_delay=0.02, nack_tags=(2,))
+    def publish():
+        connection = pika.BlockingConnection(server.parameters())
+        publisher = Publisher("t", connection, reliable=True)
+        for i in range(5):
+            publisher.publish(i)
+        ok = publisher.wait_for_confirms(timeout=5)
+        connection.close()
+        return ok, publisher.confirm_counters
+    try:
+        ok, counters = run_with_timeout(publish)
+    finally:
+        server.close()
+    assert ok
+    assert counters["nacked"] == 1
+    bodies = [pickle.loads(body) for _, _, body in server.published]
+    assert sorted(set(bodies)) == [0, 1, 2, 3, 4]
+    # the nacked message is sent again, then those after it still unconfirmed, in order
+    # (the nack may arrive before the last messages were first published)
+    again = bodies.index(1, 2)
+    assert bodies[:again] == list(range(again))
+    assert bodies[again:] == sorted(bodies[again:])
@@ -0,0 +1,78 @@
+import struct
+import pytest
+from pika_topic import Publisher, Subscriber
+from pika_topic import shm
+from pika_topic.shm import ShmRing, ShmReader, StaleSlotError, _SLOT_HEADER
+from pika_topic.testing import LocalBroker
+
+
+def test_wrapped_slots_are_stale():
+    ring = ShmRing(4, 16)
+    reader = ShmReader()
+    try:
+        descriptors = [ring.write(bytes([i]) * 8) for i in range(6)]
+        for descriptor in descriptors[:2]:
+            with pytest.raises(StaleSlotError):
+                reader.read(descriptor)
+        assert [reader.read(d) for d in descriptors[2:]] == [bytes([i]) * 8 for i in range(2, 6)]
+    finally:
+        reader.close()
+        ring.close()
+
+
+def test_slot_being_written_is_stale():
+    ring = ShmRing(2, 16)
+    reader = ShmReader()
+    try:
+        descriptor = ring.write(b"a" * 8)
+        # the writer of the next lap set the odd generation, the payload is not complete
+        _SLOT_HEADER.pack_into(ring.shm.buf, 0, ring.generations[0] + 1, 8)
+        with pytest.raises(StaleSlotError):
+            reader.read(descriptor)
+    finally:
+        reader.close()
+        ring.close()
+
+
+def test_torn_read_is_stale(monkeypatch):
+    ring = ShmRing(1, 16)
+    reader = ShmReader()
+    try:
+        descriptor = ring.write(b"a" * 8)
+        checks = []
+
+        class Header(struct.Struct):
+            # the writer reuses the slot right after the first check of the reader
+            def unpack_from(self, buf, offset=0):
+                value = super().unpack_from(buf, offset)
+                checks.append(value[0])
+                if len(checks) == 1:
+                    ring.write(b"b" * 8)
+                return value
+
+        monkeypatch.setattr(shm, "_SLOT_HEADER", Header(_SLOT_HEADER.format))
+        with pytest.raises(StaleSlotError):
+            reader.read(descriptor)
+        assert checks == [2, 4]
+        monkeypatch.undo()
+        with pytest.raises(StaleSlotError):
+            reader.read(descriptor)
+    finally:
+        reader.close()
+        ring.close()
+
+
+def test_subscriber_drops_overwritten_messages():
+    broker = LocalBroker()
+    publisher = Publisher("t", broker.connection(), shm_slots=4, shm_slot_size=1 << 10, shm_threshold=0)
+    subscriber = Subscriber(broker.connection())
+    received = []
+    subscriber.subscribe("t", -1, callback=received.append, shm=True)
+    try:
+        for i in range(6):
+            publisher.publish(i)
+        subscriber.connection.process_data_events(0)
+        assert received == [2, 3, 4, 5]
+        assert subscriber.shm_stale_drops == 2
+    finally:
+        publisher.close()
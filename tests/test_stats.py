@@ -0,0 +1,53 @@
+from pika_topic import Publisher, Subscriber
+from pika_topic.stats import StatsRegistry
+from pika_topic.testing import LocalBroker
+
+
+def test_prometheus_counters_have_total_suffix():
+    registry = StatsRegistry()
+    registry.add("q", "t")
+    text = registry.to_prometheus()
+    for name in ["messages", "bytes", "gaps", "dropped", "duplicates"]:
+        assert "# TYPE pika_topic_{}_total counter".format(name) in text
+        assert 'pika_topic_{}_total{{topic="t",queue="q"}} 0'.format(name) in text
+    assert "# TYPE pika_topic_rate gauge" in text
+
+
+def test_batches_count_their_messages():
+    broker = LocalBroker()
+    publisher = Publisher("t", broker.connection(), instrument=True)
+    subscriber = Subscriber(broker.connection(), stats=True)
+    received = []
+    queue = subscriber.subscribe("t", callback=received.append)
+    publisher.publish_many(list(range(10)))
+    publisher.publish_many(list(range(5)))
+    subscriber.connection.process_data_events(0.05)
+    stats = subscriber.stats.queues[queue]
+    assert len(received) == 15
+    assert stats.messages == 15
+    assert stats.gaps == 0
+
+
+def test_chunks_count_once():
+    broker = LocalBroker()
+    publisher = Publisher("t", broker.connection(), instrument=True, chunk_size=1024)
+    subscriber = Subscriber(broker.connection(), stats=True)
+    received = []
+    queue = subscriber.subscribe("t", callback=received.append)
+    for i in range(3):
+        publisher.publish(bytes(10000))
+    subscriber.connection.process_data_events(0.05)
+    stats = subscriber.stats.queues[queue]
+    assert len(received) == 3
+    assert stats.messages == 3
+    assert stats.gaps == 0 and stats.dropped == 0 and stats.duplicates == 0
+
+
+def test_prometheus_escapes_label_values():
+    registry = StatsRegistry()
+    registry.add('q"1', 'a\\b\nc')
+    text = registry.to_prometheus()
+    assert 'pika_topic_messages_total{topic="a\\\\b\\nc",queue="q\\"1"} 0' in text
+    assert 'pika_topic_latency_seconds_count{topic="a\\\\b\\nc",queue="q\\"1"} 0' in text
+    # one sample per line
+    assert all(line.startswith(("#", "pika_topic_")) for line in text.splitlines())
@@ -0,0 +1,37 @@
+from pika_topic import Publisher, Subscriber
+from pika_topic.sync import ApproximateTimeSynchronizer
+from pika_topic.testing import LocalBroker
+
+
+def test_failed_decode_keeps_other_candidates():
+    broker = LocalBroker()
+    a = Publisher("a", broker.connection())
+    b = Publisher("b", broker.connection())
+    subscriber = Subscriber(broker.connection())
+    out = []
+    sync = ApproximateTimeSynchronizer(subscriber, ["a", "b"], lambda *m: out.append(m), slop=0.01)
+    decode = subscriber.decode
+    # the first message of b can not be decoded, e.g. an overwritten shared memory slot
+    subscriber.decode = lambda q, p, body: [] if decode(q, p, body) == [("b", 0)] else decode(q, p, body)
+    a.publish(("a", 0), stamp=1.0)
+    b.publish(("b", 0), stamp=1.0)
+    b.publish(("b", 1), stamp=1.005)
+    a.publish(("a", 1), stamp=1.1)
+    subscriber.connection.process_data_events(0.05)
+    assert out == [(("a", 0), ("b", 1))]
+    assert sync.drops == {"a": 0, "b": 1}
+
+
+def test_publish_many_stamps_every_message():
+    broker = LocalBroker()
+    a = Publisher("a", broker.connection(), stamp=True)
+    b = Publisher("b", broker.connection(), stamp=True)
+    subscriber = Subscriber(broker.connection())
+    out = []
+    sync = ApproximateTimeSynchronizer(subscriber, ["a", "b"], lambda *m: out.append(m), slop=1.0)
+    b.publish("b0")
+    a.publish_many(["a0", "a1", "a2"])
+    b.publish("b1")
+    subscriber.connection.process_data_events(0.05)
+    assert sync.unstamped == {"a": 0, "b": 0}
+    assert out and out[0][0] == "a0"
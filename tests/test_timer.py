@@ -0,0 +1,94 @@
+import types
+import pytest
+from pika_topic import rate, timer
+from pika_topic.rate import Rate
+from pika_topic.timer import TimerExecutor
+
+
+class FakeClock(object):
+    """perf_counter and sleep of the time module, sleeping only advances the clock."""
+    def __init__(self):
+        self.now = 100.0
+
+    def perf_counter(self) -> float:
+        return self.now
+
+    def sleep(self, duration: float):
+        self.now += duration
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    fake_time = types.SimpleNamespace(perf_counter=clock.perf_counter, sleep=clock.sleep)
+    monkeypatch.setattr(timer, "time", fake_time)
+    monkeypatch.setattr(rate, "time", fake_time)
+    return clock
+
+
+def test_timers_fire_in_deadline_order(clock):
+    executor = TimerExecutor(sleep_mode="sleep")
+    fired = []
+    for name, period in [("a", 0.3), ("b", 0.2), ("c", 0.5)]:
+        executor.create_timer(period, lambda name=name: fired.append((name, round(clock.now - 100, 6))), name)
+    while clock.now < 100.6:
+        executor.spin_once()
+    # a and b are both due at 0.6, in the order they were scheduled
+    assert fired == [("b", 0.2), ("a", 0.3), ("b", 0.4), ("c", 0.5), ("a", 0.6), ("b", 0.6)]
+
+
+def test_cancelled_timer_does_not_fire(clock):
+    executor = TimerExecutor(sleep_mode="sleep")
+    fired = []
+    a = executor.create_timer(0.1, lambda: fired.append("a"), "a")
+    executor.create_timer(0.25, lambda: fired.append("b"), "b")
+    executor.spin_once()
+    executor.cancel_timer(a)
+    while clock.now < 100.5:
+        executor.spin_once()
+    assert fired == ["a", "b", "b"]
+    assert list(executor.stats()) == ["b"]
+    # the cancelled entry left the heap lazily
+    assert all(not entry[2].cancelled for entry in executor._heap)
+
+
+def test_deadlines_do_not_drift(clock):
+    executor = TimerExecutor(sleep_mode="sleep")
+    fired = []
+    def step():
+        fired.append(round(clock.now - 100, 6))
+        clock.now += 0.03  # the callback takes time
+    t = executor.create_timer(0.1, step)
+    for _ in range(5):
+        executor.spin_once()
+    assert fired == [0.1, 0.2, 0.3, 0.4, 0.5]
+    assert t.stats()["overruns"] == 0 and t.stats()["lateness_max"] == pytest.approx(0)
+
+
+def test_overrun_skips_missed_ticks(clock):
+    executor = TimerExecutor(sleep_mode="sleep")
+    fired = []
+    def step():
+        fired.append(round(clock.now - 100, 6))
+        if len(fired) == 2:
+            clock.now += 0.25
+    t = executor.create_timer(0.1, step)
+    while len(fired) < 4:
+        executor.spin_once()
+    # the tick of 0.3 fires late, 0.4 is skipped instead of fired in a burst, then back on the grid
+    assert fired == [0.1, 0.2, 0.45, 0.5]
+    stats = t.stats()
+    assert stats["overruns"] == 1 and stats["missed"] == 1 and stats["count"] == 4
+
+
+def test_rate(clock):
+    r = Rate(10, sleep_mode="sleep")
+    woke = []
+    for i in range(6):
+        r.sleep()
+        woke.append(round(clock.now - 100, 6))
+        clock.now += 0.25 if i == 3 else 0.02
+    # the first call returns immediately, then on the grid of the first call
+    assert woke == [0, 0.1, 0.2, 0.3, 0.55, 0.6]
+    stats = r.stats()
+    assert stats["overruns"] == 1 and stats["missed"] == 1
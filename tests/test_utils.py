@@ -0,0 +1,53 @@
+import time
+import pika
+from pika_topic._utils import iter_exchange_pages, fetch_all_exchanges, fetch_cluster_exchanges, delete_exchanges
+from pika_topic.testing import ManagementStub
+
+
+def test_pages():
+    exchanges = [{"name": "topic_{:02d}".format(i), "vhost": "/", "type": "fanout", "durable": True,
+                  "auto_delete": False, "internal": False, "user_who_performed_action": "guest"}
+                 for i in range(25)]
+    with ManagementStub(exchanges=exchanges) as stub:
+        pages = list(iter_exchange_pages(stub.host_port, "guest", "guest", "^topic_", page_size=10))
+        assert [len(p) for p in pages] == [10, 10, 5]
+        assert stub.requests == 3
+        names = [e["name"] for p in pages for e in p]
+        assert names == sorted(e["name"] for e in exchanges)
+        # the default amq.* exchanges come too without a pattern
+        everything = fetch_all_exchanges(stub.host_port, "guest", "guest", page_size=7)
+        assert set(names) < {e["name"] for e in everything}
+        assert len(everything) > 25
+
+
+def test_wrong_credentials_yield_nothing():
+    with ManagementStub() as stub:
+        assert fetch_all_exchanges(stub.host_port, "guest", "wrong") == []
+
+
+def test_cluster_exchanges_carry_node():
+    a = ManagementStub(exchanges=[{"name": "x", "vhost": "/", "user_who_performed_action": "guest"}])
+    b = ManagementStub(exchanges=[{"name": "y", "vhost": "/", "user_who_performed_action": "guest"}])
+    try:
+        ret = fetch_cluster_exchanges({"a": a.host_port, "b": b.host_port}, "guest", "guest", "^[xy]$")
+        assert sorted((e["name"], e["node"]) for e in ret) == [("x", "a"), ("y", "b")]
+    finally:
+        a.close()
+        b.close()
+
+
+def test_delete_exchanges_does_not_wait_per_batch(amqp_server):
+    connection = pika.BlockingConnection(amqp_server.parameters())
+    try:
+        progress = []
+        t0 = time.perf_counter()
+        deleted = delete_exchanges(connection, ("x{}".format(i) for i in range(500)), batch_size=50,
+                                   n_channels=2, progress=progress.append)
+        elapsed = time.perf_counter() - t0
+    finally:
+        connection.close()
+    assert deleted == 500 and progress[-1] == 500 and len(progress) == 10
+    names = [m.exchange for _, m in amqp_server.methods if isinstance(m, pika.spec.Exchange.Delete)]
+    assert sorted(names) == sorted("x{}".format(i) for i in range(500))
+    # the last replies used to wait out a time limit of 1 s
+    assert elapsed < 0.5
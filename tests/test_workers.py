@@ -0,0 +1,97 @@
+import time
+import threading
+import pika
+from pika_topic import Publisher, Subscriber, workers
+from pika_topic.sub import group_queue_name
+from pika_topic.testing import LocalBroker
+from pika_topic.workers import WorkerPool
+
+
+def spin_all(*subscribers, passes: int = 20):
+    for _ in range(passes):
+        for subscriber in subscribers:
+            subscriber.connection.process_data_events(0)
+
+
+def test_group_queue_is_quorum_with_delivery_limit():
+    broker = LocalBroker()
+    subscriber = Subscriber(broker.connection())
+    queue = subscriber.subscribe("t", callback=lambda m: None, group="g", max_redeliveries=5, queue_size=100)
+    assert queue == group_queue_name("t", "g")
+    declared = broker.queues[queue]
+    assert declared.quorum and declared.delivery_limit == 5 and declared.max_length == 100
+    assert declared.owner is None
+
+
+def test_competing_consumers_share_the_messages():
+    broker = LocalBroker()
+    received = {0: [], 1: []}
+    subscribers = []
+    for i in range(2):
+        subscriber = Subscriber(broker.connection(), prefetch_count=1)
+        subscriber.subscribe("t", callback=received[i].append, group="g")
+        subscribers.append(subscriber)
+    # another group and a plain subscriber get their own copy
+    other = []
+    subscribers.append(Subscriber(broker.connection()))
+    subscribers[-1].subscribe("t", callback=other.append, group="h")
+    plain = []
+    subscribers.append(Subscriber(broker.connection()))
+    subscribers[-1].subscribe("t", callback=plain.append)
+    publisher = Publisher("t", broker.connection())
+    for i in range(20):
+        publisher.publish(i)
+    spin_all(*subscribers)
+    assert received[0] and received[1]
+    assert sorted(received[0] + received[1]) == list(range(20))
+    assert other == list(range(20)) and plain == list(range(20))
+
+
+def test_dead_letter_after_max_redeliveries():
+    broker = LocalBroker()
+    deliveries = []
+    def fail(properties, body):
+        deliveries.append((properties.headers or {}).get("x-delivery-count", 0))
+        raise RuntimeError("failed task")
+    worker = Subscriber(broker.connection())
+    worker.subscribe("t", callback=fail, group="g", raw=True, max_redeliveries=2, dead_letter="t.dead")
+    dead = []
+    watcher = Subscriber(broker.connection())
+    watcher.subscribe("t.dead", callback=dead.append)
+    Publisher("t", broker.connection()).publish("task")
+    spin_all(worker, watcher)
+    # the first delivery and 2 redeliveries, then dead-lettered
+    assert deliveries == [0, 1, 2]
+    assert dead == ["task"]
+    assert not broker.queues[group_queue_name("t", "g")].messages
+
+
+class Done(KeyboardInterrupt):
+    pass
+
+
+def test_worker_main_subscribes_with_the_pool_options(monkeypatch):
+    broker = LocalBroker()
+    monkeypatch.setattr(workers.pika, "BlockingConnection", lambda parameters: broker.connection())
+    received = []
+    def callback(message):
+        if message == "stop":
+            # ends spin(), like Ctrl+C
+            raise Done()
+        received.append(message)
+    pool = WorkerPool(callback, "t", "g", n_workers=1, max_redeliveries=7, dead_letter="t.dead")
+    thread = threading.Thread(target=workers._worker_main, daemon=True,
+                              args=(pool.callback, pool.topic, pool.group, pool.parameters, dict(pool.options)))
+    thread.start()
+    queue = group_queue_name("t", "g")
+    deadline = time.monotonic() + 5
+    while queue not in broker.queues and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert broker.queues[queue].delivery_limit == 7
+    assert broker.queues[queue].dead_letter_exchange == "t.dead"
+    publisher = Publisher("t", broker.connection())
+    for message in [1, 2, "stop"]:
+        publisher.publish(message)
+    thread.join(5)
+    assert not thread.is_alive()
+    assert received == [1, 2]